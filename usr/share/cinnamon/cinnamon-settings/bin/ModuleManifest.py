@@ -0,0 +1,260 @@
+#!/usr/bin/python3
+
+# Manifest of the python settings modules (modules/cs_*.py).
+#
+# The overview only needs the name, category, label, icon and keywords of each module to build
+# the sidebar and its search. They are read from the module sources without importing them, so
+# the modules (and everything they import) are only loaded when their page is opened.
+#
+# The manifest is generated at build time with:
+#   python3 bin/ModuleManifest.py [modules directory]
+# An entry is used only if the module source still has the same size and checksum, stale or
+# missing entries are read again from the source when cinnamon-settings starts.
+#
+# Regenerate the manifest whenever a module changes. The packaging build should run
+#   python3 bin/ModuleManifest.py --check [modules directory]
+# which exits non-zero if the shipped manifest no longer matches the module sources.
+#
+# To check that the overview stays cheap to build, compare it with importing every module:
+#   python3 bin/ModuleManifest.py --benchmark [modules directory]
+
+import ast
+import glob
+import json
+import os
+import sys
+import time
+import zlib
+
+MANIFEST_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+
+TYPELIB_DIRS = ["/usr/lib/girepository-1.0", "/usr/lib64/girepository-1.0", "/usr/lib/*/girepository-1.0"]
+
+def get_stamp(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    return [len(data), zlib.crc32(data)]
+
+def _find_class(tree, name):
+    for node in tree.body:
+        if isinstance(node, ast.ClassDef) and node.name == name:
+            return node
+    return None
+
+def _find_method(cls, name):
+    for node in cls.body:
+        if isinstance(node, ast.FunctionDef) and node.name == name:
+            return node
+    return None
+
+def _target_name(target):
+    if isinstance(target, ast.Name):
+        return target.id
+    if isinstance(target, ast.Attribute) and isinstance(target.value, ast.Name) and target.value.id == "self":
+        return "self." + target.attr
+    return None
+
+def _resolve(node, assignments):
+    """ returns (text, translated) for a string literal, _("literal") or a variable assigned one of them"""
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return node.value, False
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == "_" \
+            and len(node.args) == 1 and isinstance(node.args[0], ast.Constant) and isinstance(node.args[0].value, str):
+        return node.args[0].value, True
+    name = _target_name(node)
+    if name is not None and name in assignments:
+        return _resolve(assignments[name], {})
+    return None
+
+def _get_assignments(function):
+    assignments = {}
+    for node in ast.walk(function):
+        if isinstance(node, ast.Assign) and len(node.targets) == 1:
+            name = _target_name(node.targets[0])
+            if name is not None:
+                assignments[name] = node.value
+    return assignments
+
+def _get_sidepage_args(tree, function, skip_self=False):
+    """ returns the label, icon and keywords arguments of the SidePage created in function"""
+    sidepage_classes = {}
+    for node in tree.body:
+        if isinstance(node, ast.ClassDef) and any(isinstance(base, ast.Name) and base.id == "SidePage" for base in node.bases):
+            sidepage_classes[node.name] = node
+
+    for node in ast.walk(function):
+        if not isinstance(node, ast.Call):
+            continue
+        func = node.func
+        if isinstance(func, ast.Name) and func.id == "SidePage":
+            return node.args[:3], _get_assignments(function)
+        if isinstance(func, ast.Name) and func.id in sidepage_classes:
+            init = _find_method(sidepage_classes[func.id], "__init__")
+            if init is not None:
+                return _get_sidepage_args(tree, init, skip_self=True)
+        # super(...).__init__(...) or SidePage.__init__(self, ...) in a SidePage subclass
+        if skip_self and isinstance(func, ast.Attribute) and func.attr == "__init__":
+            args = node.args
+            if isinstance(func.value, ast.Name) and func.value.id == "SidePage":
+                args = args[1:]
+            return args[:3], _get_assignments(function)
+    return None, None
+
+def _get_typelib_check(function):
+    for node in ast.walk(function):
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == "require_version" \
+                and len(node.args) == 2 and all(isinstance(arg, ast.Constant) for arg in node.args):
+            return [node.args[0].value, node.args[1].value]
+    return None
+
+def read_module(path):
+    """ returns the manifest entry of the settings module at path, or None if it can't be read without importing it"""
+    try:
+        with open(path, "rb") as f:
+            tree = ast.parse(f.read(), path)
+    except (OSError, SyntaxError, ValueError) as e:
+        print("ModuleManifest: failed to parse %s: %s" % (path, e), file=sys.stderr)
+        return None
+
+    cls = _find_class(tree, "Module")
+    if cls is None:
+        return None
+    entry = {"module": os.path.splitext(os.path.basename(path))[0]}
+    for node in cls.body:
+        if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name) \
+                and node.targets[0].id in ("name", "category") \
+                and isinstance(node.value, ast.Constant) and isinstance(node.value.value, str):
+            entry[node.targets[0].id] = node.value.value
+    if "name" not in entry or "category" not in entry:
+        return None
+
+    init = _find_method(cls, "__init__")
+    if init is None:
+        return None
+    args, assignments = _get_sidepage_args(tree, init)
+    if args is None or len(args) < 3:
+        return None
+    entry["translate"] = []
+    for key, arg in zip(("label", "icon", "keywords"), args):
+        value = _resolve(arg, assignments)
+        if value is None:
+            return None
+        entry[key] = value[0]
+        if value[1]:
+            entry["translate"].append(key)
+
+    # modules that check for an optional library are listed only if its typelib is installed
+    load_check = _find_method(cls, "_loadCheck")
+    if load_check is not None:
+        typelib = _get_typelib_check(load_check)
+        if typelib is None:
+            return None
+        entry["typelib"] = typelib
+
+    return entry
+
+def generate(modules_dir):
+    modules = {}
+    for path in sorted(glob.glob(os.path.join(modules_dir, "cs_*.py"))):
+        entry = read_module(path)
+        if entry is None:
+            print("ModuleManifest: %s will be imported at startup" % os.path.basename(path), file=sys.stderr)
+            continue
+        entry["stamp"] = get_stamp(path)
+        modules[entry["module"]] = entry
+    return {"version": MANIFEST_VERSION, "modules": modules}
+
+def load(modules_dir):
+    """ returns (entries, eager): manifest entries of the available modules and the names of the
+        modules that have to be imported to know what they show"""
+    try:
+        with open(os.path.join(modules_dir, MANIFEST_FILE), "r") as f:
+            manifest = json.load(f)
+        if manifest.get("version") != MANIFEST_VERSION:
+            manifest = {}
+    except (OSError, ValueError) as e:
+        print("ModuleManifest: %s" % e, file=sys.stderr)
+        manifest = {}
+    known = manifest.get("modules", {})
+
+    entries = []
+    eager = []
+    for path in sorted(glob.glob(os.path.join(modules_dir, "cs_*.py"))):
+        name = os.path.splitext(os.path.basename(path))[0]
+        entry = known.get(name)
+        try:
+            if entry is None or entry.get("stamp") != get_stamp(path):
+                entry = read_module(path)
+        except OSError:
+            continue
+        if entry is None:
+            eager.append(name)
+        elif is_available(entry):
+            entries.append(entry)
+    return entries, eager
+
+def is_available(entry):
+    typelib = entry.get("typelib")
+    if typelib is None:
+        return True
+    filename = "%s-%s.typelib" % (typelib[0], typelib[1])
+    dirs = os.environ.get("GI_TYPELIB_PATH", "").split(":") + TYPELIB_DIRS
+    for pattern in dirs:
+        if pattern and glob.glob(os.path.join(pattern, filename)):
+            return True
+    return False
+
+def benchmark(modules_dir):
+    start = time.time()
+    entries, eager = load(modules_dir)
+    print("manifest: %d modules listed, %d to import: %.4fs" % (len(entries), len(eager), time.time() - start))
+
+    start = time.time()
+    modules = generate(modules_dir)["modules"]
+    print("without manifest: %d modules parsed: %.4fs" % (len(modules), time.time() - start))
+
+    # what the overview did before the manifest: import every module to read its side page
+    sys.path.insert(0, os.path.abspath(modules_dir))
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    before = set(sys.modules)
+    start = time.time()
+    imported = 0
+    for path in sorted(glob.glob(os.path.join(modules_dir, "cs_*.py"))):
+        try:
+            __import__(os.path.splitext(os.path.basename(path))[0])
+            imported += 1
+        except Exception as e:
+            print("ModuleManifest: failed to import %s: %s" % (os.path.basename(path), e), file=sys.stderr)
+    print("eager import: %d modules, %d python modules loaded in total: %.4fs"
+          % (imported, len(set(sys.modules) - before), time.time() - start))
+
+def check(modules_dir):
+    """ returns the names of the modules whose manifest entry differs from their source"""
+    try:
+        with open(os.path.join(modules_dir, MANIFEST_FILE), "r") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        print("ModuleManifest: %s" % e, file=sys.stderr)
+        manifest = {}
+    generated = generate(modules_dir)
+    if manifest.get("version") != generated["version"]:
+        return sorted(generated["modules"])
+    known = manifest.get("modules", {})
+    names = set(known) | set(generated["modules"])
+    return sorted(name for name in names if known.get(name) != generated["modules"].get(name))
+
+if __name__ == "__main__":
+    args = [arg for arg in sys.argv[1:] if arg not in ("--benchmark", "--check")]
+    modules_dir = args[0] if args else os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "modules")
+    if "--benchmark" in sys.argv[1:]:
+        benchmark(modules_dir)
+        sys.exit(0)
+    if "--check" in sys.argv[1:]:
+        stale = check(modules_dir)
+        for name in stale:
+            print("ModuleManifest: %s is out of date, run python3 bin/ModuleManifest.py" % name, file=sys.stderr)
+        sys.exit(1 if stale else 0)
+    with open(os.path.join(modules_dir, MANIFEST_FILE), "w") as f:
+        json.dump(generate(modules_dir), f, indent=1, ensure_ascii=False, sort_keys=True)
+        f.write("\n")
@@ -0,0 +1,101 @@
+#!/usr/bin/python3
+
+# Token index of the sidebar search.
+#
+# The names and keywords of the pages are normalized (lowercase, without accents) and split into
+# words once, when the overview is built. A search looks up each typed word as a prefix in the
+# sorted token list, so typing doesn't normalize every page again on every keystroke.
+
+import bisect
+import re
+import unicodedata
+
+NAME_WEIGHT = 3
+KEYWORD_WEIGHT = 1
+# a word typed in full counts twice as much as a prefix of it
+EXACT_FACTOR = 2
+# the search text is the beginning of the page name
+NAME_PREFIX_BONUS = 10
+# no page matches the typed words as prefixes, but contains the search text
+SUBSTRING_SCORE = 1
+
+def normalize(text):
+    text = unicodedata.normalize('NFKD', text.lower())
+    return ''.join([c for c in text if not unicodedata.combining(c)])
+
+def tokenize(text):
+    return re.findall(r"\w+", normalize(text))
+
+class SearchIndex(object):
+    def __init__(self):
+        self.items = []  # [item, normalized names, normalized names and keywords] or None once removed
+        self.tokens = []  # sorted (token, item index, weight)
+        self.keys = []  # the tokens alone, for bisect
+        self.pending = []
+
+    def add(self, item, names, keywords):
+        """ indexes item under the given names and keywords (both translated and untranslated)"""
+        index = len(self.items)
+        names = [normalize(name) for name in names if name]
+        keywords = [normalize(keyword) for keyword in keywords if keyword]
+        for weight, texts in ((NAME_WEIGHT, names), (KEYWORD_WEIGHT, keywords)):
+            for text in texts:
+                for token in re.findall(r"\w+", text):
+                    self.pending.append((token, index, weight))
+        self.items.append([item, names, "\n".join(names + keywords)])
+
+    def remove(self, item):
+        for index, entry in enumerate(self.items):
+            if entry is not None and entry[0] is item:
+                self.items[index] = None
+
+    def _build(self):
+        if self.pending:
+            self.tokens = sorted(self.tokens + self.pending)
+            self.keys = [token[0] for token in self.tokens]
+            self.pending = []
+
+    def _lookup(self, word):
+        """ returns {item index: score} of the items with a token starting with word"""
+        scores = {}
+        position = bisect.bisect_left(self.keys, word)
+        while position < len(self.tokens) and self.keys[position].startswith(word):
+            token, index, weight = self.tokens[position]
+            score = weight * EXACT_FACTOR if token == word else weight
+            if score > scores.get(index, 0):
+                scores[index] = score
+            position += 1
+        return scores
+
+    def search(self, text):
+        """ returns {item: score} of the items matching all the words of text, or None if there is no word to search"""
+        words = tokenize(text)
+        if not words:
+            return None
+        self._build()
+
+        scores = None
+        for word in words:
+            found = self._lookup(word)
+            if scores is None:
+                scores = found
+            else:
+                scores = {index: scores[index] + score for index, score in found.items() if index in scores}
+            if not scores:
+                break
+
+        query = normalize(text).strip()
+        results = {}
+        for index, score in scores.items():
+            entry = self.items[index]
+            if entry is None:
+                continue
+            if any(name.startswith(query) for name in entry[1]):
+                score += NAME_PREFIX_BONUS
+            results[entry[0]] = score
+
+        if not results:
+            for entry in self.items:
+                if entry is not None and query in entry[2]:
+                    results[entry[0]] = SUBSTRING_SCORE
+        return results
@@ -10,9 +10,9 @@ try:
     import html
     import subprocess
     import threading
-    from PIL import Image
     import datetime
     import time
+    from SpicesIndex import SpicesIndex
 except Exception as detail:
     print(detail)
     sys.exit(1)
@@ -39,9 +39,139 @@ ABORT_NONE = 0
 ABORT_ERROR = 1
 ABORT_USER = 2
 
+# parallel thumbnail downloads, also the size of the keep-alive connection pool
+DOWNLOAD_THREADS = 10
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+# download progress is sent to the UI at most this many times per second
+PROGRESS_FPS = 30
+# ETag and Last-Modified of the files in the spices cache folder
+VALIDATORS_FILE = "validators.json"
+# parsed metadata.json files and thumbnail checks, see SpicesIndex
+INDEX_FILE = "metadata-index.json"
+
 def ui_thread_do(callback, *args):
     GLib.idle_add (callback, *args, priority=GLib.PRIORITY_DEFAULT)
 
+_session = None
+_session_lock = threading.Lock()
+
+def get_session():
+    """ returns the requests session shared by all downloads, so connections to the server are reused"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            import requests
+            _session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=2, pool_maxsize=DOWNLOAD_THREADS)
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+        return _session
+
+class DownloadValidators(object):
+    """ cache validators of downloaded files, a refresh asks the server only for the files that changed"""
+    def __init__(self, folder):
+        self.folder = folder
+        self.path = os.path.join(folder, VALIDATORS_FILE)
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.changed = False
+        try:
+            with open(self.path, 'r') as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    def get_headers(self, url, out_file):
+        # the validators are useless once the file is gone
+        if not os.path.isfile(out_file):
+            return {}
+        with self.lock:
+            entry = self.entries.get(url)
+        if entry is None or entry['file'] != os.path.basename(out_file):
+            return {}
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last-modified'):
+            headers['If-Modified-Since'] = entry['last-modified']
+        return headers
+
+    def update(self, url, out_file, response):
+        entry = None
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if etag or last_modified:
+            entry = {'file': os.path.basename(out_file), 'etag': etag, 'last-modified': last_modified}
+        with self.lock:
+            if entry is None:
+                if self.entries.pop(url, None) is not None:
+                    self.changed = True
+            elif self.entries.get(url) != entry:
+                self.entries[url] = entry
+                self.changed = True
+
+    def save(self, used_files=None):
+        with self.lock:
+            if used_files is not None:
+                for url, entry in list(self.entries.items()):
+                    if entry['file'] not in used_files:
+                        del self.entries[url]
+                        self.changed = True
+            if not self.changed:
+                return
+            try:
+                with open(self.path + '.tmp', 'w') as f:
+                    json.dump(self.entries, f)
+                os.replace(self.path + '.tmp', self.path)
+                self.changed = False
+            except OSError as e:
+                print(e)
+
+def url_retrieve(url, out_file, reporthook=None, is_aborted=None, validators=None, proxies=None):
+    """ downloads url to out_file, returns False if the server reported that out_file is up to date.
+        The file is replaced only when the download completes, KeyboardInterrupt is raised on abort."""
+    headers = {'Cache-Control': 'no-cache'}
+    if validators is not None:
+        headers.update(validators.get_headers(url, out_file))
+
+    response = get_session().get(url, headers=headers, proxies=proxies, stream=True, timeout=15)
+    with response:
+        if response.status_code == 304:
+            # reading the empty body returns the connection to the pool instead of closing it
+            response.content
+            return False
+        assert response.ok
+
+        totalSize = int(response.headers.get('content-length') or 0)
+        received = 0
+        interval = 1.0 / PROGRESS_FPS
+        last_report = 0
+        part_file = out_file + '.part'
+        try:
+            with open(part_file, 'wb') as outfd:
+                for data in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    if is_aborted is not None and is_aborted():
+                        raise KeyboardInterrupt()
+                    outfd.write(data)
+                    received += len(data)
+                    now = time.monotonic()
+                    if reporthook is not None and now - last_report >= interval:
+                        last_report = now
+                        ui_thread_do(reporthook, received, totalSize)
+            os.replace(part_file, out_file)
+        except BaseException:
+            try:
+                os.remove(part_file)
+            except OSError:
+                pass
+            raise
+
+    if reporthook is not None:
+        ui_thread_do(reporthook, received, totalSize)
+    if validators is not None:
+        validators.update(url, out_file, response)
+    return True
+
 def removeEmptyFolders(path):
     if not os.path.isdir(path):
         return
@@ -136,7 +266,7 @@ class Spice_Harvester(GObject.Object):
         self.themes = collection_type == 'theme'
         self.index_cache = {}
         self.meta_map = {}
-        self.download_manager = ThreadedTaskManager(10)
+        self.download_manager = ThreadedTaskManager(DOWNLOAD_THREADS)
         self._proxy = None
         self._proxy_deferred_actions = []
         self._proxy_signals = []
@@ -151,6 +281,9 @@ class Spice_Harvester(GObject.Object):
         self.download_total_files = 0
         self.download_current_file = 0
         self.cache_folder = os.path.join(GLib.get_user_cache_dir(), 'cinnamon', 'spices', self.collection_type)
+        self.validators = DownloadValidators(self.cache_folder)
+        self.index = SpicesIndex(os.path.join(self.cache_folder, INDEX_FILE))
+        self.used_thumbs = set()
 
         if self.themes:
             self.settings = Gio.Settings.new('org.cinnamon.theme')
@@ -294,15 +427,17 @@ class Spice_Harvester(GObject.Object):
             progressbar.revealer.set_reveal_child(visible)
 
     # updates any progress bars with the download progress
-    def _update_progress(self, count, blockSize, totalSize):
+    def _update_progress(self, received, totalSize):
         if self.download_manager.busy() and self.download_total_files > 1:
             total = self.download_total_files
             current = total - self.download_manager.get_n_jobs()
             fraction = float(current) / float(total)
             text = "%s %i/%i" % (_("Downloading images:"), current, total)
             self._set_progressbar_text(text)
+        elif totalSize > 0:
+            fraction = min(1.0, received / float(totalSize))
         else:
-            fraction = count * blockSize / float((totalSize / blockSize + 1) * blockSize)
+            return
 
         self._set_progressbar_fraction(fraction)
 
@@ -358,19 +493,11 @@ class Spice_Harvester(GObject.Object):
                     print(e)
             self._directory_changed()
 
-    def _download(self, out_file, url, binary=True):
-        timestamp = round(time.time())
-        url = "%s?time=%d" % (url, timestamp)
+    def _download(self, out_file, url):
         print("Downloading from %s" % url)
         try:
-            open_args = 'wb' if binary else 'w'
-            with open(out_file, open_args) as outfd:
-                self._url_retrieve(url, outfd, self._update_progress, binary)
-        except Exception as e:
-            try:
-                os.remove(out_file)
-            except OSError:
-                pass
+            self._url_retrieve(url, out_file, self._update_progress)
+        except (Exception, KeyboardInterrupt) as e:
             if not isinstance(e, KeyboardInterrupt) and not self.download_manager.abort_status:
                 self.errorMessage(_("An error occurred while trying to access the server. Please try again in a little while."), e)
             self.abort()
@@ -378,36 +505,20 @@ class Spice_Harvester(GObject.Object):
 
         return out_file
 
-    def _url_retrieve(self, url, outfd, reporthook, binary):
-        #Like the one in urllib. Unlike urllib.retrieve url_retrieve
-        #can be interrupted. KeyboardInterrupt exception is raised when
-        #interrupted.
+    def _url_retrieve(self, url, out_file, reporthook):
+        #Unlike urllib.retrieve url_retrieve can be interrupted.
+        #KeyboardInterrupt exception is raised when interrupted.
         import proxygsettings
-        import requests
 
-        count = 0
-        blockSize = 1024 * 8
         proxy_info = proxygsettings.get_proxy_settings()
-
-        try:
-            response = requests.get(url, proxies=proxy_info, stream=True, timeout=15)
-            assert response.ok
-
-            totalSize = int(response.headers.get('content-length'))
-
-            for data in response.iter_content(chunk_size=blockSize):
-                count += 1
-                if self._is_aborted():
-                    break
-                if not binary:
-                    data = data.decode("utf-8")
-                outfd.write(data)
-                ui_thread_do(reporthook, count, blockSize, totalSize)
-        except Exception as e:
-            raise e
+        # the spice archives go to a temporary file, they are always downloaded
+        validators = self.validators if os.path.dirname(out_file) == self.cache_folder else None
+        if not url_retrieve(url, out_file, reporthook, self._is_aborted, validators, proxy_info):
+            print("Not modified: %s" % url)
 
     def _load_metadata(self):
         self.meta_map = {}
+        metadata_files = set()
 
         for directory in self.spices_directories:
             if os.path.exists(directory):
@@ -415,9 +526,10 @@ class Spice_Harvester(GObject.Object):
 
                 for uuid in extensions:
                     subdirectory = os.path.join(directory, uuid)
+                    metadata_file = os.path.join(subdirectory, 'metadata.json')
+                    metadata_files.add(metadata_file)
                     try:
-                        json_data = open(os.path.join(subdirectory, 'metadata.json')).read()
-                        metadata = json.loads(json_data)
+                        metadata = self.index.get_metadata(metadata_file)
                         metadata['path'] = subdirectory
                         metadata['writable'] = os.access(subdirectory, os.W_OK)
                         self.meta_map[uuid] = metadata
@@ -431,6 +543,9 @@ class Spice_Harvester(GObject.Object):
             else:
                 print("%s does not exist! Skipping" % directory)
 
+        self.index.retain(metadata=metadata_files)
+        self.index.save()
+
     def _directory_changed(self, *args):
         self._load_metadata()
         self._generate_update_list()
@@ -526,7 +641,7 @@ class Spice_Harvester(GObject.Object):
         download_url = URL_MAP[self.collection_type]
 
         filename = os.path.join(self.cache_folder, "index.json")
-        if self._download(filename, download_url, binary=False) is None:
+        if self._download(filename, download_url) is None:
             return
 
         self._load_cache()
@@ -535,7 +650,7 @@ class Spice_Harvester(GObject.Object):
     def _download_image_cache(self):
         self.is_downloading_image_cache = True
 
-        self.used_thumbs = []
+        self.used_thumbs = set()
 
         self.download_total_files = 0
         self.download_current_file = 0
@@ -547,7 +662,7 @@ class Spice_Harvester(GObject.Object):
             else:
                 icon_basename = os.path.basename(self.index_cache[uuid]['icon'])
                 download_url = URL_SPICES_HOME + self.index_cache[uuid]['icon']
-            self.used_thumbs.append(icon_basename)
+            self.used_thumbs.add(icon_basename)
 
             icon_path = os.path.join(self.cache_folder, icon_basename)
 
@@ -567,7 +682,7 @@ class Spice_Harvester(GObject.Object):
         trash = []
         flist = os.listdir(self.cache_folder)
         for f in flist:
-            if f not in self.used_thumbs and f != "index.json":
+            if f not in self.used_thumbs and f not in ("index.json", VALIDATORS_FILE, INDEX_FILE):
                 trash.append(f)
         for t in trash:
             try:
@@ -575,6 +690,10 @@ class Spice_Harvester(GObject.Object):
             except:
                 pass
 
+        self.validators.save(self.used_thumbs | {"index.json"})
+        self.index.retain(thumbs={os.path.join(self.cache_folder, t) for t in self.used_thumbs})
+        self.index.save()
+
         self.download_total_files = 0
         self.download_current_file = 0
         self.is_downloading_image_cache = False
@@ -582,13 +701,8 @@ class Spice_Harvester(GObject.Object):
         self.emit('cache-loaded')
 
     # checks for corrupt images in the cache, so we can redownload them the next time we refresh
-    @staticmethod
-    def _is_bad_image(path):
-        try:
-            Image.open(path)
-        except IOError:
-            return True
-        return False
+    def _is_bad_image(self, path):
+        return self.index.is_bad_image(path)
 
     # make sure the thumbnail fits the correct format (we are expecting it to be <uuid>.png
     @staticmethod
@@ -808,3 +922,96 @@ class Spice_Harvester(GObject.Object):
         except Exception as e:
             print("There was an error processing one of the images. Try refreshing the cache.")
             return Gtk.Image.new_from_icon_name('image-missing', 2)
+
+def check_downloads():
+    """ serves files with ETag and Last-Modified from a local http.server and checks that
+        url_retrieve downloads them once, revalidates them with 304 and leaves no .part file on abort"""
+    import hashlib
+    from email.utils import formatdate
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    files = {'/applets.json': b'{"applet@check": {}}' * 100, '/thumb.png': os.urandom(4 * DOWNLOAD_CHUNK_SIZE)}
+    statuses = []
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            data = files.get(self.path)
+            if data is None:
+                self.send_response(404)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                statuses.append(404)
+                return
+            etag = '"%s"' % hashlib.md5(data).hexdigest()
+            if self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                statuses.append(304)
+                return
+            self.send_response(200)
+            self.send_header('ETag', etag)
+            self.send_header('Last-Modified', formatdate(1700000000, usegmt=True))
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            try:
+                self.wfile.write(data)
+            except OSError:
+                # the client closed an aborted download
+                pass
+            statuses.append(200)
+
+        def log_message(self, *args):
+            pass
+
+    os.environ['no_proxy'] = '127.0.0.1'
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    # aborted downloads reset their connection, that is expected here
+    server.handle_error = lambda request, client_address: None
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = 'http://127.0.0.1:%d' % server.server_address[1]
+    folder = tempfile.mkdtemp()
+    try:
+        validators = DownloadValidators(folder)
+        for path in files:
+            out_file = os.path.join(folder, os.path.basename(path))
+
+            del statuses[:]
+            assert url_retrieve(base_url + path, out_file, validators=validators)
+            assert statuses == [200], statuses
+            with open(out_file, 'rb') as f:
+                assert f.read() == files[path]
+            stat = os.stat(out_file)
+
+            del statuses[:]
+            assert not url_retrieve(base_url + path, out_file, validators=validators)
+            assert statuses == [304], statuses
+            after = os.stat(out_file)
+            assert (after.st_ino, after.st_mtime_ns, after.st_size) == (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+        # an aborted download keeps the previous file and leaves no .part behind
+        out_file = os.path.join(folder, 'thumb.png')
+        old_data = files['/thumb.png']
+        files['/thumb.png'] = os.urandom(4 * DOWNLOAD_CHUNK_SIZE)
+        try:
+            url_retrieve(base_url + '/thumb.png', out_file, is_aborted=lambda: True, validators=validators)
+            raise AssertionError("the aborted download returned")
+        except KeyboardInterrupt:
+            pass
+        assert not os.path.exists(out_file + '.part')
+        with open(out_file, 'rb') as f:
+            assert f.read() == old_data
+
+        validators.save()
+        assert os.path.isfile(os.path.join(folder, VALIDATORS_FILE))
+        print("url_retrieve: 200, 304 and abort checks passed")
+    finally:
+        server.shutdown()
+        server.server_close()
+        shutil.rmtree(folder)
+
+if __name__ == "__main__":
+    check_downloads()
@@ -0,0 +1,186 @@
+#!/usr/bin/python3
+
+import os
+import sys
+import threading
+import time
+from PIL import Image
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+INDEX_VERSION = 1
+
+def get_stamp(path):
+    """ returns [mtime_ns, size] of path or None if it can't be read"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+class SpicesIndex(object):
+    """ Parsed metadata.json files and thumbnail checks of the spices, kept on disk.
+        Entries are keyed by path and valid as long as the file has the same mtime and size,
+        so a refresh only reads the files that changed since the last one."""
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.metadata = {}
+        self.thumbs = {}
+        self.changed = False
+
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+            if data.get('version') == INDEX_VERSION:
+                self.metadata = data['metadata']
+                self.thumbs = data['thumbs']
+        except (OSError, ValueError, KeyError, AttributeError):
+            pass
+
+    def get_metadata(self, path):
+        """ returns a copy of the parsed metadata.json at path, raises if it can't be read or parsed"""
+        stamp = get_stamp(path)
+        with self.lock:
+            entry = self.metadata.get(path)
+        if stamp is not None and entry is not None and entry[0] == stamp:
+            return dict(entry[1])
+
+        with open(path, 'r') as f:
+            metadata = json.load(f)
+        with self.lock:
+            self.metadata[path] = [stamp, metadata]
+            self.changed = True
+        return dict(metadata)
+
+    def is_bad_image(self, path):
+        """ returns True if the image at path is missing or can't be opened"""
+        stamp = get_stamp(path)
+        if stamp is None:
+            return True
+        with self.lock:
+            entry = self.thumbs.get(path)
+        if entry is not None and entry[0] == stamp:
+            return entry[1]
+
+        try:
+            with Image.open(path):
+                bad = False
+        except IOError:
+            bad = True
+        with self.lock:
+            self.thumbs[path] = [stamp, bad]
+            self.changed = True
+        return bad
+
+    def retain(self, metadata=None, thumbs=None):
+        """ drops the entries of the files that are not in the given sets of paths"""
+        with self.lock:
+            for entries, paths in ((self.metadata, metadata), (self.thumbs, thumbs)):
+                if paths is None:
+                    continue
+                for path in set(entries) - paths:
+                    del entries[path]
+                    self.changed = True
+
+    def save(self):
+        with self.lock:
+            if not self.changed:
+                return
+            data = {'version': INDEX_VERSION, 'metadata': self.metadata, 'thumbs': self.thumbs}
+            try:
+                os.makedirs(os.path.dirname(self.path), mode=0o755, exist_ok=True)
+                with open(self.path + '.tmp', 'w') as f:
+                    json.dump(data, f)
+                os.replace(self.path + '.tmp', self.path)
+                self.changed = False
+            except OSError as e:
+                print(e)
+
+def benchmark(count=500):
+    import random
+    import shutil
+    import tempfile
+
+    random.seed(0)
+    folder = tempfile.mkdtemp()
+    spices = os.path.join(folder, 'applets')
+    thumbs = os.path.join(folder, 'cache')
+    os.makedirs(thumbs)
+    try:
+        for i in range(count):
+            uuid = 'spice%d@bench' % i
+            os.makedirs(os.path.join(spices, uuid))
+            with open(os.path.join(spices, uuid, 'metadata.json'), 'w') as f:
+                json.dump({'uuid': uuid, 'name': 'Spice %d' % i, 'description': 'x' * 200,
+                           'last-edited': 1700000000 + i, 'version': '1.%d' % i}, f)
+            Image.effect_noise((256, 256), random.randint(10, 100)).save(os.path.join(thumbs, uuid + '.png'))
+
+        def drop_caches():
+            # a refresh after login mostly finds the files out of the page cache
+            for root, dirs, files in os.walk(folder):
+                for name in files:
+                    fd = os.open(os.path.join(root, name), os.O_RDONLY)
+                    try:
+                        os.fsync(fd)
+                        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+                    finally:
+                        os.close(fd)
+
+        def load(index):
+            meta_map = {}
+            for uuid in os.listdir(spices):
+                subdirectory = os.path.join(spices, uuid)
+                if index is None:
+                    with open(os.path.join(subdirectory, 'metadata.json')) as f:
+                        meta_map[uuid] = json.load(f)
+                else:
+                    meta_map[uuid] = index.get_metadata(os.path.join(subdirectory, 'metadata.json'))
+            for name in os.listdir(thumbs):
+                path = os.path.join(thumbs, name)
+                if index is None:
+                    try:
+                        with Image.open(path):
+                            pass
+                    except IOError:
+                        pass
+                else:
+                    index.is_bad_image(path)
+            return meta_map
+
+        drop_caches()
+        start = time.time()
+        load(None)
+        print("%d spices without index: %.4fs" % (count, time.time() - start))
+
+        index_path = os.path.join(thumbs, 'metadata-index.json')
+        drop_caches()
+        start = time.time()
+        index = SpicesIndex(index_path)
+        load(index)
+        index.save()
+        print("%d spices, first run with index: %.4fs" % (count, time.time() - start))
+
+        drop_caches()
+        start = time.time()
+        index = SpicesIndex(index_path)
+        load(index)
+        index.save()
+        print("%d spices, index loaded from disk: %.4fs" % (count, time.time() - start))
+
+        with open(os.path.join(spices, 'spice0@bench', 'metadata.json'), 'a') as f:
+            f.write(' ')
+        drop_caches()
+        start = time.time()
+        index = SpicesIndex(index_path)
+        load(index)
+        index.save()
+        print("%d spices, one changed: %.4fs" % (count, time.time() - start))
+    finally:
+        shutil.rmtree(folder)
+
+if __name__ == "__main__":
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 500)
@@ -0,0 +1,124 @@
+#!/usr/bin/python3
+
+import os
+import sys
+import time
+from PIL import Image
+
+# EXIF utility functions (source: http://stackoverflow.com/questions/4228530/pil-thumbnail-is-rotating-my-image)
+def flip_horizontal(im): return im.transpose(Image.FLIP_LEFT_RIGHT)
+def flip_vertical(im): return im.transpose(Image.FLIP_TOP_BOTTOM)
+def rotate_180(im): return im.transpose(Image.ROTATE_180)
+def rotate_90(im): return im.transpose(Image.ROTATE_90)
+def rotate_270(im): return im.transpose(Image.ROTATE_270)
+def transpose(im): return rotate_90(flip_horizontal(im))
+def transverse(im): return rotate_90(flip_vertical(im))
+orientation_funcs = [None,
+                     lambda x: x,
+                     flip_horizontal,
+                     rotate_180,
+                     flip_vertical,
+                     transpose,
+                     rotate_270,
+                     transverse,
+                     rotate_90
+                     ]
+def apply_orientation(im):
+    """
+    Extract the oritentation EXIF tag from the image, which should be a PIL Image instance,
+    and if there is an orientation tag that would rotate the image, apply that rotation to
+    the Image instance given to do an in-place rotation.
+
+    :param Image im: Image instance to inspect
+    :return: A possibly transposed image instance
+    """
+
+    try:
+        kOrientationEXIFTag = 0x0112
+        if hasattr(im, '_getexif'): # only present in JPEGs
+            e = im._getexif()       # returns None if no EXIF data
+            if e is not None:
+                #log.info('EXIF data found: %r', e)
+                orientation = e[kOrientationEXIFTag]
+                f = orientation_funcs[orientation]
+                return f(im)
+    except:
+        # We'd be here with an invalid orientation value or some random error?
+        pass # log.exception("Error applying EXIF Orientation tag")
+    return im
+
+def open_image(filename, size=None):
+    """ returns (image, width, height) of filename, rotated by its EXIF orientation.
+        width and height are the full size of the picture, the image itself is only
+        decoded at the scale needed for a thumbnail of size when the format allows it"""
+    img = Image.open(filename)
+    (width, height) = img.size
+    if size:
+        # let the JPEG decoder scale down by up to 1/8 instead of decoding every pixel
+        img.draft(None, (size, size))
+    (draft_width, draft_height) = img.size
+    img = apply_orientation(img)
+    if img.size != (draft_width, draft_height):
+        (width, height) = (height, width)
+    return img, width, height
+
+def make_thumbnail(img, size=None):
+    """ returns img as an RGB image fitting in size x size, transparency is flattened on white"""
+    if size and img.mode in ("RGB", "RGBA", "L"):
+        # the conversions below are cheaper on the thumbnail
+        img.thumbnail((size, size), Image.LANCZOS)
+    if img.mode != "RGB":
+        if img.mode == "RGBA":
+            bg_img = Image.new("RGBA", img.size, (255,255,255,255))
+            img = Image.alpha_composite(bg_img, img)
+        img = img.convert("RGB")
+    if size:
+        img.thumbnail((size, size), Image.LANCZOS)
+    return img
+
+def benchmark(count=12, size=100):
+    """ times thumbnails of generated 4K JPEGs with the old full decode and with draft first,
+        returns the two times in seconds"""
+    import random
+    import shutil
+    import tempfile
+
+    random.seed(0)
+    folder = tempfile.mkdtemp()
+    try:
+        for i in range(count):
+            # 4K photos, half of them need rotating like pictures from a phone
+            img = Image.effect_noise((3840, 2160), random.randint(10, 100)).convert("RGB")
+            exif = Image.Exif()
+            exif[0x0112] = 6 if i % 2 else 1
+            img.save(os.path.join(folder, 'background%d.jpg' % i), 'JPEG', quality=90, exif=exif)
+        files = sorted(os.path.join(folder, name) for name in os.listdir(folder))
+
+        def load_full(filename):
+            # the order used before: decode everything, rotate, convert, then scale down
+            img = apply_orientation(Image.open(filename))
+            if img.mode != "RGB":
+                img = img.convert("RGB")
+            img.thumbnail((size, size), Image.LANCZOS)
+            return img
+
+        def load_draft(filename):
+            return make_thumbnail(open_image(filename, size)[0], size)
+
+        times = []
+        for name, load in [("full decode", load_full), ("draft first", load_draft)]:
+            start = time.time()
+            for filename in files:
+                load(filename)
+            times.append(time.time() - start)
+            print("%d 4K JPEGs, %s: %.4fs" % (count, name, times[-1]))
+        return times
+    finally:
+        shutil.rmtree(folder)
+
+if __name__ == "__main__":
+    # exits non-zero if draft first decoding is not faster, so it can be run as a check
+    full_time, draft_time = benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 12)
+    if draft_time >= full_time:
+        print("ThumbnailLoader: draft first decoding is not faster than the full decode", file=sys.stderr)
+        sys.exit(1)
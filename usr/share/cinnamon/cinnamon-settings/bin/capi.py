@@ -24,8 +24,11 @@ from gi.repository import Gio, GObject
 
 class CManager:
     def __init__(self):
-        self.extension_point = Gio.io_extension_point_register ("cinnamon-control-center-1")
+        # The panels are loaded on first use, loading them all takes a while
+        # and the overview only needs to know whether there are any.
+        self.extension_point = None
         self.modules = []
+        self.paths = []
 
         architecture = platform.machine()
         # get the arch-specific triplet, e.g. 'x86_64-linux-gnu' or 'arm-linux-gnueabihf'
@@ -48,12 +51,23 @@ class CManager:
             if not os.path.islink(path):
                 path = os.path.join(path, "cinnamon-control-center-1/panels")
                 if os.path.exists(path):
-                    try:
-                        self.modules = self.modules + Gio.io_modules_load_all_in_directory(path)
-                    except Exception as e:
-                        print("capi failed to load multiarch modules from %s: " % path, e)
+                    self.paths.append(path)
+
+    def has_panels(self):
+        return len(self.paths) > 0
+
+    def load(self):
+        if self.extension_point is not None:
+            return
+        self.extension_point = Gio.io_extension_point_register ("cinnamon-control-center-1")
+        for path in self.paths:
+            try:
+                self.modules = self.modules + Gio.io_modules_load_all_in_directory(path)
+            except Exception as e:
+                print("capi failed to load multiarch modules from %s: " % path, e)
 
     def get_c_widget(self, mod_id):
+        self.load()
         extension = self.extension_point.get_extension_by_name(mod_id)
         if extension is None:
             print("Could not load %s module; is the cinnamon-control-center package installed?" % mod_id)
@@ -62,6 +76,7 @@ class CManager:
         return GObject.new(panel_type)
 
     def lookup_c_module(self, mod_id):
+        self.load()
         extension = self.extension_point.get_extension_by_name(mod_id)
         if extension is None:
             print("Could not find %s module; is the cinnamon-control-center package installed?" % mod_id)
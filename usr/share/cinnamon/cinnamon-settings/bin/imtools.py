@@ -95,15 +95,22 @@ def drop_shadow(image, horizontal_offset=5, vertical_offset=5,
         if mode != 'RGB':
             image = image.convert('RGB')
             mode = 'RGB'
-        #create cache id
-        id = ''.join([str(x) for x in ['shadow_', size,
-                                       horizontal_offset, vertical_offset, border, shadow_blur,
-                                       background_color, shadow_color]])
 
-        #look up in cache
-        if id in cache:
-            #retrieve from cache
-            back, back_size = cache[id]
+    #create cache id
+    id = ''.join([str(x) for x in ['shadow_', size,
+                                   horizontal_offset, vertical_offset, border, shadow_blur,
+                                   background_color, shadow_color]])
+    if mode == 'RGBA':
+        #the shadow of an RGBA image is cast by its alpha band
+        id = (id, get_alpha(image).tobytes())
+
+    #look up in cache
+    if id in cache:
+        #retrieve from cache
+        back, back_size = cache[id]
+        if mode == 'RGBA':
+            #the image is blended into the backdrop, keep the cached one clean
+            back = back.copy()
 
     if back is None:
         #size of backdrop
@@ -139,6 +146,7 @@ def drop_shadow(image, horizontal_offset=5, vertical_offset=5,
             back = Image.new('RGBA', back_size, shadow_color)
             back.putalpha(shadow)
             del shadow  # free up memory
+            cache[id] = back.copy(), back_size
         else:
             back = shadow
             cache[id] = back, back_size
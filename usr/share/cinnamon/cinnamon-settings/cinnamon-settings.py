@@ -13,19 +13,20 @@ import sys
 import time
 import traceback
 import typing
-import unicodedata
 import urllib.request as urllib
 
 import gi
 gi.require_version('Gtk', '3.0')
 gi.require_version('XApp', '1.0')
-from gi.repository import Gio, Gtk, Pango, Gdk, XApp
+from gi.repository import Gio, Gtk, Pango, Gdk, XApp, GLib
 
 import config
 sys.path.append(os.path.join(config.currentPath, "bin"))
 sys.path.append(os.path.join(config.currentPath, "modules"))
 from bin import capi
+from bin import ModuleManifest
 from bin import proxygsettings
+from bin import SearchIndex
 from bin import SettingsWidgets
 
 # i18n
@@ -42,6 +43,29 @@ class SidePageData(typing.NamedTuple):
     cat: str
 
 
+class LazySidePage:
+    """Stands in for a side page in the overview until it is opened or prefetched.
+
+    It only has what the sidebar and its search need, the loader imports the
+    module and returns its real side page (or None if it can't be shown).
+    """
+    def __init__(self, name, icon, keywords, loader, untranslated=(None, None)):
+        self.name = name
+        self.icon = icon
+        self.keywords = keywords
+        self.loader = loader
+        # name and keywords before translation, also matched by the search
+        self.untranslated = untranslated
+        self.sidePage = None
+        self.failed = False
+
+    def resolve(self):
+        if self.sidePage is None and not self.failed:
+            self.sidePage = self.loader()
+            self.failed = self.sidePage is None
+        return self.sidePage
+
+
 WIN_WIDTH = 800
 WIN_HEIGHT = 600
 WIN_H_PADDING = 20
@@ -141,6 +165,12 @@ ARG_REWRITE = {
 }
 
 
+# set CINNAMON_SETTINGS_TIMING=1 to print how long the overview takes to build and how many
+# settings modules were imported for it, then exit: non-zero if any cs_* module was imported,
+# so a module creeping back into startup fails the check. See also "python3 bin/ModuleManifest.py --benchmark"
+PRINT_OVERVIEW_TIMING = bool(os.environ.get("CINNAMON_SETTINGS_TIMING"))
+
+
 def print_timing(func):
     # decorate functions with @print_timing to output how long they take to run.
     def wrapper(*args, **kwargs):
@@ -158,11 +188,9 @@ class MainWindow(Gio.Application):
         selected_items = side_view.get_selected_items()
         if len(selected_items) > 0:
             self.deselect(cat)
-            filtered_path = side_view.get_model().convert_path_to_child_path(selected_items[0])
-            if filtered_path is not None:
-                iterator = self.store_by_cat[cat].get_iter(filtered_path)
-                sidePage = self.store_by_cat[cat].get_value(iterator, 2)
-                self.go_to_sidepage(sidePage, user_action=True)
+            model = side_view.get_model()
+            sidePage = model.get_value(model.get_iter(selected_items[0]), 2)
+            self.go_to_sidepage(sidePage, user_action=True)
 
     def _on_sidepage_hide_stack(self):
         self.stack_switcher.set_opacity(0)
@@ -171,6 +199,17 @@ class MainWindow(Gio.Application):
         self.stack_switcher.set_opacity(1)
 
     def go_to_sidepage(self, sidePage: SettingsWidgets.SidePage, user_action=True):
+        if isinstance(sidePage, LazySidePage):
+            lazy_page = sidePage
+            sidePage = lazy_page.resolve()
+            if sidePage is None:
+                # the module failed to load, don't leave a dead entry in the overview
+                for sp_data in self.sidePages:
+                    if sp_data.sp is lazy_page:
+                        self.remove_sidepage(sp_data)
+                        break
+                return
+
         sidePage.build()
         
         if sidePage.is_standalone:
@@ -260,6 +299,7 @@ class MainWindow(Gio.Application):
         self.window.add(main_box)
         self.top_bar = self.builder.get_object("top_bar")
         self.side_view = {}
+        self.shown_categories = []
         self.main_stack = self.builder.get_object("main_stack")
         self.main_stack.set_transition_type(Gtk.StackTransitionType.CROSSFADE)
         self.main_stack.set_transition_duration(150)
@@ -304,13 +344,18 @@ class MainWindow(Gio.Application):
 
         self.store_by_cat: typing.Dict[str, Gtk.ListStore] = {}
         self.storeFilter = {}
+        self.lazy_pages: typing.List[SidePageData] = []
+        self.search_index = SearchIndex.SearchIndex()
+        self.search_scores = None
+        self.sidepage_cats = {}
+        self.ccc_loaded = False
 
-        # load CCC and standalone modules, but not python modules yet
-        self.load_ccc_modules()
+        # load standalone modules, but not CCC and python modules yet
         self.load_standalone_modules()
 
         # if a certain sidepage is given via arguments, try to load only it
         if len(sys.argv) > 1:
+            self.load_ccc_modules()
             if self.load_sidepage_as_standalone():
                 return
         
@@ -319,10 +364,15 @@ class MainWindow(Gio.Application):
     def init_settings_overview(self):
         """Load the system settings overview (default)
         
-        This requires to initialize all settings modules.
+        The sidebar is built from the module manifest, the modules are
+        imported when they are opened or in idle time after the window is shown.
         """
-        # 1. load all python modules
-        self.load_python_modules()
+        start = time.time()
+
+        # 1. add all python and CCC modules without loading them
+        self.load_python_modules(lazy=True)
+        if not self.ccc_loaded:
+            self.load_ccc_modules(lazy=True)
 
         # 2. sort the modules alphabetically according to the current locale
         localeStrKey = cmp_to_key(locale.strcoll)
@@ -344,6 +394,13 @@ class MainWindow(Gio.Application):
             if len(name) > 30:
                 name = "%s..." % name[:30]
             self.store_by_cat[sp_cat].append([name, sp.icon, sp, sp_cat])
+            self.sidepage_cats[sp] = sp_cat
+
+            names, keywords = [sp.name], [sp.keywords]
+            if isinstance(sp, LazySidePage):
+                names.append(sp.untranslated[0])
+                keywords.append(sp.untranslated[1])
+            self.search_index.add(sp, names, keywords)
 
         self.min_label_length = 0
         self.min_pix_length = 0
@@ -378,6 +435,50 @@ class MainWindow(Gio.Application):
 
         self.window.show()
 
+        if PRINT_OVERVIEW_TIMING:
+            imported = sorted(name for name in sys.modules if name.startswith("cs_"))
+            print('overview took %0.3f ms, %d settings modules imported'
+                  % ((time.time() - start) * 1000.0, len(imported)))
+            if imported:
+                print("settings modules imported while building the overview: %s" % ", ".join(imported),
+                      file=sys.stderr)
+            sys.stdout.flush()
+            sys.stderr.flush()
+            # exit right away, SystemExit would be swallowed by the Gio.Application callback
+            os._exit(1 if imported else 0)
+
+        GLib.idle_add(self.prefetch_modules, priority=GLib.PRIORITY_LOW)
+
+    def prefetch_modules(self):
+        """Loads the modules of the overview one at a time while the main loop is idle."""
+        while self.lazy_pages:
+            sp_data = self.lazy_pages.pop(0)
+            if sp_data.sp.sidePage is None and not sp_data.sp.failed:
+                if sp_data.sp.resolve() is None:
+                    self.remove_sidepage(sp_data)
+                return True
+        return False
+
+    def remove_sidepage(self, sp_data):
+        """Removes a module that turned out to be unavailable from the overview."""
+        self.search_index.remove(sp_data.sp)
+        store = self.store_by_cat.get(sp_data.cat)
+        if store is None:
+            return
+        iter = store.get_iter_first()
+        while iter is not None:
+            if store.get_value(iter, 2) is sp_data.sp:
+                store.remove(iter)
+                break
+            iter = store.iter_next(iter)
+        if store.get_iter_first() is None:
+            self.displayCategories()
+
+    def add_lazy_sidepage(self, name, icon, keywords, mod_name, category, loader, untranslated=(None, None)):
+        sp_data = SidePageData(LazySidePage(name, icon, keywords, loader, untranslated), mod_name, category)
+        self.sidePages.append(sp_data)
+        self.lazy_pages.append(sp_data)
+
     def load_sidepage_as_standalone(self) -> bool:
         """
         When an explicit sidepage is given as an argument,
@@ -456,15 +557,30 @@ class MainWindow(Gio.Application):
         print(f"warning: settings module {sidepage_name} not found.")
         return False
 
-    def load_ccc_modules(self):
-        """Loads all Cinnamon Control Center settings modules."""
+    def load_ccc_modules(self, lazy=False):
+        """Loads all Cinnamon Control Center settings modules.
+
+        :param lazy: (optional) only add them to the overview, the panels are loaded when needed
+        """
+        self.ccc_loaded = not lazy
+        if lazy and not self.c_manager.has_panels():
+            return
         for item in CONTROL_CENTER_MODULES:
             ccmodule = SettingsWidgets.CCModule(item[0], item[1], item[2], item[3], item[4], self.content_box)
-            if ccmodule.process(self.c_manager):
+            if lazy:
+                self.add_lazy_sidepage(item[0], item[2], item[4], ccmodule.name, ccmodule.category,
+                                       lambda ccmodule=ccmodule: self.process_ccc_module(ccmodule))
+            elif ccmodule.process(self.c_manager):
                 self.sidePages.append(SidePageData(ccmodule.sidePage, ccmodule.name, ccmodule.category))
             else:
                 print("warning: failed to process CCC module", item[1])
 
+    def process_ccc_module(self, ccmodule):
+        if ccmodule.process(self.c_manager):
+            return ccmodule.sidePage
+        print("warning: failed to process CCC module", ccmodule.name)
+        return None
+
     def load_standalone_modules(self):
         """Loads all standalone settings modules."""
         for item in STANDALONE_MODULES:
@@ -474,33 +590,55 @@ class MainWindow(Gio.Application):
             # else:
             #    print(f"note: skipped standalone module {samodule.name} (not found in PATH).")
 
-    def load_python_modules(self, only_module: str = None) -> bool:
+    def load_python_modules(self, only_module: str = None, lazy=False) -> bool:
         """Loads all or only a given settings module(s) written in python.
 
         :param only_module: (optional) module name to be loaded exclusively
+        :param lazy: (optional) add the modules listed in the manifest without importing them
         :return: True if successful, False otherwise
         """
         # Standard setting pages... this can be expanded to include applet dirs maybe?
-        mod_files = glob.glob(os.path.join(config.currentPath, 'modules', 'cs_*.py'))
-        if len(mod_files) == 0:
+        modules_dir = os.path.join(config.currentPath, 'modules')
+        if lazy:
+            entries, to_import = ModuleManifest.load(modules_dir)
+            loaded = {sp_data.name for sp_data in self.sidePages}
+            for entry in entries:
+                if entry["name"] in loaded:
+                    continue
+                label = _(entry["label"]) if "label" in entry["translate"] else entry["label"]
+                keywords = _(entry["keywords"]) if "keywords" in entry["translate"] else entry["keywords"]
+                self.add_lazy_sidepage(label, entry["icon"], keywords, entry["name"], entry["category"],
+                                       lambda module=entry["module"]: self.load_python_module(module),
+                                       (entry["label"], entry["keywords"]))
+        else:
+            mod_files = glob.glob(os.path.join(modules_dir, 'cs_*.py'))
+            to_import = [os.path.splitext(os.path.basename(x))[0] for x in mod_files]
+
+        if len(to_import) == 0 and not lazy:
             print("warning: no python settings modules found!!", file=sys.stderr)
             return False
 
-        to_import = [os.path.splitext(os.path.basename(x))[0] for x in mod_files]
-        
         if only_module is not None:
             to_import = filter(lambda mod: only_module.replace("-", "_") in mod, to_import)
 
-        for module in map(__import__, to_import):
-            try:
-                mod = module.Module(self.content_box)
-                if self.loadCheck(mod) and self.setParentRefs(mod):
-                    self.sidePages.append(SidePageData(mod.sidePage, mod.name, mod.category))
-            except:
-                print(f"failed to load python module {module}", file=sys.stderr)
-                traceback.print_exc()
+        for module in to_import:
+            mod = self.load_python_module(module, return_module=True)
+            if mod is not None:
+                self.sidePages.append(SidePageData(mod.sidePage, mod.name, mod.category))
         return True
 
+    def load_python_module(self, module_name, return_module=False):
+        """Imports a python settings module and returns its side page, or None if it can't be shown."""
+        try:
+            module = __import__(module_name)
+            mod = module.Module(self.content_box)
+            if self.loadCheck(mod) and self.setParentRefs(mod):
+                return mod if return_module else mod.sidePage
+        except:
+            print(f"failed to load python module {module_name}", file=sys.stderr)
+            traceback.print_exc()
+        return None
+
     # If there are no arguments, do_active() is called, otherwise do_open().
     def do_activate(self):
         self.hold()
@@ -532,33 +670,36 @@ class MainWindow(Gio.Application):
         self.bar_heights = h
 
     def onSearchTextChanged(self, widget):
+        self.search_scores = self.search_index.search(self.search_entry.get_text())
         self.displayCategories()
 
     def onClearSearchBox(self, widget, position, event):
         if position == Gtk.EntryIconPosition.SECONDARY:
             self.search_entry.set_text("")
 
-    def strip_accents(self, text):
-        text = unicodedata.normalize('NFKD', text)
-        return ''.join([c for c in text if not unicodedata.combining(c)])
-
     def filter_visible_function(self, model, iter, user_data = None):
-        sidePage = model.get_value(iter, 2)
-        text = self.strip_accents(self.search_entry.get_text().lower())
-        if self.strip_accents(sidePage.name.lower()).find(text) > -1 or \
-           self.strip_accents(sidePage.keywords.lower()).find(text) > -1:
-            return True
-        else:
-            return False
+        return self.search_scores is None or model.get_value(iter, 2) in self.search_scores
+
+    def sort_by_relevance(self, model, a, b, user_data = None):
+        # equal scores keep the alphabetical order of the store
+        return self.search_scores.get(model.get_value(b, 2), 0) - self.search_scores.get(model.get_value(a, 2), 0)
 
     def displayCategories(self):
         widgets = self.side_view_container.get_children()
         for widget in widgets:
             widget.destroy()
         self.first_category_done = False # This is just to prevent an extra separator showing up before the first category
-        for category in CATEGORIES:
-            if category["show"] is True:
-                self.prepCategory(category)
+        self.shown_categories = []
+        categories = [category for category in CATEGORIES if category["show"] is True]
+        if self.search_scores is not None:
+            # the category with the best match first
+            best = {}
+            for sidePage, score in self.search_scores.items():
+                cat = self.sidepage_cats[sidePage]
+                best[cat] = max(score, best.get(cat, 0))
+            categories.sort(key=lambda category: -best.get(category["id"], 0))
+        for category in categories:
+            self.prepCategory(category)
         self.side_view_container.show_all()
 
     def get_label_min_width(self, model):
@@ -601,7 +742,11 @@ class MainWindow(Gio.Application):
         widget.set_markup('<span size="12000">%s</span>' % category["label"])
         box.pack_start(widget, False, False, 1)
         self.side_view_container.pack_start(box, False, False, 0)
-        widget = Gtk.IconView.new_with_model(self.storeFilter[category["id"]])
+        model = self.storeFilter[category["id"]]
+        if self.search_scores is not None:
+            model = Gtk.TreeModelSort(model=model)
+            model.set_default_sort_func(self.sort_by_relevance)
+        widget = Gtk.IconView.new_with_model(model)
 
         area = widget.get_area()
 
@@ -623,6 +768,7 @@ class MainWindow(Gio.Application):
         area.add_attribute(text_renderer, "text", 0)
 
         self.side_view[category["id"]] = widget
+        self.shown_categories.append(category)
         self.side_view_container.pack_start(self.side_view[category["id"]], False, False, 0)
         self.first_category_done = True
         self.side_view[category["id"]].connect("item-activated", self.side_view_nav, category["id"])
@@ -671,7 +817,7 @@ class MainWindow(Gio.Application):
 
     def get_cur_cat_index(self, category):
         i = 0
-        for cat in CATEGORIES:
+        for cat in self.shown_categories:
             if category == cat["id"]:
                 return i
             i += 1
@@ -688,14 +834,14 @@ class MainWindow(Gio.Application):
         iconview.grab_focus()
 
     def on_keynav_failed(self, widget, direction, category):
-        num_cats = len(CATEGORIES)
+        num_cats = len(self.shown_categories)
         current_idx = self.get_cur_cat_index(category)
         ret = False
         dist = 1000
         sel = None
 
         if direction == Gtk.DirectionType.DOWN and current_idx < num_cats - 1:
-            new_cat = CATEGORIES[current_idx + 1]
+            new_cat = self.shown_categories[current_idx + 1]
             col = self.get_cur_column(widget)
             new_cat_view = self.side_view[new_cat["id"]]
             model = new_cat_view.get_model()
@@ -711,7 +857,7 @@ class MainWindow(Gio.Application):
             self.reposition_new_cat(sel, new_cat_view)
             ret = True
         elif direction == Gtk.DirectionType.UP and current_idx > 0:
-            new_cat = CATEGORIES[current_idx - 1]
+            new_cat = self.shown_categories[current_idx - 1]
             col = self.get_cur_column(widget)
             new_cat_view = self.side_view[new_cat["id"]]
             model = new_cat_view.get_model()
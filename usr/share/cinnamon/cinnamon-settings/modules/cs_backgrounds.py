@@ -2,10 +2,10 @@
 
 import os
 import gettext
-import _thread as thread
+import heapq
+import threading
 import subprocess
 import locale
-import time
 import hashlib
 import mimetypes
 import pickle
@@ -19,6 +19,7 @@ gi.require_version("Gtk", "3.0")
 from gi.repository import Gio, Gtk, Gdk, GdkPixbuf, Pango, GLib
 
 from SettingsWidgets import SidePage
+from ThumbnailLoader import open_image, make_thumbnail
 from xapp.GSettingsWidgets import *
 
 gettext.install("cinnamon", "/usr/share/locale")
@@ -40,6 +41,10 @@ BACKGROUND_PICTURE_OPTIONS = [
 ]
 
 BACKGROUND_ICONS_SIZE = 100
+# thumbnails are decoded in parallel, PIL releases the GIL while decoding and scaling
+BACKGROUND_THUMBNAIL_WORKERS = min(4, os.cpu_count() or 1)
+# size of the rounded thumbnail with its drop shadow, used for the rows that are still loading
+BACKGROUND_PLACEHOLDER_SIZE = (BACKGROUND_ICONS_SIZE + 20, BACKGROUND_ICONS_SIZE * 9 // 16 + 20)
 
 BACKGROUND_COLLECTION_TYPE_DIRECTORY = "directory"
 BACKGROUND_COLLECTION_TYPE_XML = "xml"
@@ -55,49 +60,6 @@ PICKLE_PROTOCOL_VERSION = 2
 
 (STORE_IS_SEPARATOR, STORE_ICON, STORE_NAME, STORE_PATH, STORE_TYPE) = range(5)
 
-# EXIF utility functions (source: http://stackoverflow.com/questions/4228530/pil-thumbnail-is-rotating-my-image)
-def flip_horizontal(im): return im.transpose(Image.FLIP_LEFT_RIGHT)
-def flip_vertical(im): return im.transpose(Image.FLIP_TOP_BOTTOM)
-def rotate_180(im): return im.transpose(Image.ROTATE_180)
-def rotate_90(im): return im.transpose(Image.ROTATE_90)
-def rotate_270(im): return im.transpose(Image.ROTATE_270)
-def transpose(im): return rotate_90(flip_horizontal(im))
-def transverse(im): return rotate_90(flip_vertical(im))
-orientation_funcs = [None,
-                     lambda x: x,
-                     flip_horizontal,
-                     rotate_180,
-                     flip_vertical,
-                     transpose,
-                     rotate_270,
-                     transverse,
-                     rotate_90
-                     ]
-def apply_orientation(im):
-    """
-    Extract the oritentation EXIF tag from the image, which should be a PIL Image instance,
-    and if there is an orientation tag that would rotate the image, apply that rotation to
-    the Image instance given to do an in-place rotation.
-
-    :param Image im: Image instance to inspect
-    :return: A possibly transposed image instance
-    """
-
-    try:
-        kOrientationEXIFTag = 0x0112
-        if hasattr(im, '_getexif'): # only present in JPEGs
-            e = im._getexif()       # returns None if no EXIF data
-            if e is not None:
-                #log.info('EXIF data found: %r', e)
-                orientation = e[kOrientationEXIFTag]
-                f = orientation_funcs[orientation]
-                return f(im)
-    except:
-        # We'd be here with an invalid orientation value or some random error?
-        pass # log.exception("Error applying EXIF Orientation tag")
-    return im
-
-
 class ColorsWidget(SettingsWidget):
     def __init__(self, size_group):
         super(ColorsWidget, self).__init__(dep_key=None)
@@ -572,6 +534,11 @@ class PixCache(object):
 
     def __init__(self):
         self._data = {}
+        # rounded corner masks and shadows only depend on the thumbnail size, they are shared by all thumbnails
+        self._imtools_cache = {}
+        # get_pix is called from the thumbnail workers at once
+        self._data_lock = threading.Lock()
+        self._imtools_lock = threading.Lock()
 
     def get_pix(self, filename, size=None):
         if filename is None:
@@ -580,16 +547,16 @@ class PixCache(object):
         if mimetype is None or not mimetype.startswith("image/"):
             return None
 
-        if filename not in self._data:
-            self._data[filename] = {}
-        if size in self._data[filename]:
-            pix = self._data[filename][size]
-        else:
+        with self._data_lock:
+            sizes = self._data.setdefault(filename, {})
+            cached = size in sizes
+            if cached:
+                pix = sizes[size]
+        if not cached:
             try:
                 h = hashlib.sha1(('%f%s' % (os.path.getmtime(filename), filename)).encode()).hexdigest()
                 tmp_cache_path = GLib.get_user_cache_dir() + '/cs_backgrounds/'
-                if not os.path.exists(tmp_cache_path):
-                    os.mkdir(tmp_cache_path)
+                os.makedirs(tmp_cache_path, exist_ok=True)
                 cache_filename = tmp_cache_path + h + "v2"
 
                 loaded = False
@@ -606,7 +573,10 @@ class PixCache(object):
                         # python2 version of cinnamon settings. Either way, we want to ditch the current
                         # cache file and generate a new one. This is still backward compatible with older
                         # Cinnamon versions
-                        os.remove(cache_filename)
+                        try:
+                            os.remove(cache_filename)
+                        except OSError:
+                            pass
 
                 if not loaded:
                     if mimetype == "image/svg+xml":
@@ -616,32 +586,30 @@ class PixCache(object):
                         img = Image.frombytes(mode, (tmp_pix.props.width, tmp_pix.props.height),
                                               tmp_pix.read_pixel_bytes().get_data(), "raw",
                                               mode, tmp_pix.props.rowstride)
+                        (width, height) = img.size
                     else:
-                        img = Image.open(filename)
-                        img = apply_orientation(img)
+                        (img, width, height) = open_image(filename, size)
 
                     # generate thumbnail
-                    (width, height) = img.size
-                    if img.mode != "RGB":
-                        if img.mode == "RGBA":
-                            bg_img = Image.new("RGBA", img.size, (255,255,255,255))
-                            img = Image.alpha_composite(bg_img, img)
-                        img = img.convert("RGB")
-                    if size:
-                        img.thumbnail((size, size), Image.ANTIALIAS)
+                    img = make_thumbnail(img, size)
 
                     import imtools
-                    img = imtools.round_image(img, {}, False, None, 3, 255)
-                    img = imtools.drop_shadow(img, 4, 4, background_color=(255, 255, 255, 0),
-                                              shadow_color=0x444444, border=8, shadow_blur=3,
-                                              force_background_color=False, cache=None)
+                    # the masks are drawn after they are put in the cache, so it is only used by one thread at a time
+                    with self._imtools_lock:
+                        img = imtools.round_image(img, self._imtools_cache, False, None, 3, 255)
+                        img = imtools.drop_shadow(img, 4, 4, background_color=(255, 255, 255, 0),
+                                                  shadow_color=0x444444, border=8, shadow_blur=3,
+                                                  force_background_color=False, cache=self._imtools_cache)
 
                     # save to disk cache
                     try:
                         png_bytes = BytesIO()
                         img.save(png_bytes, "png")
-                        with open(cache_filename, "wb") as cache_file:
+                        # written aside and renamed, so another worker never reads a half written file
+                        tmp_filename = "%s.%d.%d.tmp" % (cache_filename, os.getpid(), threading.get_ident())
+                        with open(tmp_filename, "wb") as cache_file:
                             pickle.dump([png_bytes.getvalue(), width, height], cache_file, PICKLE_PROTOCOL_VERSION)
+                        os.replace(tmp_filename, cache_filename)
                     except Exception as detail:
                         print("Failed to save cache file: %s: %s" % (cache_filename, detail))
 
@@ -650,7 +618,8 @@ class PixCache(object):
                 print("Failed to convert %s: %s" % (filename, detail))
                 pix = None
             if pix:
-                self._data[filename][size] = pix
+                with self._data_lock:
+                    self._data.setdefault(filename, {})[size] = pix
         return pix
 
     # Convert RGBA PIL Image to Pixbuf
@@ -669,7 +638,7 @@ class ThreadedIconView(Gtk.IconView):
     def __init__(self):
         Gtk.IconView.__init__(self)
         self.set_item_width(BACKGROUND_ICONS_SIZE * 1.1)
-        self._model = Gtk.ListStore(object, GdkPixbuf.Pixbuf, str, str)
+        self._model = Gtk.ListStore(object, GdkPixbuf.Pixbuf, str, str, int)
         self._model_filter = self._model.filter_new()
         self._model_filter.set_visible_func(self.visible_func)
         self.set_model(self._model_filter)
@@ -688,14 +657,25 @@ class ThreadedIconView(Gtk.IconView):
         self.add_attribute(text_renderer, "markup", 2)
         text_renderer.set_property("alignment", Pango.Alignment.CENTER)
 
-        self._loading_queue = []
-        self._loading_queue_lock = thread.allocate_lock()
-
-        self._loading_lock = thread.allocate_lock()
-        self._loading = False
+        self._placeholder = GdkPixbuf.Pixbuf.new(GdkPixbuf.Colorspace.RGB, True, 8, *BACKGROUND_PLACEHOLDER_SIZE)
+        self._placeholder.fill(0)
 
-        self._loaded_data = []
-        self._loaded_data_lock = thread.allocate_lock()
+        # Pending pictures are kept in a heap of (priority, index, generation), the pictures that are
+        # visible get a second entry with a higher priority. clear() bumps the generation, so the
+        # workers skip the old entries and their results are dropped.
+        self._loading_queue = []
+        self._loading_jobs = {}
+        self._loading_cond = threading.Condition()
+        self._generation = 0
+        self._next_index = 0
+        self._rows = {}
+        self._workers = []
+        self._prioritize_id = 0
+        # the adjustment the scroll handlers are connected to, and their handler ids
+        self._vadjustment = None
+        self._vadjustment_handlers = []
+
+        self.connect("notify::vadjustment", self._on_vadjustment_changed)
 
     def visible_func(self, model, iter, data=None):
         item_path = model.get_value(iter, 3)
@@ -708,86 +688,110 @@ class ThreadedIconView(Gtk.IconView):
             self.add_picture(i, path)
 
     def clear(self):
-        self._loading_queue_lock.acquire()
-        self._loading_queue = []
-        self._loading_queue_lock.release()
-
-        self._loading_lock.acquire()
-        is_loading = self._loading
-        self._loading_lock.release()
-        while is_loading:
-            time.sleep(0.1)
-            self._loading_lock.acquire()
-            is_loading = self._loading
-            self._loading_lock.release()
+        with self._loading_cond:
+            self._generation += 1
+            self._loading_queue = []
+            self._loading_jobs = {}
 
+        self._rows = {}
         self._model.clear()
 
     def add_picture(self, picture, path):
-        self._loading_queue_lock.acquire()
-        self._loading_queue.append(picture)
-        self._loading_queue_lock.release()
-
-        start_loading = False
-        self._loading_lock.acquire()
-        if not self._loading:
-            self._loading = True
-            start_loading = True
-        self._loading_lock.release()
-
-        if start_loading:
-            GLib.timeout_add(100, self._check_loading_progress)
-            thread.start_new_thread(self._do_load, (path,))
-
-    def _check_loading_progress(self):
-        self._loading_lock.acquire()
-        self._loaded_data_lock.acquire()
-        res = self._loading
-        to_load = []
-        while len(self._loaded_data) > 0:
-            to_load.append(self._loaded_data[0])
-            self._loaded_data = self._loaded_data[1:]
-        self._loading_lock.release()
-        self._loaded_data_lock.release()
-
-        for i in to_load:
-            self._model.append(i)
-
-        return res
-
-    def _do_load(self, path):
-        finished = False
-        while not finished:
-            self._loading_queue_lock.acquire()
-            if len(self._loading_queue) == 0:
-                finished = True
-            else:
-                to_load = self._loading_queue[0]
-                self._loading_queue = self._loading_queue[1:]
-            self._loading_queue_lock.release()
-            if not finished:
-                filename = to_load["filename"]
-                if filename.endswith(".xml"):
-                    filename = self.getFirstFileFromBackgroundXml(filename)
-                pix = PIX_CACHE.get_pix(filename, BACKGROUND_ICONS_SIZE)
-                if pix is not None:
-                    if "name" in to_load:
-                        label = to_load["name"]
-                    else:
-                        label = os.path.split(to_load["filename"])[1]
-                    if "artist" in to_load:
-                        artist = "%s\n" % to_load["artist"]
-                    else:
-                        artist = ""
-                    dimensions = "%dx%d" % (pix[1], pix[2])
-
-                    self._loaded_data_lock.acquire()
-                    self._loaded_data.append((to_load, pix[0], "<b>%s</b>\n<small>%s%s</small>" % (label, artist, dimensions), path))
-                    self._loaded_data_lock.release()
+        filename = picture["filename"]
+        if not filename.endswith(".xml"):
+            mimetype = mimetypes.guess_type(filename)[0]
+            if mimetype is None or not mimetype.startswith("image/"):
+                return
+
+        index = self._next_index
+        self._next_index += 1
+        self._rows[index] = self._model.append((picture, self._placeholder, self._get_markup(picture), path, index))
+
+        with self._loading_cond:
+            self._loading_jobs[index] = (picture, path)
+            heapq.heappush(self._loading_queue, (1, index, self._generation))
+            if len(self._workers) < BACKGROUND_THUMBNAIL_WORKERS:
+                worker = threading.Thread(target=self._do_load, daemon=True)
+                self._workers.append(worker)
+                worker.start()
+            self._loading_cond.notify()
+
+    def _get_markup(self, picture, pix=None):
+        if "name" in picture:
+            label = picture["name"]
+        else:
+            label = os.path.split(picture["filename"])[1]
+        if "artist" in picture:
+            artist = "%s\n" % picture["artist"]
+        else:
+            artist = ""
+        dimensions = ""
+        if pix is not None:
+            dimensions = "%dx%d" % (pix[1], pix[2])
+        return "<b>%s</b>\n<small>%s%s</small>" % (label, artist, dimensions)
+
+    def _on_vadjustment_changed(self, *args):
+        vadjustment = self.get_vadjustment()
+        if vadjustment is self._vadjustment:
+            return
+        for handler in self._vadjustment_handlers:
+            self._vadjustment.disconnect(handler)
+        self._vadjustment = vadjustment
+        self._vadjustment_handlers = []
+        if vadjustment is not None:
+            self._vadjustment_handlers = [vadjustment.connect("value-changed", self._queue_prioritize),
+                                          vadjustment.connect("changed", self._queue_prioritize)]
+
+    def _queue_prioritize(self, *args):
+        if self._prioritize_id == 0:
+            self._prioritize_id = GLib.idle_add(self._prioritize_visible)
+
+    def _prioritize_visible(self):
+        self._prioritize_id = 0
+        visible_range = self.get_visible_range()
+        if not visible_range:
+            return False
+        (start, end) = visible_range
+        indexes = []
+        for i in range(start.get_indices()[0], end.get_indices()[0] + 1):
+            iter = self._model_filter.get_iter(Gtk.TreePath.new_from_indices([i]))
+            indexes.append(self._model_filter.get_value(iter, 4))
+
+        with self._loading_cond:
+            for index in indexes:
+                if index in self._loading_jobs:
+                    heapq.heappush(self._loading_queue, (0, index, self._generation))
+        return False
+
+    def _do_load(self):
+        while True:
+            with self._loading_cond:
+                while True:
+                    while not self._loading_queue:
+                        self._loading_cond.wait()
+                    (priority, index, generation) = heapq.heappop(self._loading_queue)
+                    # entries of cleared lists and the second entry of prioritized pictures
+                    if generation == self._generation and index in self._loading_jobs:
+                        (to_load, path) = self._loading_jobs.pop(index)
+                        break
 
-        self._loading_lock.acquire()
-        self._loading = False
-        self._loading_lock.release()
+            filename = to_load["filename"]
+            if filename.endswith(".xml"):
+                filename = self.getFirstFileFromBackgroundXml(filename)
+            pix = PIX_CACHE.get_pix(filename, BACKGROUND_ICONS_SIZE)
+            GLib.idle_add(self._on_picture_loaded, generation, index, to_load, pix)
+
+    def _on_picture_loaded(self, generation, index, picture, pix):
+        if generation != self._generation:
+            return False
+        iter = self._rows.pop(index, None)
+        if iter is None:
+            return False
+        if pix is None:
+            self._model.remove(iter)
+        else:
+            self._model.set(iter, {1: pix[0], 2: self._get_markup(picture, pix)})
+        return False
 
     def getFirstFileFromBackgroundXml(self, filename):
         try:
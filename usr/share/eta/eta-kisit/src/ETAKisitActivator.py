@@ -68,8 +68,12 @@ class ETAKisitActivator:
             if os.path.exists(ApplicationManager.INSTALLED_APPLICATIONS_PATH):
                 fix_permissions(ApplicationManager.INSTALLED_APPLICATIONS_PATH)
 
+            # applied_files.lock.json
+            if os.path.exists(ApplicationManager.APPLIED_FILES_PATH):
+                fix_permissions(ApplicationManager.APPLIED_FILES_PATH)
+
             print(
-                "Permissions for profiles.json, applied_profiles.lock.json, config directory is fixed."
+                "Permissions for profiles.json, applied_profiles.lock.json, applied_files.lock.json, config directory is fixed."
             )
             exit(0)
         elif self.args.always_restricted_apps:
@@ -82,6 +86,7 @@ class ETAKisitActivator:
         is_unrestrict = True if self.args.unrestrict else False
         is_enable_websites = True if self.args.enable_websites_restriction else False
         is_disable_websites = True if self.args.disable_websites_restriction else False
+        is_switch = True if self.args.switch else False
 
         # Read Profiles
         self.profile = None
@@ -90,6 +95,35 @@ class ETAKisitActivator:
         self.read_profile()
         self.read_applied_profile()
 
+        if self.args.dry_run:
+            self.switch_application_filter(
+                self.applied_profile, self.profile, dry_run=True
+            )
+            exit(0)
+
+        if is_switch:
+            # Same as --unrestrict followed by --restrict, but applications are changed in one batch
+            self.close_browsers_in_ogrenci()
+
+            if (
+                self.applied_profile
+                and self.applied_profile.get_website_restriction_type() != "none"
+            ):
+                self.set_network_filter(False, self.applied_profile)
+
+            self.switch_application_filter(self.applied_profile, self.profile)
+
+            if self.profile:
+                self.save_applied_profile()
+            else:
+                self.remove_applied_profile()
+
+            app_list = ProfileManager.get_default().get_always_restricted_applications()
+            self.always_restrict_apps(app_list)
+
+            print("== ETAKisitActivator FINISHED ==")
+            return
+
         # Clear browser cache by closing
         self.close_browsers_in_ogrenci()
 
@@ -159,77 +193,28 @@ class ETAKisitActivator:
     def set_application_filter(self, is_activate, profile):
         if is_activate:
             print("=== Restricting Applications:")
-            print(f"| {'App':<70} | {'Binary':<40} |")
-            print(f"| {'-' * 70} | {'-' * 40} |")
-            restriction_type = profile.get_application_restriction_type()
-
-            if restriction_type == "allowlist":
-                all_applications = ApplicationManager.get_all_applications(
-                    sort_by_id=True
-                )
-
-                for app in all_applications:
-                    desktop_file_path = app.get_filename()
-                    app_id = app.get_id()
-
-                    if (
-                        app_id not in profile.get_application_allowlist()
-                        and desktop_file_path not in profile.get_application_allowlist()
-                    ):
-                        ApplicationManager.restrict_application(app.get_id())
-
-                # Flatpaks:
-                blocked_app_ids = []
-                for app in ApplicationManager.get_flatpak_applications():
-                    desktop_file_path = app.get_filename()
-                    app_id = app.get_id()
-
-                    if desktop_file_path not in profile.get_application_allowlist():
-                        new_id = app.get_id()[:-8]  # remove .desktop suffix
-                        blocked_app_ids.append(new_id)
-
-                ApplicationManager.restrict_flatpaks(
-                    blocked_app_ids, FileRestrictionManager.UNPRIVILEGED_USER_ID
-                )
-            elif restriction_type == "denylist":
-                for app_id in profile.get_application_denylist():
-                    ApplicationManager.restrict_application(app_id)
-
-                # Flatpaks:
-                blocked_app_ids = []
-                for app in ApplicationManager.get_flatpak_applications():
-                    desktop_file_path = app.get_filename()
-                    app_id = app.get_id()
-
-                    if desktop_file_path in profile.get_application_denylist():
-                        new_id = app.get_id()[:-8]  # remove .desktop suffix
-                        blocked_app_ids.append(new_id)
-
-                ApplicationManager.restrict_flatpaks(
-                    blocked_app_ids, FileRestrictionManager.UNPRIVILEGED_USER_ID
-                )
-
+            plan = ApplicationManager.plan_restrictions(None, profile)
         else:
             print("=== Unrestricting Applications:")
-            print(f"| {'App':<70} | {'Binary':<40} |")
-            print(f"| {'-' * 70} | {'-' * 40} |")
-            restriction_type = profile.get_application_restriction_type()
+            plan = ApplicationManager.plan_restrictions(profile, None)
 
-            if restriction_type == "allowlist":
-                all_applications = ApplicationManager.get_all_applications(
-                    sort_by_id=True
-                )
-                for app in all_applications:
-                    # Remove All app restrictions
-                    ApplicationManager.unrestrict_application(app.get_id())
-            elif restriction_type == "denylist":
-                for app_id in profile.get_application_denylist():
-                    ApplicationManager.unrestrict_application(app_id)
+        ApplicationManager.print_restriction_plan(plan)
+        ApplicationManager.apply_restriction_plan(
+            plan, FileRestrictionManager.UNPRIVILEGED_USER_ID
+        )
 
-            # Flatpaks:
-            ApplicationManager.unrestrict_all_flatpaks(
-                FileRestrictionManager.UNPRIVILEGED_USER_ID
-            )
+    def switch_application_filter(self, applied_profile, profile, dry_run=False):
+        # Only the files the new profile no longer restricts are unrestricted
+        print("=== Switching Applications:")
+        plan = ApplicationManager.plan_restrictions(applied_profile, profile)
+        ApplicationManager.print_restriction_plan(plan)
+
+        if dry_run:
+            return
+
+        ApplicationManager.apply_restriction_plan(
+            plan, FileRestrictionManager.UNPRIVILEGED_USER_ID
+        )
 
     def set_network_filter(self, is_activate, profile):
         if is_activate:
@@ -341,6 +326,18 @@ if __name__ == "__main__":
         help="Enable website restriction in applied profile.",
     )
 
+    # Profile Switch Arguments
+    parser.add_argument(
+        "--switch",
+        action="store_true",
+        help="Restrict applications of current profile and unrestrict only the ones the applied profile no longer needs.",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Print the application permission changes of --switch and their timing without applying them.",
+    )
+
     # File Permission Fix
     parser.add_argument(
         "--fix-permissions",
@@ -80,14 +80,11 @@ def on_normal_user_login():
 def activate_profile(profile_name):
     profile_manager = ProfileManager.get_default()
 
-    # Deactive
-    print("Reverting previous settings...")
-    ETAKisitActivator.run_activator(["--unrestrict"])
-
     profile_manager.set_current_profile(profile_name)
 
-    print("Applying new settings...")
-    ETAKisitActivator.run_activator(["--restrict"])
+    # Revert previous settings and apply the new ones in one run
+    print("Switching settings...")
+    ETAKisitActivator.run_activator(["--switch"])
 
 
 def activate_on_startup(username):
@@ -136,7 +133,7 @@ def activate_on_startup(username):
 
 
 if args.reload:
-    # Deactive
+    # Full re-apply: revert everything the applied profile changed, then restrict again
     print("Reverting previous settings...")
     ETAKisitActivator.run_activator(["--unrestrict"])
 
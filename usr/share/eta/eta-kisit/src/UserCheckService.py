@@ -1,31 +1,38 @@
 #!/usr/bin/python3
 
-import threading
+from gi.repository import Gio, GLib
 from managers import LinuxUserManager
 from Logger import log
 import subprocess
 
 
-def set_interval(func, sec):
-    def func_wrapper():
-        set_interval(func, sec)
-        func()
+LOGIN1 = "org.freedesktop.login1"
 
-    t = threading.Timer(sec, func_wrapper)
-    t.start()
-    return t
+# Signals come in bursts on login/logout, they are handled together after this delay
+SIGNAL_DELAY_MS = 250
+
+# loginctl polling is used only when logind signals are not available
+POLL_MIN_INTERVAL = 1
+POLL_MAX_INTERVAL = 30
 
 
 last_active_session = None
+bus = None
+pending_check = 0
+poll_interval = POLL_MIN_INTERVAL
 
 
 def check_active_session():
     global last_active_session
 
     try:
-        active_session = LinuxUserManager.get_active_session_username()
+        if bus:
+            active_session = LinuxUserManager.get_active_session_username_from_bus(bus)
+        else:
+            active_session = LinuxUserManager.get_active_session_username()
     except Exception as e:
         log("Exception on get_active_session: {}".format(e))
+        return False
 
     if active_session == "root":
         active_session = None
@@ -45,6 +52,85 @@ def check_active_session():
             except Exception as e:
                 log("Exception on eta-kisit --user-login call: {}".format(e))
 
+        return True
+
+    return False
+
+
+def on_delayed_check():
+    global pending_check
+
+    pending_check = 0
+    check_active_session()
+
+    return GLib.SOURCE_REMOVE
+
+
+def on_login1_signal(connection, sender, path, interface, signal, parameters):
+    global pending_check
+
+    if signal == "PropertiesChanged":
+        _interface, changed, _invalidated = parameters.unpack()
+        if "Active" not in changed and "ActiveSession" not in changed:
+            return
+
+    if not pending_check:
+        pending_check = GLib.timeout_add(SIGNAL_DELAY_MS, on_delayed_check)
+
+
+def on_poll():
+    global poll_interval
+
+    # Back off while nothing changes, check again every second after a change
+    if check_active_session():
+        poll_interval = POLL_MIN_INTERVAL
+    else:
+        poll_interval = min(poll_interval * 2, POLL_MAX_INTERVAL)
+
+    GLib.timeout_add_seconds(poll_interval, on_poll)
+
+    return GLib.SOURCE_REMOVE
+
+
+def subscribe_login1():
+    global bus
+
+    try:
+        bus = Gio.bus_get_sync(Gio.BusType.SYSTEM, None)
+        LinuxUserManager.get_active_session_username_from_bus(bus)
+    except Exception as e:
+        log("logind is not reachable on D-Bus, polling loginctl: {}".format(e))
+        bus = None
+        return False
+
+    for signal in ["SessionNew", "SessionRemoved"]:
+        bus.signal_subscribe(
+            LOGIN1,
+            "org.freedesktop.login1.Manager",
+            signal,
+            "/org/freedesktop/login1",
+            None,
+            Gio.DBusSignalFlags.NONE,
+            on_login1_signal,
+        )
+
+    # Session "Active" and seat "ActiveSession" properties change on user switch and lock
+    bus.signal_subscribe(
+        LOGIN1,
+        "org.freedesktop.DBus.Properties",
+        "PropertiesChanged",
+        None,
+        None,
+        Gio.DBusSignalFlags.NONE,
+        on_login1_signal,
+    )
+
+    return True
+
+
+if subscribe_login1():
+    check_active_session()
+else:
+    on_poll()
 
-t = set_interval(check_active_session, 1)  # check every 1 seconds
-t.join()
+GLib.MainLoop().run()
@@ -2,6 +2,7 @@ from pathlib import Path
 import shutil
 import os
 import json
+import time
 from gi.repository import Gio
 
 from managers import FileRestrictionManager
@@ -11,6 +12,8 @@ import ETAKisitActivator
 
 CONFIG_DIR = Path("/var/lib/eta/eta-kisit/")
 INSTALLED_APPLICATIONS_PATH = os.path.join(CONFIG_DIR, "installed_applications.json")
+# Files restricted by the last applied plan, next to applied_profile.lock.json
+APPLIED_FILES_PATH = os.path.join(CONFIG_DIR, "applied_files.lock.json")
 ALWAYS_ALLOWED_APPLICATIONS = [
     # Restart and Exit buttons
     "tr.org.pardus.eta-exit.desktop",
@@ -68,6 +71,14 @@ ALWAYS_ALLOWED_EXECUTABLES = [
 UNPRIVILEGED_USER_APPLICATIONS_DIR = "/home/{}/.local/share/applications".format(
     FileRestrictionManager.UNPRIVILEGED_USER
 )
+# TODO: Getting XDG_DATA_DIRS from root is harder than this.
+# Accessing etapadmin's environment variables of Xsession.d is correct way to do this.
+DATA_DIRS = "/usr/share/etap:/var/lib/wine-prefix/.local/share:/usr/share/gnome:/usr/local/share/:/usr/share/"
+
+# Filled once per process by _get_file_index()
+_desktop_file_index = None
+_local_desktop_file_index = None
+_executable_paths = {}
 
 
 def get_flatpak_applications():
@@ -192,11 +203,37 @@ def unrestrict_all_flatpaks(user_id):
 
 
 # System
+def _get_file_index():
+    # List every applications directory once: app id -> desktop files
+    global _desktop_file_index, _local_desktop_file_index
+
+    if _desktop_file_index is None:
+        desktop_file_index = {}
+        for dir in DATA_DIRS.split(":"):
+            applications_dir = os.path.join(dir, "applications")
+            if not os.path.isdir(applications_dir):
+                continue
+
+            for file in os.listdir(applications_dir):
+                desktop_file_index.setdefault(file, []).append(
+                    os.path.join(applications_dir, file)
+                )
+
+        local_desktop_file_index = {}
+        if os.path.isdir(UNPRIVILEGED_USER_APPLICATIONS_DIR):
+            for file in os.listdir(UNPRIVILEGED_USER_APPLICATIONS_DIR):
+                local_desktop_file_index[file] = os.path.join(
+                    UNPRIVILEGED_USER_APPLICATIONS_DIR, file
+                )
+
+        _desktop_file_index = desktop_file_index
+        _local_desktop_file_index = local_desktop_file_index
+
+    return _desktop_file_index, _local_desktop_file_index
+
+
 def find_local_application(application_id):
-    local_desktop_file = UNPRIVILEGED_USER_APPLICATIONS_DIR + "/" + application_id
-    if os.path.exists(local_desktop_file):
-        return local_desktop_file
-    return None
+    return _get_file_index()[1].get(application_id)
 
 
 def get_appinfo(application_id):
@@ -219,101 +256,228 @@ def get_desktop_files(application_id):
         # convert full file path to app id
         application_id = application_id.split("/")[-1]
 
-    desktop_file_paths = []
-    # TODO: Getting XDG_DATA_DIRS from root is harder than this.
-    # Accessing etapadmin's environment variables of Xsession.d is correct way to do this.
-    data_dirs = "/usr/share/etap:/var/lib/wine-prefix/.local/share:/usr/share/gnome:/usr/local/share/:/usr/share/"
+    return list(_get_file_index()[0].get(application_id, []))
 
-    # Search for the .desktop file in these directories
-    for dir in data_dirs.split(":"):
-        applications_dir = os.path.join(dir, "applications")
-        if not os.path.isdir(applications_dir):
-            continue
 
-        for file in os.listdir(applications_dir):
-            if file == application_id:
-                file_path = os.path.join(applications_dir, file)
-                desktop_file_paths.append(file_path)
+def _get_cached_executable_path(app, ignore_allowed_list=False):
+    key = (app.get_id(), ignore_allowed_list)
+    if key not in _executable_paths:
+        _executable_paths[key] = get_executable_path(app, ignore_allowed_list)
+    return _executable_paths[key]
 
-    return desktop_file_paths
 
+def get_application_targets(application_id, app=None, ignore_allowed_list=False):
+    """
+    Returns the files restricting an application changes as a dict of sets:
+    "desktop" files, "local" desktop files in the unprivileged user's home and "bin" files.
+    """
+    targets = {"desktop": set(), "local": set(), "bin": set()}
 
-def restrict_application(application_id):
     desktop_files = get_desktop_files(application_id)
     if not desktop_files:
         print(f"No desktop file found for application:{application_id}")
-        return
+        return targets
 
     # Get DesktopAppInfo from app_id
-    app = get_appinfo(application_id)
+    if app is None:
+        app = get_appinfo(application_id)
     if not app:
         print(f"Application not found:{application_id}")
-        return
+        return targets
 
     app_id = app.get_id()
 
     # Check if .desktop file exists in .local/share/applications/
     local_desktop_file = find_local_application(app_id)
     if local_desktop_file:
-        print(f"Also restricted: ~/.local/share/applications:{local_desktop_file}")
-        FileRestrictionManager.restrict_desktop_file(local_desktop_file)
+        targets["local"].add(local_desktop_file)
 
-    # Restrict desktopfile
-    desktop_file_path = app.get_filename()
+    if app_id in ALWAYS_ALLOWED_APPLICATIONS and not ignore_allowed_list:
+        return targets
 
-    if app_id in ALWAYS_ALLOWED_APPLICATIONS:
-        return
+    targets["desktop"].update(desktop_files)
 
-    # Restrict executable
-    executable = get_executable_path(app)
+    # Restrict executable if not flatpak
+    executable = _get_cached_executable_path(app, ignore_allowed_list)
+    if executable and "/var/lib/flatpak/" not in app.get_filename():
+        targets["bin"].add(executable)
+
+    return targets
+
+
+def get_profile_targets(profile, ignore_allowed_list=False):
+    # Files restricted while the profile is applied, flatpaks are handled by malcontent
+    targets = {"desktop": set(), "local": set(), "bin": set()}
+    if profile is None:
+        return targets
+
+    restriction_type = profile.get_application_restriction_type()
+
+    if restriction_type == "allowlist":
+        allowlist = profile.get_application_allowlist()
+        for app in get_all_applications(sort_by_id=True):
+            # Reverting an allowlist profile reverts every app, allowed ones included
+            if ignore_allowed_list or (
+                app.get_id() not in allowlist and app.get_filename() not in allowlist
+            ):
+                _merge_targets(
+                    targets,
+                    get_application_targets(app.get_id(), app, ignore_allowed_list),
+                )
+    elif restriction_type == "denylist":
+        for app_id in profile.get_application_denylist():
+            _merge_targets(
+                targets,
+                get_application_targets(app_id, ignore_allowed_list=ignore_allowed_list),
+            )
 
-    for file in desktop_files:
-        FileRestrictionManager.restrict_desktop_file(file)
-        print(f"| {file:<70} | {executable:<40} |")
+    return targets
 
-    if not executable:
-        return
 
-    # Restrict executable if not flatpak
-    if "/var/lib/flatpak/" in desktop_file_path:
-        pass
+def get_profile_flatpak_blocklist(profile):
+    blocked_app_ids = []
+    if profile is None:
+        return blocked_app_ids
+
+    restriction_type = profile.get_application_restriction_type()
+
+    for app in get_flatpak_applications():
+        desktop_file_path = app.get_filename()
+
+        if restriction_type == "allowlist":
+            if desktop_file_path not in profile.get_application_allowlist():
+                blocked_app_ids.append(app.get_id()[:-8])  # remove .desktop suffix
+        elif restriction_type == "denylist":
+            if desktop_file_path in profile.get_application_denylist():
+                blocked_app_ids.append(app.get_id()[:-8])  # remove .desktop suffix
+
+    return blocked_app_ids
+
+
+def _merge_targets(targets, other):
+    for kind in targets:
+        targets[kind].update(other[kind])
+
+
+def load_applied_files():
+    # Returns the files restricted by the last applied plan, or None if they are not known
+    try:
+        with open(APPLIED_FILES_PATH, "r", encoding="utf-8") as f:
+            applied = json.load(f)
+        return {kind: set(applied.get(kind, [])) for kind in ["desktop", "local", "bin"]}
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def save_applied_files(targets):
+    if any(targets.values()):
+        save_as_json_file(
+            {kind: sorted(files) for kind, files in targets.items()}, APPLIED_FILES_PATH
+        )
+    elif os.path.isfile(APPLIED_FILES_PATH):
+        os.remove(APPLIED_FILES_PATH)
+
+
+def plan_restrictions(current_profile, target_profile):
+    """
+    Restricts every file of the target profile, files reset by a package upgrade and newly
+    installed apps are restricted again. Only the files that were restricted by the last
+    applied plan and are not in the target are unrestricted.
+    """
+    start = time.time()
+
+    target = get_profile_targets(target_profile)
+
+    current = load_applied_files()
+    if current is None or target_profile is None:
+        # Removing all restrictions also reverts files of always allowed apps and binaries
+        current = current or {"desktop": set(), "local": set(), "bin": set()}
+        _merge_targets(
+            current, get_profile_targets(current_profile, target_profile is None)
+        )
+
+    plan = {
+        "restrict": target,
+        "unrestrict": {kind: current[kind] - target[kind] for kind in current},
+        "flatpak_blocklist": get_profile_flatpak_blocklist(target_profile),
+        "planning_time": time.time() - start,
+    }
+
+    return plan
+
+
+def print_restriction_plan(plan):
+    for action in ["restrict", "unrestrict"]:
+        for kind in ["desktop", "local", "bin"]:
+            for file in sorted(plan[action][kind]):
+                print(f"| {action:<10} | {kind:<7} | {file:<70} |")
+
+    for app in plan["flatpak_blocklist"]:
+        print(f"| {'restrict':<10} | {'flatpak':<7} | {app:<70} |")
+
+    changes = sum(
+        len(files) for action in ["restrict", "unrestrict"] for files in plan[action].values()
+    )
+    print(
+        "Plan: {} file changes, {} blocked flatpaks, planned in {:.3f}s".format(
+            changes, len(plan["flatpak_blocklist"]), plan["planning_time"]
+        )
+    )
+
+
+def apply_restriction_plan(plan, user_id):
+    start = time.time()
+
+    for file in plan["unrestrict"]["local"]:
+        FileRestrictionManager.unrestrict_local_desktop_file(file)
+    for file in plan["unrestrict"]["desktop"]:
+        FileRestrictionManager.unrestrict_desktop_file(file)
+    for file in plan["unrestrict"]["bin"]:
+        FileRestrictionManager.unrestrict_bin_file(file)
+
+    for file in plan["restrict"]["local"] | plan["restrict"]["desktop"]:
+        FileRestrictionManager.restrict_desktop_file(file)
+    for file in plan["restrict"]["bin"]:
+        FileRestrictionManager.restrict_bin_file(file)
+
+    if plan["flatpak_blocklist"]:
+        restrict_flatpaks(plan["flatpak_blocklist"], user_id)
     else:
-        FileRestrictionManager.restrict_bin_file(executable)
+        unrestrict_all_flatpaks(user_id)
 
+    save_applied_files(plan["restrict"])
 
-def unrestrict_application(application_id):
-    desktop_files = get_desktop_files(application_id)
-    if not desktop_files:
-        print(f"No desktop file found for application:{application_id}")
-        return
+    print("Plan applied in {:.3f}s".format(time.time() - start))
 
-    # Get DesktopAppInfo from app_id
-    app = get_appinfo(application_id)
-    if not app:
-        print(f"Application not found:{application_id}")
-        return
 
-    # Check if .desktop file exists in .local/share/applications/
-    local_desktop_file = find_local_application(app.get_id())
-    if local_desktop_file:
-        print(f"Also unrestricted: ~/.local/share/applications:{local_desktop_file}")
-        FileRestrictionManager.unrestrict_local_desktop_file(local_desktop_file)
+def restrict_application(application_id):
+    targets = get_application_targets(application_id)
 
-    # Unrestrict desktop file
-    desktop_file_path = app.get_filename()
+    for file in targets["local"]:
+        print(f"Also restricted: ~/.local/share/applications:{file}")
+        FileRestrictionManager.restrict_desktop_file(file)
 
-    # Unrestrict executable
+    executable = next(iter(targets["bin"]), "")
+    for file in targets["desktop"]:
+        FileRestrictionManager.restrict_desktop_file(file)
+        print(f"| {file:<70} | {executable:<40} |")
+
+    for file in targets["bin"]:
+        FileRestrictionManager.restrict_bin_file(file)
+
+
+def unrestrict_application(application_id):
     # ignore_allowed_list: Get even ignored binaries to unrestrict them again
-    executable = get_executable_path(app, ignore_allowed_list=True)
+    targets = get_application_targets(application_id, ignore_allowed_list=True)
 
-    for file in desktop_files:
+    for file in targets["local"]:
+        print(f"Also unrestricted: ~/.local/share/applications:{file}")
+        FileRestrictionManager.unrestrict_local_desktop_file(file)
+
+    executable = next(iter(targets["bin"]), "")
+    for file in targets["desktop"]:
         FileRestrictionManager.unrestrict_desktop_file(file)
         print(f"| {file:<70} | {executable:<40} |")
 
-    if not executable:
-        return
-
-    if "/var/lib/flatpak/" in desktop_file_path:
-        pass
-    else:
-        FileRestrictionManager.unrestrict_bin_file(executable)
+    for file in targets["bin"]:
+        FileRestrictionManager.unrestrict_bin_file(file)
@@ -2,6 +2,8 @@ import subprocess
 import os
 import pwd
 
+from gi.repository import Gio, GLib
+
 
 def get_logged_username():
     return pwd.getpwuid(os.getuid()).pw_name
@@ -18,18 +20,75 @@ def _get_users():
 
 
 def get_active_session_username():
-    users = _get_users()
+    # One list-sessions and one show-session call for all sessions instead of a show-user call per user
+    process = subprocess.run(
+        ["loginctl", "list-sessions", "--no-legend"], capture_output=True
+    )
+    if process.returncode != 0:
+        print("Couldnt list sessions from loginctl.")
+        return None
+
+    session_ids = [
+        line.split()[0] for line in process.stdout.decode().splitlines() if line.strip()
+    ]
+    if not session_ids:
+        return None
+
+    process = subprocess.run(
+        ["loginctl", "show-session", *session_ids, "-p", "Name", "-p", "Active"],
+        capture_output=True,
+    )
+    if process.returncode != 0:
+        print("Couldnt find active session username from loginctl.")
+        return None
 
-    for u in users:
-        process = subprocess.run(
-            ["loginctl", "show-user", u.pw_name, "-p", "State"], capture_output=True
+    usernames = set(u.pw_name for u in _get_users())
+
+    # Properties of each session are printed as a block, blocks are separated by empty lines
+    for block in process.stdout.decode().split("\n\n"):
+        properties = dict(
+            line.split("=", 1) for line in block.splitlines() if "=" in line
         )
+        if properties.get("Active") == "yes" and properties.get("Name") in usernames:
+            return properties["Name"]
+
+    return None
+
+
+def get_active_session_username_from_bus(bus):
+    login1 = "org.freedesktop.login1"
+    sessions = bus.call_sync(
+        login1,
+        "/org/freedesktop/login1",
+        "org.freedesktop.login1.Manager",
+        "ListSessions",
+        None,
+        GLib.VariantType("(a(susso))"),
+        Gio.DBusCallFlags.NONE,
+        -1,
+        None,
+    ).unpack()[0]
+
+    usernames = set(u.pw_name for u in _get_users())
+
+    for _session_id, _uid, username, _seat, path in sessions:
+        if username not in usernames:
+            continue
 
-        if process.returncode == 0:
-            if "=active" in process.stdout.decode():
-                return u.pw_name
+        active = bus.call_sync(
+            login1,
+            path,
+            "org.freedesktop.DBus.Properties",
+            "Get",
+            GLib.Variant("(ss)", ("org.freedesktop.login1.Session", "Active")),
+            GLib.VariantType("(v)"),
+            Gio.DBusCallFlags.NONE,
+            -1,
+            None,
+        ).unpack()[0]
 
-    print("Couldnt find active session username from loginctl.")
+        if active:
+            return username
 
     return None
 
@@ -33,7 +33,7 @@ fake_data = """
 }
 """
 
-async def handler(websocket, path):
+async def handler(websocket, path=None):
     try:
         while True:
             print(await websocket.recv())
@@ -1,18 +1,14 @@
 #!/usr/bin/env python3
-import uuid
 import sys
-import time
 import os
+import pwd
 import signal
-import socket
 import asyncio
 import websockets
 import json
 import hashlib
 import traceback
 from passlib.hash import bcrypt
-from unix_socket_service import UnixSocketService
-import threading
 import subprocess
 
 sys.path.insert(0, "/usr/share/eta/eta-usb-login")
@@ -21,10 +17,17 @@ sys.path.insert(0, "/usr/share/eta/eta-usb-login")
 from user import create_user, is_valid_user, find_by_ebaid
 from pam import lightdm_trigger, allow_user
 
-os.makedirs("/run/etap", exist_ok=True)
+TRIGGER_SOCKET = "/run/etap/qr-trigger"
+LIGHTDM_SOCKET = "/var/lib/lightdm/ebaqr"
+LIGHTDM_TIMEOUT = 3
 
-# Create unix socket service
-socket_service = UnixSocketService("/run/etap/qr-trigger")
+# websocket keepalive pings and reconnect backoff (seconds)
+WS_PING_INTERVAL = 20
+WS_PING_TIMEOUT = 20
+WS_OPEN_TIMEOUT = 10
+WS_RETRY_MIN = 0.5
+WS_RETRY_MAX = 8
+WS_RETRIES = 5
 
 def get_mac():
     for dev in os.listdir("/sys/class/net"):
@@ -37,45 +40,85 @@ def get_mac():
     print("Failed to detect ethernet mac adress")
     return "00:00:00:00:00:00"
 
-ws = None
-current_qr = None
 WS_NAME = "wss://qr-etap.eba.gov.tr/api/v1/ws/{}".format(get_mac())
 if "debug" in sys.argv:
     WS_NAME="ws://127.0.0.1:8765/{}".format(get_mac())
 
-async def listen(uri):
-    """Function to handle messages from websocket"""
-    global ws
-    if ws is not None:
-        return
-    print("##############")
-    print("Starting websocket listener...")
-    async with websockets.connect(uri) as websocket:
-        ws = websocket
-        try:
-            while True:
-                msg = await websocket.recv()
-                data = json.loads(msg)
-                data["sender"] = "ws"
-                event(data)
-        except websockets.exceptions.ConnectionClosedOK:
-            print("##############")
-            print("Web Socket Connection finished")
-            event({"sender":"ws","action":"timeout"})
-        except Exception as e:
-            print("##############")
-            print("Web Socket Connection failed")
-            event({"sender":"ws","action":"failed"})
-        ws = None
-
-
-def run_ws():
-    """Create Web socket listener"""
-    try:
-        asyncio.run(listen(WS_NAME))
-    except:
-        event({"sender":"ws","action":"failed"})
 
+class WebSocketClient:
+    """
+    Websocket connection owned by the service event loop.
+    Messages are queued and sent from the same loop that reads the socket,
+    the connection is opened on the first message and kept until the server closes it.
+    """
+    def __init__(self, uri, on_message):
+        self.uri = uri
+        self.on_message = on_message
+        self.queue = asyncio.Queue()
+        self.task = None
+
+    def send(self, data):
+        self.queue.put_nowait(data)
+        if self.task is None or self.task.done():
+            self.task = asyncio.ensure_future(self.run())
+
+    async def connect(self):
+        delay = WS_RETRY_MIN
+        for attempt in range(WS_RETRIES):
+            try:
+                return await websockets.connect(self.uri,
+                                                ping_interval=WS_PING_INTERVAL,
+                                                ping_timeout=WS_PING_TIMEOUT,
+                                                open_timeout=WS_OPEN_TIMEOUT)
+            except Exception as e:
+                print("##############")
+                print("Web Socket connection attempt {} failed: {}".format(attempt + 1, e))
+            if attempt + 1 < WS_RETRIES:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, WS_RETRY_MAX)
+        return None
+
+    async def send_loop(self, websocket):
+        while True:
+            data = await self.queue.get()
+            try:
+                print(">>>", data, file=sys.stderr)
+                await websocket.send(json.dumps(data))
+            except websockets.exceptions.ConnectionClosed:
+                # sent again after reconnect
+                self.queue.put_nowait(data)
+                return
+
+    async def run(self):
+        while not self.queue.empty():
+            websocket = await self.connect()
+            if websocket is None:
+                while not self.queue.empty():
+                    self.queue.get_nowait()
+                await self.on_message({"action":"failed"})
+                return
+            print("##############")
+            print("Starting websocket listener...")
+            sender = asyncio.ensure_future(self.send_loop(websocket))
+            try:
+                async for msg in websocket:
+                    try:
+                        data = json.loads(msg)
+                    except ValueError as e:
+                        print(e, traceback.format_exc())
+                        continue
+                    await self.on_message(data)
+                print("##############")
+                print("Web Socket Connection finished")
+                await self.on_message({"action":"timeout"})
+            except websockets.exceptions.ConnectionClosedError as e:
+                print("##############")
+                print("Web Socket Connection lost: {}".format(e))
+                if self.queue.empty():
+                    await self.on_message({"action":"failed"})
+            finally:
+                sender.cancel()
+                await websocket.close()
 
 
 def gen_username(u):
@@ -90,27 +133,22 @@ def gen_username(u):
     u = u.replace(" ","")
     return u
 
-def send_ws(data):
-    """Send data to websocket"""
-    if ws is None:
-        threading.Thread(target=run_ws).start()
-    while ws is None:  # TODO: remove this garbage solution
-        time.sleep(0.1)
-    try:
-        print(">>>", data, file=sys.stderr)
-        asyncio.run(ws.send(json.dumps(data)))
-    except Exception as e:
-        print(e,traceback.format_exc())
+async def ws_message(data):
+    data["sender"] = "ws"
+    await event(data)
 
+ws_client = WebSocketClient(WS_NAME, ws_message)
 
-def send_lightdm(data):
+
+async def send_lightdm(data):
     """Send data to lightdm"""
     try:
-        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-        s.settimeout(3)
-        s.connect("/var/lib/lightdm/ebaqr")
-        s.send(json.dumps(data).encode())
-        s.close()
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_unix_connection(LIGHTDM_SOCKET), LIGHTDM_TIMEOUT)
+        writer.write(json.dumps(data).encode())
+        await writer.drain()
+        writer.close()
+        await writer.wait_closed()
     except Exception as e:
         print(e,traceback.format_exc())
 
@@ -141,9 +179,8 @@ def user_create_login(data):
             subprocess.run(["chage", "-d", "0", uname])
         lightdm_trigger(uname, passwd)
 
-def event(data):
+async def event(data):
     """new message event"""
-    ret = {}
     if "sender" not in data:
         return
     # print message for debug
@@ -151,22 +188,61 @@ def event(data):
         print("##############")
         print("<<<", data, file=sys.stderr)
     if "type" in data:
-        user_create_login(data)
+        # user creation runs useradd and chage, keep the loop free meanwhile
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, user_create_login, data)
+        except Exception as e:
+            print(e,traceback.format_exc())
     if data["sender"] == "lightdm":
         data.pop("sender")
-        send_ws(data)
+        ws_client.send(data)
     elif data["sender"] == "ws":
         data.pop("sender")
-        send_lightdm(data)
+        await send_lightdm(data)
 
-socket_service.event = event
 
+async def handle_trigger(reader, writer):
+    """Handle a message from the greeter"""
+    try:
+        data = await asyncio.wait_for(reader.read(1024), LIGHTDM_TIMEOUT)
+        await event(json.loads(data.decode()))
+    except Exception as e:
+        print(traceback.format_exc(), file=sys.stderr)
+        print("(unix_socket) Client handling error: {}".format(e), file=sys.stderr)
+    finally:
+        writer.close()
 
-def main():
 
-    socket_thread = threading.Thread(target=socket_service.run)
-    socket_thread.start()
-    socket_thread.join()
+def cleanup_socket():
+    try:
+        if os.path.exists(TRIGGER_SOCKET):
+            os.remove(TRIGGER_SOCKET)
+    except Exception as e:
+        print("(unix_socket) Socket cleanup error: {}".format(e), file=sys.stderr)
+
+
+async def serve():
+    os.makedirs(os.path.dirname(TRIGGER_SOCKET), exist_ok=True)
+    cleanup_socket()
+    server = await asyncio.start_unix_server(handle_trigger, path=TRIGGER_SOCKET)
+    os.chmod(TRIGGER_SOCKET, 0o700)
+    os.chown(TRIGGER_SOCKET, pwd.getpwnam("lightdm").pw_uid, -1)
+    print("(unix_socket) Running at {}".format(TRIGGER_SOCKET), file=sys.stderr)
+
+    stop = asyncio.get_running_loop().create_future()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        asyncio.get_running_loop().add_signal_handler(sig, stop.cancel)
+    try:
+        async with server:
+            await stop
+    except asyncio.CancelledError:
+        pass
+    finally:
+        cleanup_socket()
+
+
+def main():
+    asyncio.run(serve())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,81 @@
+import os
+import threading
+
+# Parsed /etc/passwd shared by the login services and the greeter.
+# The file is read again only when it changes (useradd replaces it).
+
+PASSWD = "/etc/passwd"
+
+_lock = threading.Lock()
+_stamp = None
+_uids = {}
+_realnames = {}
+_eba_users = {}
+
+
+def _parse(path):
+    uids = {}
+    realnames = {}
+    eba_users = {}
+    with open(path, "r") as f:
+        for line in f.read().split("\n"):
+            data = line.split(":")
+            if len(data) < 5:
+                continue
+            name = data[0]
+            gecos = data[4]
+            if name in uids:
+                continue
+            uids[name] = data[2]
+            realnames[name] = gecos.split(",")[0]
+            # eba users are created with "realname,,,,<md5 of eba id>"
+            if ",,,," in gecos:
+                eba_users.setdefault(gecos.split(",")[-1], name)
+    return uids, realnames, eba_users
+
+
+def _update():
+    global _stamp, _uids, _realnames, _eba_users
+    try:
+        st = os.stat(PASSWD)
+        stamp = (st.st_ino, st.st_mtime_ns, st.st_size)
+    except OSError:
+        stamp = None
+    with _lock:
+        if stamp == _stamp:
+            return
+        try:
+            _uids, _realnames, _eba_users = _parse(PASSWD)
+        except OSError:
+            _uids, _realnames, _eba_users = {}, {}, {}
+        _stamp = stamp
+
+
+def exists(user):
+    _update()
+    return user in _uids
+
+
+def get_uid(user):
+    """uid as written in passwd, or None"""
+    _update()
+    return _uids.get(user)
+
+
+def get_realname(user):
+    """First gecos field, or the username if it is empty"""
+    _update()
+    realname = _realnames.get(user)
+    if not realname:
+        return user
+    return realname
+
+
+def find_by_eba_hash(eba_hash):
+    _update()
+    return _eba_users.get(eba_hash)
+
+
+def get_users():
+    _update()
+    return list(_uids)
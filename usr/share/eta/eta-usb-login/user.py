@@ -5,14 +5,12 @@ import time
 
 import hashlib
 
+import passwdindex
+
 def is_valid_user(user):
     print("########")
     print("Check User:", user)
-    with open("/etc/passwd","r") as f:
-        for line in f.read().split("\n"):
-            if user == line.split(":")[0]:
-                return True
-    return False
+    return passwdindex.exists(user)
 
 def create_user(user, hash, realname, ebaid):
     eba_hash = hashlib.md5(str(ebaid).encode("utf-8")).hexdigest()
@@ -58,20 +56,7 @@ def check_eba(eba_id, usb_serial):
 
 def find_by_ebaid(ebaid):
     eba_hash = hashlib.md5(str(ebaid).encode("utf-8")).hexdigest()
-    with open("/etc/passwd","r") as f:
-        for line in f.read().split("\n"):
-            if ":" not in line:
-                continue
-            realname = line.split(":")[4]
-            if ",,,," in realname:
-                if realname.split(",")[-1] == eba_hash:
-                   return line.split(":")[0]
-    return None
+    return passwdindex.find_by_eba_hash(eba_hash)
 
 def find_uid(user):
-    with open("/etc/passwd","r") as f:
-        for line in f.read().split("\n"):
-            data = line.split(":")
-            if data[0] == user:
-                return data[2]
-    return None
+    return passwdindex.get_uid(user)
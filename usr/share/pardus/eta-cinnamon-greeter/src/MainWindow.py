@@ -4,6 +4,7 @@ import os
 import subprocess
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 import dbus
 import gi
@@ -336,31 +337,34 @@ class MainWindow:
 
     # Add wallpapers to the grid:
     def add_wallpapers(self, wallpaper_list):
-        for i in range(len(wallpaper_list)):
-            # Image
-            bitmap = GdkPixbuf.Pixbuf.new_from_file(wallpaper_list[i])
-            bitmap = bitmap.scale_simple(240, 135, GdkPixbuf.InterpType.BILINEAR)
+        # Thumbnails are decoded (or read from the cache) in a pool, each one is inserted as soon as it is ready
+        with ThreadPoolExecutor(max_workers=WallpaperManager.THUMBNAIL_WORKERS) as executor:
+            for path, bitmap in zip(wallpaper_list, executor.map(WallpaperManager.get_thumbnail, wallpaper_list)):
+                if bitmap:
+                    GLib.idle_add(self.add_wallpaper_thumbnail, path, bitmap)
 
-            img_wallpaper = Gtk.Image.new_from_pixbuf(bitmap)
-            img_wallpaper.img_path = wallpaper_list[i]
+    def add_wallpaper_thumbnail(self, path, bitmap):
+        img_wallpaper = Gtk.Image.new_from_pixbuf(bitmap)
+        img_wallpaper.img_path = path
 
-            tooltip = wallpaper_list[i]
-            try:
-                tooltip = os.path.basename(tooltip)
-                tooltip = os.path.splitext(tooltip)[0]
-                if "pardus23-0_" in tooltip:
-                    tooltip = tooltip.split("pardus23-0_")[1]
-                    tooltip = tooltip.replace("-", " ")
-                elif "pardus23-" in tooltip and "_" in tooltip:
-                    tooltip = tooltip.split("_")[1]
-                    tooltip = tooltip.replace("-", " ")
-            except Exception as e:
-                print("{}".format(e))
-                pass
-            img_wallpaper.set_tooltip_text(tooltip)
+        tooltip = path
+        try:
+            tooltip = os.path.basename(tooltip)
+            tooltip = os.path.splitext(tooltip)[0]
+            if "pardus23-0_" in tooltip:
+                tooltip = tooltip.split("pardus23-0_")[1]
+                tooltip = tooltip.replace("-", " ")
+            elif "pardus23-" in tooltip and "_" in tooltip:
+                tooltip = tooltip.split("_")[1]
+                tooltip = tooltip.replace("-", " ")
+        except Exception as e:
+            print("{}".format(e))
+            pass
+        img_wallpaper.set_tooltip_text(tooltip)
 
-            GLib.idle_add(self.flow_wallpapers.insert, img_wallpaper, -1)
-            GLib.idle_add(self.flow_wallpapers.show_all)
+        self.flow_wallpapers.insert(img_wallpaper, -1)
+        self.flow_wallpapers.show_all()
+        return False
 
     def get_monitor_resolution(self):
         self.bus = dbus.SessionBus()
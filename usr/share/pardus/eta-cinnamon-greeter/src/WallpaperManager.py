@@ -1,11 +1,23 @@
 #!/usr/bin/env python3
 
+import hashlib
 import os
+import sys
 
 import gi
 
 gi.require_version("Gtk", "3.0")
-from gi.repository import Gio, GLib
+gi.require_version("GdkPixbuf", "2.0")
+from gi.repository import Gio, GLib, GdkPixbuf
+
+THUMBNAIL_WIDTH = 240
+THUMBNAIL_HEIGHT = 135
+THUMBNAIL_WORKERS = 4
+
+# Shared by every user, filled as root by eta-cinnamon-greeter-thumbnails.service at boot and
+# whenever /usr/share/backgrounds changes (eta-cinnamon-greeter-thumbnails.path).
+# Users fall back to their own cache dir when it is not writable.
+SYSTEM_THUMBNAIL_DIR = "/var/cache/eta-cinnamon-greeter/thumbnails"
 
 
 def val_to_variant(val):
@@ -48,3 +60,87 @@ def get_wallpapers():
             wallpapers.append(path)
     return wallpapers
 
+
+def get_user_thumbnail_dir():
+    return os.path.join(GLib.get_user_cache_dir(), "eta-cinnamon-greeter", "thumbnails")
+
+
+def get_thumbnail_name(path, width=THUMBNAIL_WIDTH, height=THUMBNAIL_HEIGHT):
+    # The wallpaper's mtime and size are part of the key, a changed file gets a new thumbnail
+    st = os.stat(path)
+    key = "{}\0{}\0{}\0{}x{}".format(path, st.st_mtime_ns, st.st_size, width, height)
+    return hashlib.sha256(key.encode("utf-8", "surrogateescape")).hexdigest() + ".png"
+
+
+def save_thumbnail(pixbuf, directory, name):
+    try:
+        os.makedirs(directory, exist_ok=True)
+        tmp = os.path.join(directory, "{}.{}.tmp".format(name, os.getpid()))
+        pixbuf.savev(tmp, "png", [], [])
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, os.path.join(directory, name))
+        return True
+    except (OSError, GLib.Error):
+        return False
+
+
+def get_thumbnail(path, width=THUMBNAIL_WIDTH, height=THUMBNAIL_HEIGHT):
+    """
+    Returns a width x height pixbuf of the wallpaper, from the thumbnail cache if it is there.
+    Decoding at scale lets the JPEG loader downscale while decoding instead of loading 4K images.
+    Safe to call from worker threads. Returns None if the file is not an image.
+    """
+    try:
+        name = get_thumbnail_name(path, width, height)
+    except OSError:
+        return None
+
+    user_dir = get_user_thumbnail_dir()
+    for directory in (SYSTEM_THUMBNAIL_DIR, user_dir):
+        try:
+            return GdkPixbuf.Pixbuf.new_from_file(os.path.join(directory, name))
+        except GLib.Error:
+            pass
+
+    try:
+        pixbuf = GdkPixbuf.Pixbuf.new_from_file_at_scale(path, width, height, False)
+    except GLib.Error as e:
+        print("{}".format(e))
+        return None
+
+    if not os.access(SYSTEM_THUMBNAIL_DIR, os.W_OK) or not save_thumbnail(pixbuf, SYSTEM_THUMBNAIL_DIR, name):
+        save_thumbnail(pixbuf, user_dir, name)
+
+    return pixbuf
+
+
+def generate_thumbnails():
+    """
+    Fills the shared thumbnail cache and removes thumbnails of wallpapers that are gone or changed.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    os.makedirs(SYSTEM_THUMBNAIL_DIR, exist_ok=True)
+
+    wallpapers = get_wallpapers()
+    with ThreadPoolExecutor(max_workers=THUMBNAIL_WORKERS) as executor:
+        list(executor.map(get_thumbnail, wallpapers))
+
+    names = set()
+    for path in wallpapers:
+        try:
+            names.add(get_thumbnail_name(path))
+        except OSError:
+            pass
+
+    for name in os.listdir(SYSTEM_THUMBNAIL_DIR):
+        if name not in names:
+            os.remove(os.path.join(SYSTEM_THUMBNAIL_DIR, name))
+
+
+if __name__ == "__main__":
+    try:
+        generate_thumbnails()
+    except OSError as e:
+        print("{}".format(e), file=sys.stderr)
+        sys.exit(1)
@@ -9,9 +9,10 @@ from logger import logger
 import vm_detect
 import pwd
 import os
+import marshal
 import locale
 import gettext
-from config import REQUIRED_USER, PACKAGE_TO_INSTALL, APPNAME, TRANSLATIONS_PATH, VENDOR_LIST_URL
+from config import REQUIRED_USER, PACKAGE_TO_INSTALL, APPNAME, TRANSLATIONS_PATH, VENDOR_LIST_URL, USB_IDS_CACHE
 
 # Basic Translation Setup
 try:
@@ -193,50 +194,37 @@ def check_general_connectivity_async(callback):
     network.get_async(VENDOR_LIST_URL, callback, send_secure_header=False)
 
 
+def _normalize_vendor_id(vendor):
+    vendor = str(vendor).strip().lower()
+    if vendor.startswith("0x"):
+        vendor = vendor[2:]
+    return vendor
+
+
 def check_touch_vendor(allowed_vendors):
     """
     Checks if any of the connected USB devices match the allowed vendors list.
     """
     try:
-        # sys_info = info.get()
-        # Ensure sys_info is valid
-        # if not sys_info:
-        #     logger.error("Could not retrieve system info.")
-        #     return False
-
-        # usb_devices = sys_info.get("usb", [])
-        usb_devices = get_connected_usb_devices_list()
-        
-        # Log detected devices for debugging
-        # logger.info(f"Detected USB devices: {usb_devices}")
-        # logger.info(f"Allowed vendors: {allowed_vendors}")
-
         if not allowed_vendors:
              logger.warning("Allowed vendor list is empty.")
              return False
 
-        # Normalize allowed_vendors to a list of strings
-        normalized_allowed_vendors = []
+        # Normalize allowed_vendors to a set of bare lowercase ids, "0x" prefixes are dropped
+        normalized_allowed_vendors = set()
         if isinstance(allowed_vendors, list):
             for v in allowed_vendors:
                 if isinstance(v, str):
-                    normalized_allowed_vendors.append(v)
+                    normalized_allowed_vendors.add(_normalize_vendor_id(v))
                 elif isinstance(v, dict) and "vendor" in v:
-                    normalized_allowed_vendors.append(str(v["vendor"]))
-
-        for device in usb_devices:
-            # Extract the vendor ID from the device dictionary
-            device_vendor = device.get('vendor', '').lower()
-            
-            for vendor in normalized_allowed_vendors:
-                allowed_vendor = vendor.lower()
-                if (allowed_vendor == device_vendor) or \
-                   (allowed_vendor.startswith("0x") and allowed_vendor[2:] == device_vendor) or \
-                   (device_vendor.startswith("0x") and device_vendor[2:] == allowed_vendor):
-                    
-                    logger.info("Matched vendor '{vendor}' in device '{device}'".format(vendor=vendor, device=device))
-                    return True
-        
+                    normalized_allowed_vendors.add(_normalize_vendor_id(v["vendor"]))
+
+        for device in get_connected_usb_devices_list():
+            device_vendor = _normalize_vendor_id(device.get('vendor', ''))
+            if device_vendor in normalized_allowed_vendors:
+                logger.info("Matched vendor '{vendor}' in device '{device}'".format(vendor=device_vendor, device=device))
+                return True
+
         logger.warning("No matching touch vendor found.")
         return False
 
@@ -252,206 +240,189 @@ USB_IDS_PATHS = [
     "/var/lib/usbutils/usb.ids"
 ]
 
-def load_usb_ids():
+USB_DEVICES_PATH = "/sys/bus/usb/devices"
+
+# Bump when the layout of the cached database changes
+USB_IDS_CACHE_VERSION = 1
+
+# Process-wide usb.ids database, parsed once on first lookup
+_usb_db = None
+_usb_db_stamp = None
+
+
+def _get_usb_ids_stamp():
     """
-    Parses the usb.ids file into a dictionary for fast lookup.
+    Returns (path, mtime_ns, size) of the first usb.ids file found, or None.
     """
-    usb_db = {}
-    path = None
     for p in USB_IDS_PATHS:
-        if os.path.exists(p):
-            path = p
-            break
-            
-    if not path:
-        return {}
+        try:
+            st = os.stat(p)
+        except OSError:
+            continue
+        return (p, st.st_mtime_ns, st.st_size)
+    return None
 
+
+def _parse_usb_ids(path):
+    """
+    Parses the usb.ids file into two flat dictionaries:
+    vendors {"vvvv": name} and products {"vvvv:pppp": name}.
+    """
+    vendors = {}
+    products = {}
     current_vendor_id = None
+    with open(path, 'r', encoding='latin-1') as f:
+        for line in f:
+            if not line or line[0] == '#':
+                continue
+
+            # Vendor lines start with the id, products are indented once.
+            # Deeper levels (interfaces) and the class lists at the end of the file are skipped.
+            if line[0] != '\t':
+                parts = line.rstrip().split(maxsplit=1)
+                if len(parts) == 2 and len(parts[0]) == 4:
+                    current_vendor_id = parts[0].lower()
+                    vendors[current_vendor_id] = parts[1]
+                else:
+                    current_vendor_id = None
+            elif current_vendor_id and line[1] != '\t':
+                parts = line.strip().split(maxsplit=1)
+                if len(parts) == 2:
+                    products[current_vendor_id + ":" + parts[0].lower()] = parts[1]
+    return vendors, products
+
+
+def _load_usb_ids_cache(stamp):
     try:
-        with open(path, 'r', encoding='latin-1') as f:
-            for line in f:
-                line = line.rstrip()
-                if not line or line.startswith('#'): continue
-                
-                # Check for Vendor
-                if line[0] != '\t' and len(line) > 4:
-                    parts = line.split(maxsplit=1)
-                    if len(parts) == 2:
-                        vid = parts[0].lower()
-                        name = parts[1]
-                        usb_db[vid] = {'name': name, 'products': {}}
-                        current_vendor_id = vid
-                    else:
-                        current_vendor_id = None
-                        
-                # Check for Product
-                elif line.startswith('\t') and len(line) > 5 and current_vendor_id:
-                    parts = line.strip().split(maxsplit=1)
-                    if len(parts) == 2:
-                        pid = parts[0].lower()
-                        name = parts[1]
-                        if current_vendor_id in usb_db:
-                            usb_db[current_vendor_id]['products'][pid] = name
+        with open(USB_IDS_CACHE, "rb") as f:
+            version, cached_stamp, vendors, products = marshal.load(f)
     except Exception:
-        return {}
-    return usb_db
+        return None
+    if version != USB_IDS_CACHE_VERSION or tuple(cached_stamp) != stamp:
+        return None
+    return vendors, products
 
-def get_connected_usb_devices_as_string():
+
+def _save_usb_ids_cache(stamp, db):
+    try:
+        os.makedirs(os.path.dirname(USB_IDS_CACHE), exist_ok=True)
+        tmp = "{}.{}.tmp".format(USB_IDS_CACHE, os.getpid())
+        with open(tmp, "wb") as f:
+            marshal.dump((USB_IDS_CACHE_VERSION, stamp, db[0], db[1]), f)
+        os.replace(tmp, USB_IDS_CACHE)
+    except Exception as e:
+        logger.warning("Could not write usb.ids cache: {e}".format(e=e))
+
+
+def load_usb_ids():
     """
-    Scans /sys/bus/usb/devices/ and resolves names using usb.ids file logic.
-    Returns a formatted string table.
+    Returns the usb.ids database as (vendors, products) for fast lookup.
+    The file is parsed once per process, and the parsed tables are kept in a
+    binary cache next to the log file until usb.ids changes.
     """
-    base_path = "/sys/bus/usb/devices"
-    devices_output = []
-    
-    # Load DB
-    usb_db = load_usb_ids()
-    
-    # Header
-    header = f"{'VENDOR':<10} {'DEVICE':<10} {'NAME'}"
-    devices_output.append(header)
-    devices_output.append("-" * 60)
+    global _usb_db, _usb_db_stamp
 
-    if not os.path.exists(base_path):
-        return _("Error: USB subsystem not found.")
+    stamp = _get_usb_ids_stamp()
+    if _usb_db is not None and stamp == _usb_db_stamp:
+        return _usb_db
 
+    db = ({}, {})
+    if stamp:
+        cached = _load_usb_ids_cache(stamp)
+        if cached is not None:
+            db = cached
+        else:
+            try:
+                db = _parse_usb_ids(stamp[0])
+            except Exception as e:
+                logger.warning("Could not parse {path}: {e}".format(path=stamp[0], e=e))
+            else:
+                _save_usb_ids_cache(stamp, db)
+
+    _usb_db = db
+    _usb_db_stamp = stamp
+    return db
+
+
+def _read_sysfs_attr(device_path, name):
+    try:
+        with open(os.path.join(device_path, name), 'r') as f:
+            return f.read().strip()
+    except (OSError, UnicodeDecodeError):
+        return None
+
+
+def _scan_usb_devices():
+    """
+    Walks /sys/bus/usb/devices/ once and returns the connected devices as
+    [{'vendor': '...', 'device': '...', 'name': '...'}], or None if the
+    USB subsystem can not be read.
+    """
     try:
-        entries = sorted(os.listdir(base_path))
+        with os.scandir(USB_DEVICES_PATH) as it:
+            entries = sorted(entry.name for entry in it if ':' not in entry.name)
     except OSError:
-        return _("Error: Cannot access USB devices.")
+        return None
 
+    vendors, products = load_usb_ids()
+    devices_list = []
     for entry in entries:
-        if ':' in entry: continue
-        device_path = os.path.join(base_path, entry)
-        
-        try:
-            vid_path = os.path.join(device_path, "idVendor")
-            if not os.path.exists(vid_path): continue
-            with open(vid_path, 'r') as f:
-                vendor_id = f.read().strip().lower()
-
-            pid_path = os.path.join(device_path, "idProduct")
-            if not os.path.exists(pid_path): continue
-            with open(pid_path, 'r') as f:
-                product_id = f.read().strip().lower()
-
-            vendor_name = ""
-            product_name = ""
-            
-            # DB Lookup
-            if vendor_id in usb_db:
-                vendor_name = usb_db[vendor_id]['name']
-                if product_id in usb_db[vendor_id]['products']:
-                    product_name = usb_db[vendor_id]['products'][product_id]
-            
-            # SysFS Fallback
-            if not vendor_name:
-                man_path = os.path.join(device_path, "manufacturer")
-                if os.path.exists(man_path):
-                    with open(man_path, 'r') as f:
-                         vendor_name = f.read().strip()
-            if not product_name:
-                prod_path = os.path.join(device_path, "product")
-                if os.path.exists(prod_path):
-                    with open(prod_path, 'r') as f:
-                        product_name = f.read().strip()
-
-            final_name = ""
-            if vendor_name and product_name:
-                 final_name = f"{vendor_name} {product_name}"
-            elif vendor_name:
-                final_name = vendor_name
-            elif product_name:
-                final_name = product_name
-            else:
-                final_name = _("Unknown Device")
-
-            line = f"{vendor_id:<10} {product_id:<10} {final_name}"
-            devices_output.append(line)
+        device_path = os.path.join(USB_DEVICES_PATH, entry)
 
-        except OSError:
+        vendor_id = _read_sysfs_attr(device_path, "idVendor")
+        if not vendor_id:
             continue
+        product_id = _read_sysfs_attr(device_path, "idProduct")
+        if not product_id:
+            continue
+        vendor_id = vendor_id.lower()
+        product_id = product_id.lower()
 
-    if len(devices_output) <= 2:
-        return _("No USB devices found.")
+        # DB Lookup, SysFS Fallback
+        vendor_name = vendors.get(vendor_id) or _read_sysfs_attr(device_path, "manufacturer") or ""
+        product_name = products.get(vendor_id + ":" + product_id) or _read_sysfs_attr(device_path, "product") or ""
 
-    return "\n".join(devices_output)
+        if vendor_name and product_name:
+            final_name = f"{vendor_name} {product_name}"
+        else:
+            final_name = vendor_name or product_name or _("Unknown Device")
 
-def get_connected_usb_devices_list():
+        devices_list.append({
+            'vendor': vendor_id,
+            'device': product_id,
+            'name': final_name
+        })
+
+    return devices_list
+
+
+def get_connected_usb_devices_as_string():
     """
     Scans /sys/bus/usb/devices/ and resolves names using usb.ids file logic.
-    Returns a list of dictionaries: [{'vendor': '...', 'device': '...', 'name': '...'}]
+    Returns a formatted string table.
     """
-    base_path = "/sys/bus/usb/devices"
-    devices_list = []
-    
-    # Load DB
-    usb_db = load_usb_ids()
-    
-    if not os.path.exists(base_path):
-        return []
+    if not os.path.exists(USB_DEVICES_PATH):
+        return _("Error: USB subsystem not found.")
 
-    try:
-        entries = sorted(os.listdir(base_path))
-    except OSError:
-        return []
+    devices_list = _scan_usb_devices()
+    if devices_list is None:
+        return _("Error: Cannot access USB devices.")
+    if not devices_list:
+        return _("No USB devices found.")
 
-    for entry in entries:
-        if ':' in entry: continue
-        device_path = os.path.join(base_path, entry)
-        
-        try:
-            vid_path = os.path.join(device_path, "idVendor")
-            if not os.path.exists(vid_path): continue
-            with open(vid_path, 'r') as f:
-                vendor_id = f.read().strip().lower()
-
-            pid_path = os.path.join(device_path, "idProduct")
-            if not os.path.exists(pid_path): continue
-            with open(pid_path, 'r') as f:
-                product_id = f.read().strip().lower()
-
-            vendor_name = ""
-            product_name = ""
-            
-            # DB Lookup
-            if vendor_id in usb_db:
-                vendor_name = usb_db[vendor_id]['name']
-                if product_id in usb_db[vendor_id]['products']:
-                    product_name = usb_db[vendor_id]['products'][product_id]
-            
-            # SysFS Fallback
-            if not vendor_name:
-                man_path = os.path.join(device_path, "manufacturer")
-                if os.path.exists(man_path):
-                    with open(man_path, 'r') as f:
-                         vendor_name = f.read().strip()
-            if not product_name:
-                prod_path = os.path.join(device_path, "product")
-                if os.path.exists(prod_path):
-                    with open(prod_path, 'r') as f:
-                        product_name = f.read().strip()
-
-            final_name = ""
-            if vendor_name and product_name:
-                 final_name = f"{vendor_name} {product_name}"
-            elif vendor_name:
-                final_name = vendor_name
-            elif product_name:
-                final_name = product_name
-            else:
-                final_name = _("Unknown Device")
+    devices_output = [f"{'VENDOR':<10} {'DEVICE':<10} {'NAME'}", "-" * 60]
+    for device in devices_list:
+        devices_output.append(f"{device['vendor']:<10} {device['device']:<10} {device['name']}")
 
-            devices_list.append({
-                'vendor': vendor_id,
-                'device': product_id,
-                'name': final_name
-            })
+    return "\n".join(devices_output)
 
-        except OSError:
-            continue
+def get_connected_usb_devices_list():
+    """
+    Scans /sys/bus/usb/devices/ and resolves names using usb.ids file logic.
+    Returns a list of dictionaries: [{'vendor': '...', 'device': '...', 'name': '...'}]
+    """
+    return _scan_usb_devices() or []
 
-    return devices_list
 
 # --- Status Interpretation ---
 
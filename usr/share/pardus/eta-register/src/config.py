@@ -27,4 +27,5 @@ APPNAME = "eta-register"
 APPNAME_CODE = "eta-register"
 TRANSLATIONS_PATH = "/usr/share/locale"
 LOG_FILE = os.path.join(user_cache_dir, "eta-register.log")
+USB_IDS_CACHE = os.path.join(user_cache_dir, "usb.ids.cache")
 REQUIRED_USER = "etapadmin"
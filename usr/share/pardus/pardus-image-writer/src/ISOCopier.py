@@ -1,18 +1,26 @@
 #!/usr/bin/python3
 
+import errno
 import os
-import re
 import signal
 import stat
 import subprocess
-from subprocess import Popen, PIPE
 import sys
 import math
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 
 SIGNAL_RECEIVED = 0
 
+# Files up to this size are copied in parallel, bigger ones one by one with progress
+LARGE_FILE_SIZE = 4 * 1024 * 1024
+COPY_WORKERS = 4
+COPY_CHUNK_SIZE = 8 * 1024 * 1024
+# Dirty pages of big files are flushed regularly, so the progress follows the USB disk
+SYNC_INTERVAL = 64 * 1024 * 1024
+PROGRESS_INTERVAL = 0.2  # seconds
+
 
 def run(cmd, vital=True):
     if SIGNAL_RECEIVED:
@@ -45,6 +53,87 @@ def sync():
     run(["sync"])
 
 
+def check_signal():
+    if SIGNAL_RECEIVED:
+        raise Exception("Stop signal received")
+
+
+def scan_tree(src):
+    """
+    Walks src once and returns (dirs, files, symlinks) with paths relative to src.
+    files is a list of (path, size).
+    """
+    dirs = []
+    files = []
+    symlinks = []
+
+    stack = [""]
+    while stack:
+        rel_dir = stack.pop()
+        with os.scandir(os.path.join(src, rel_dir)) as it:
+            for entry in it:
+                rel_path = os.path.join(rel_dir, entry.name)
+                if entry.is_symlink():
+                    symlinks.append(rel_path)
+                elif entry.is_dir(follow_symlinks=False):
+                    dirs.append(rel_path)
+                    stack.append(rel_path)
+                elif entry.is_file(follow_symlinks=False):
+                    files.append((rel_path, entry.stat(follow_symlinks=False).st_size))
+
+    dirs.sort()
+    return dirs, files, symlinks
+
+
+def copy_file_data(src_fd, dest_fd, size, on_progress=None, sync_interval=0):
+    """
+    Copies size bytes with copy_file_range, falls back to sendfile when the kernel can not
+    copy between the two filesystems (e.g. iso9660 to vfat).
+    """
+    copied = 0
+    synced = 0
+    use_copy_file_range = hasattr(os, "copy_file_range")
+
+    while copied < size:
+        check_signal()
+
+        count = min(COPY_CHUNK_SIZE, size - copied)
+        n = 0
+        if use_copy_file_range:
+            try:
+                n = os.copy_file_range(src_fd, dest_fd, count)
+            except OSError as e:
+                if e.errno not in (errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP):
+                    raise
+                use_copy_file_range = False
+        if not use_copy_file_range:
+            n = os.sendfile(dest_fd, src_fd, copied, count)
+
+        if n == 0:  # file got shorter
+            break
+        copied += n
+        if sync_interval and copied - synced >= sync_interval:
+            os.fdatasync(dest_fd)
+            synced = copied
+        if on_progress:
+            on_progress(copied)
+
+    return copied
+
+
+def copy_file(src_path, dest_path, size, on_progress=None, sync_interval=0):
+    src_fd = os.open(src_path, os.O_RDONLY)
+    try:
+        dest_fd = os.open(dest_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.posix_fadvise(src_fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            return copy_file_data(src_fd, dest_fd, size, on_progress, sync_interval)
+        finally:
+            os.close(dest_fd)
+    finally:
+        os.close(src_fd)
+
+
 class IsoCopy:
     def error(self, msg=""):
         sys.stderr.write("\x1b[31;1mError: \x1b[;0m{}".format(msg))
@@ -54,10 +143,7 @@ class IsoCopy:
         global SIGNAL_RECEIVED
 
         print("----SIGNAL RECEIVED----")
-        print(self.spawned_process)
         SIGNAL_RECEIVED = number
-        if self.spawned_process:
-            self.spawned_process.kill()
 
     def __init__(self, iso_path, drive, is_windows=False):
         # Define file variables
@@ -68,7 +154,6 @@ class IsoCopy:
 
         # Variables
         self.iso_name = ""
-        self.spawned_process = None
         self.exit_code = 0
         self.is_windows = is_windows
         print("is_windows:", self.is_windows)
@@ -93,7 +178,7 @@ class IsoCopy:
 
             self.mount_folders(self.drive)
 
-            self.copy_dir_with_dd(self.iso_mounted_path, self.usb_mounted_path)
+            self.copy_dir(self.iso_mounted_path, self.usb_mounted_path)
 
             if self.is_windows:
                 time.sleep(2)
@@ -248,42 +333,86 @@ class IsoCopy:
 
         # print("mount_folders()")
 
-    def copy_dir_with_dd(self, src, dest):
-        global SIGNAL_RECEIVED
-
+    def copy_dir(self, src, dest):
         sync()
 
-        regex_only_number = re.compile(r"^(\d+)$")
+        print(f"Source: {src}")
+        print(f"Target: {dest}")
 
-        with Popen(
-            [
-                f"{os.path.dirname(os.path.abspath(__file__))}/copy_dir_with_dd.sh",
-                src,
-                dest,
-            ],
-            stdout=PIPE,
-            stderr=subprocess.STDOUT,
-            bufsize=1,
-            universal_newlines=True,
-        ) as process:
-            self.spawned_process = process
-            for line in process.stdout:
-                if SIGNAL_RECEIVED:
-                    process.kill()
-                    sys.stdout.write("Copy Process killed.")
-                    sys.stdout.flush()
-                    break
+        dirs, files, symlinks = scan_tree(src)
+        total_file_count = len(files)
+        total_bytes = sum(size for _, size in files)
+        copied_files = 0
 
-                if regex_only_number.match(line):
-                    sys.stdout.write(f"BYTES:{line}")
-                    sys.stdout.flush()
-                else:
-                    sys.stdout.write(line)
+        # ISOCopier protocol read by MainWindow:
+        # BYTES:n is the copied bytes of the current file, COPIED:i:count adds them to the total
+        sys.stdout.write(f"TOTAL_BYTES:{total_bytes}\n")
+        sys.stdout.flush()
+
+        def report_copied(size):
+            nonlocal copied_files
+            copied_files += 1
+            sys.stdout.write(f"BYTES:{size}\nCOPIED:{copied_files}:{total_file_count}\n")
+            sys.stdout.flush()
+
+        for rel_path in dirs:
+            os.makedirs(os.path.join(dest, rel_path), exist_ok=True)
+
+        small_files = [(p, size) for p, size in files if size <= LARGE_FILE_SIZE]
+        large_files = [(p, size) for p, size in files if size > LARGE_FILE_SIZE]
+
+        # Thousands of small files (e.g. Windows ISOs) are dominated by per-file latency,
+        # so they are copied by a pool of threads and reported as they finish.
+        with ThreadPoolExecutor(max_workers=COPY_WORKERS) as executor:
+            futures = [
+                executor.submit(
+                    copy_file, os.path.join(src, p), os.path.join(dest, p), size
+                )
+                for p, size in small_files
+            ]
+            try:
+                for future in as_completed(futures):
+                    report_copied(future.result())
+            except BaseException:
+                executor.shutdown(wait=True, cancel_futures=True)
+                raise
+
+        # Big files are copied one at a time in large chunks with progress
+        for rel_path, size in large_files:
+            check_signal()
+
+            last_progress = 0
+
+            def on_progress(copied):
+                nonlocal last_progress
+                now = time.monotonic()
+                if now - last_progress >= PROGRESS_INTERVAL:
+                    last_progress = now
+                    sys.stdout.write(f"BYTES:{copied}\n")
                     sys.stdout.flush()
 
+            report_copied(
+                copy_file(
+                    os.path.join(src, rel_path),
+                    os.path.join(dest, rel_path),
+                    size,
+                    on_progress,
+                    SYNC_INTERVAL,
+                )
+            )
+
+        for rel_path in symlinks:
+            try:
+                os.symlink(
+                    os.readlink(os.path.join(src, rel_path)), os.path.join(dest, rel_path)
+                )
+            except OSError as e:
+                # FAT and NTFS targets may not support symlinks
+                print(f"Symlink {rel_path} could not be copied: {e}")
+
         sync()
 
-        print("copy_dir_with_dd()")
+        print("copy_dir()")
 
     def install_grub(self, drive, usb_mounted_path):
         sync()
@@ -1,11 +1,29 @@
 #!/usr/bin/python3
 
+import argparse
+import fcntl
+import hashlib
+import mmap
 import os
+import queue
 import signal
+import stat
 import subprocess
 import sys
+import threading
 import time
 
+MiB = 1024 * 1024
+
+DEFAULT_BLOCK_SIZE = 4  # MiB
+# Blocks read ahead while the previous one is being written
+QUEUE_DEPTH = 4
+# Without O_DIRECT the page cache is flushed regularly, so progress follows the device, not the cache
+SYNC_INTERVAL = 64 * MiB
+PROGRESS_INTERVAL = 0.2  # seconds
+# O_DIRECT needs buffers, offsets and lengths aligned to the logical block size
+DIRECT_ALIGNMENT = 4096
+
 stopWriting = False
 
 
@@ -15,56 +33,373 @@ def receiveSignal(number, frame):
     return
 
 
-signal.signal(signal.SIGTERM, receiveSignal)
+def print_progress(written, total):
+    # MainWindow parses "written total" lines
+    print("{} {}".format(written, total))
+    sys.stdout.flush()
 
-filepath = sys.argv[1]
-drive = sys.argv[2]
-# Unmount the drive before writing on it
-subprocess.run(["umount", "{}1".format(drive)])
 
-bufferSize = 4096
-writtenBytes = 0
-totalFileBytes = os.path.getsize(filepath)
+class BlockReader(threading.Thread):
+    """
+    Reads the source in fixed size blocks ahead of the writer.
+    Buffers are anonymous mmaps so they are page aligned for O_DIRECT, and they are
+    recycled through the free queue, so memory use is (QUEUE_DEPTH + 2) blocks.
+    Blocks are hashed here too, so hashing runs while the previous block is written.
+    """
+
+    def __init__(self, fd, block_size, depth=QUEUE_DEPTH, hasher=None, block_digests=None):
+        super().__init__(daemon=True)
+        self.fd = fd
+        self.block_size = block_size
+        self.hasher = hasher
+        self.block_digests = block_digests
+        self.stopped = False
+        self.free = queue.Queue()
+        self.filled = queue.Queue(maxsize=depth)
+        for _ in range(depth + 2):
+            self.free.put(mmap.mmap(-1, block_size))
+
+    def run(self):
+        try:
+            while not self.stopped:
+                buf = self.free.get()
+                view = memoryview(buf)
+                n = 0
+                while n < self.block_size:
+                    count = os.readv(self.fd, [view[n:]])
+                    if count == 0:
+                        break
+                    n += count
+
+                if n:
+                    if self.hasher:
+                        self.hasher.update(view[:n])
+                    if self.block_digests is not None:
+                        self.block_digests.append(block_digest(view[:n]))
+                view.release()
+
+                self.filled.put((buf, n))
+                if n < self.block_size:  # EOF
+                    return
+        except OSError as e:
+            self.filled.put((None, e))
+
+    def stop(self):
+        self.stopped = True
+        # unblock the reader if it waits for a free buffer
+        while True:
+            try:
+                buf, _ = self.filled.get_nowait()
+            except queue.Empty:
+                break
+            if buf is not None:
+                self.free.put(buf)
+        self.join(1)
+
+
+def block_digest(data):
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+def set_direct(fd, enabled):
+    flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+    if enabled:
+        flags |= os.O_DIRECT
+    else:
+        flags &= ~os.O_DIRECT
+    fcntl.fcntl(fd, fcntl.F_SETFL, flags)
+
+
+def open_target(drive, direct=False):
+    flags = os.O_WRONLY
+    if not os.path.exists(drive) or not stat.S_ISBLK(os.stat(drive).st_mode):
+        flags |= os.O_CREAT
+
+    if direct:
+        try:
+            return os.open(drive, flags | os.O_DIRECT, 0o644), True
+        except OSError as e:
+            # e.g. tmpfs does not support O_DIRECT
+            sys.stderr.write("O_DIRECT is not available on {}: {}\n".format(drive, e))
+
+    return os.open(drive, flags, 0o644), False
+
+
+def write_all(fd, buf, length):
+    view = memoryview(buf)
+    n = 0
+    try:
+        while n < length:
+            n += os.write(fd, view[n:length])
+    finally:
+        view.release()
+
+
+def write_image(filepath, drive, block_size=DEFAULT_BLOCK_SIZE * MiB, direct=False, progress=print_progress,
+                hasher=None, block_digests=None):
+    """
+    Copies filepath to drive, reading the next blocks in a thread while the current one is written.
+    The whole source is fed to hasher and a digest of every block is appended to block_digests if they are given.
+    Returns the number of bytes written.
+    """
+    totalFileBytes = os.path.getsize(filepath)
+    writtenBytes = 0
+    syncedBytes = 0
+    lastProgress = 0
+
+    readFd = os.open(filepath, os.O_RDONLY)
+    writeFd, direct = open_target(drive, direct)
+    os.posix_fadvise(readFd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+
+    reader = BlockReader(readFd, block_size, hasher=hasher, block_digests=block_digests)
+    reader.start()
+
+    progress(0, totalFileBytes)
+    try:
+        while not stopWriting:
+            buf, n = reader.filled.get()
+            if buf is None:
+                raise n
+
+            if n:
+                # the last block of an image may not be a whole number of sectors
+                if direct and n % DIRECT_ALIGNMENT:
+                    set_direct(writeFd, False)
+                    direct = False
+
+                write_all(writeFd, buf, n)
+                writtenBytes += n
+
+            reader.free.put(buf)
+
+            if not direct and writtenBytes - syncedBytes >= SYNC_INTERVAL:
+                os.fdatasync(writeFd)
+                syncedBytes = writtenBytes
+
+            now = time.monotonic()
+            if now - lastProgress >= PROGRESS_INTERVAL:
+                lastProgress = now
+                progress(writtenBytes, totalFileBytes)
+
+            if n < block_size:
+                break
 
-readFile = open(filepath, "rb")
-writeFile = open(drive, "wb")
-try:
-    i = 0
-    oldMB = 0
-    readBytes = readFile.read(bufferSize)
-    print("0 {}".format(totalFileBytes))
-    sys.stdout.flush()
-    while readBytes:
-        i += 1
         if stopWriting:
             sys.stderr.write("---Writing stopped---\n")
-            break
+        else:
+            os.fsync(writeFd)
+    finally:
+        reader.stop()
+        os.close(writeFd)
+        os.close(readFd)
+
+    progress(writtenBytes, totalFileBytes)
+    return writtenBytes
+
+
+def print_verify_progress(verified, total):
+    print("VERIFIED:{}:{}".format(verified, total))
+    sys.stdout.flush()
+
+
+def find_first_mismatch(filepath, offset, data):
+    with open(filepath, "rb") as f:
+        f.seek(offset)
+        expected = f.read(len(data))
+
+    step = 4096
+    for start in range(0, len(data), step):
+        if expected[start:start + step] != data[start:start + step]:
+            for i in range(start, min(start + step, len(data))):
+                if i >= len(expected) or expected[i] != data[i]:
+                    return offset + i
+    return offset + len(expected)
+
+
+def verify_image(filepath, drive, totalFileBytes, block_digests, block_size=DEFAULT_BLOCK_SIZE * MiB,
+                 progress=print_verify_progress):
+    """
+    Reads the written range of drive back and compares it with the digests taken from the source while writing.
+    Only the source block which differs is read again to find the exact offset.
+    Returns the offset of the first mismatching byte or None.
+    """
+    verifiedBytes = 0
+    lastProgress = 0
+    buf = mmap.mmap(-1, block_size)
+    view = memoryview(buf)
+
+    readFd = os.open(drive, os.O_RDONLY)
+    try:
+        # the blocks that were just written are still in the page cache, read them from the device
+        os.posix_fadvise(readFd, 0, totalFileBytes, os.POSIX_FADV_DONTNEED)
+        os.posix_fadvise(readFd, 0, totalFileBytes, os.POSIX_FADV_SEQUENTIAL)
+
+        progress(0, totalFileBytes)
+        for digest in block_digests:
+            if stopWriting:
+                sys.stderr.write("---Verifying stopped---\n")
+                return None
+
+            length = min(block_size, totalFileBytes - verifiedBytes)
+            n = 0
+            while n < length:
+                count = os.preadv(readFd, [view[n:length]], verifiedBytes + n)
+                if count == 0:
+                    break
+                n += count
+
+            if n < length or block_digest(view[:length]) != digest:
+                return find_first_mismatch(filepath, verifiedBytes, bytes(view[:n]))
+
+            verifiedBytes += length
+            # keep the cache clean behind the reader as well
+            os.posix_fadvise(readFd, verifiedBytes - length, length, os.POSIX_FADV_DONTNEED)
+
+            now = time.monotonic()
+            if now - lastProgress >= PROGRESS_INTERVAL:
+                lastProgress = now
+                progress(verifiedBytes, totalFileBytes)
+    finally:
+        os.close(readFd)
+        view.release()
+        buf.close()
+
+    progress(verifiedBytes, totalFileBytes)
+    return None
+
+
+def read_sha256sum(sidecar, filepath):
+    """
+    Returns the hash of filepath from a sha256sum file: "<hash>  <name>" lines, or only "<hash>".
+    """
+    filename = os.path.basename(filepath)
+    hashes = []
+    with open(sidecar, "r", errors="replace") as f:
+        for line in f:
+            parts = line.split(None, 1)
+            if not parts or len(parts[0]) != 64:
+                continue
+            name = parts[1].strip().lstrip("*") if len(parts) > 1 else ""
+            if os.path.basename(name) == filename:
+                return parts[0].lower()
+            hashes.append(parts[0].lower())
+
+    # a sidecar for a single file may name it differently, e.g. after a download
+    if len(hashes) == 1:
+        return hashes[0]
+    return None
+
 
-        writeFile.write(readBytes)
-        readBytes = readFile.read(bufferSize)
-        writtenBytes += bufferSize
+def benchmark(target=None, size=512, block_sizes=(1, 4, 8, 16, 32), direct=False):
+    """
+    Writes a size MiB random image to target with every block size and reports MB/s.
+    target can be a loop device (losetup -f --show disk.img) or a file; a sparse file
+    next to the image is used when it is not given.
+    """
+    import tempfile
 
-        newMB = int(writtenBytes / 1000 / 1000 / 10)
-        if oldMB != newMB:  # print on every 10MB
-            oldMB = newMB
-            print("{} {}".format(writtenBytes, totalFileBytes))
+    workdir = tempfile.mkdtemp(prefix="image-writer-benchmark-", dir="/var/tmp")
+    source = os.path.join(workdir, "source.img")
+    sparse = target is None
+    if sparse:
+        target = os.path.join(workdir, "target.img")
+
+    try:
+        with open(source, "wb") as f:
+            for _ in range(size):
+                f.write(os.urandom(MiB))
+
+        print("{} MiB image -> {}{}".format(size, target, " (O_DIRECT)" if direct else ""))
+        for block_size in block_sizes:
+            if sparse:
+                with open(target, "wb") as f:
+                    f.truncate(size * MiB)
+
+            # drop the source from the page cache so every run reads it from disk
+            with open(source, "rb") as f:
+                os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+
+            start = time.monotonic()
+            written = write_image(source, target, block_size * MiB, direct, progress=lambda w, t: None)
+            elapsed = time.monotonic() - start
+            print("bs={:>3}M  {:8.1f} MB/s".format(block_size, written / elapsed / 1000 / 1000))
+    finally:
+        for name in os.listdir(workdir):
+            os.remove(os.path.join(workdir, name))
+        os.rmdir(workdir)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("filepath", nargs="?")
+    parser.add_argument("drive", nargs="?")
+    # MainWindow passes the windows flag of ISOCopier.py to every writer, it has no meaning here
+    parser.add_argument("is_windows", nargs="?")
+    parser.add_argument("--block-size", type=int, default=DEFAULT_BLOCK_SIZE, help="block size in MiB")
+    parser.add_argument("--direct", action="store_true", help="open the drive with O_DIRECT")
+    parser.add_argument("--verify", action="store_true", help="read the drive back and compare it with the image")
+    parser.add_argument("--sha256sum", help="sha256sum file of the image, <image>.sha256sum is used if it exists")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="write a test image to [drive] (a sparse file if not given) with each block size")
+    parser.add_argument("--size", type=int, default=512, help="benchmark image size in MiB")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.drive or args.filepath, args.size, direct=args.direct)
+        exit(0)
+
+    if not args.filepath or not args.drive:
+        parser.print_usage(sys.stderr)
+        exit(1)
+
+    signal.signal(signal.SIGTERM, receiveSignal)
+
+    filepath = args.filepath
+    drive = args.drive
+    # Unmount the drive before writing on it
+    subprocess.run(["umount", "{}1".format(drive)])
+
+    sidecar = args.sha256sum
+    if not sidecar and os.path.isfile(filepath + ".sha256sum"):
+        sidecar = filepath + ".sha256sum"
+
+    expectedHash = None
+    if sidecar:
+        try:
+            expectedHash = read_sha256sum(sidecar, filepath)
+        except OSError as e:
+            sys.stderr.write("{}\n".format(e))
+        if not expectedHash:
+            sys.stderr.write("No hash for {} in {}\n".format(filepath, sidecar))
+
+    hasher = hashlib.sha256() if expectedHash else None
+    block_digests = [] if args.verify else None
+    block_size = args.block_size * MiB
+
+    try:
+        writtenBytes = write_image(filepath, drive, block_size, args.direct,
+                                   hasher=hasher, block_digests=block_digests)
+
+        if hasher and not stopWriting and hasher.hexdigest() != expectedHash:
+            print("CHECKSUM_MISMATCH:{}:{}".format(expectedHash, hasher.hexdigest()))
             sys.stdout.flush()
+            exit(3)
+
+        if args.verify and not stopWriting:
+            mismatch = verify_image(filepath, drive, writtenBytes, block_digests, block_size)
+            if mismatch is not None:
+                print("MISMATCH:{}".format(mismatch))
+                sys.stdout.flush()
+                exit(2)
+    except (IOError, OSError) as e:
+        sys.stderr.write("{}\n".format(e))
+        exit(1)
 
-        if i % 5000 == 0:  # sync regularly
-            os.fdatasync(writeFile)
+    time.sleep(1)
+    subprocess.call(["eject", drive])
 
-    if not stopWriting:
-        writeFile.flush()
-except IOError:
-    exit(1)
-else:
-    if not stopWriting:
-        os.fsync(writeFile)
-    readFile.close()
-    writeFile.close()
+    exit(0)
 
-print("{} {}".format(totalFileBytes, totalFileBytes))
-time.sleep(1)
-subprocess.call(["eject", drive])
 
-exit(0)
+if __name__ == "__main__":
+    main()
@@ -82,6 +82,7 @@ class MainWindow:
         self.is_gui_locked = False
         self.second_tick_count = 0
         self.write_mode = WriteMode.DD
+        self.verify_error = None
 
     def define_components(self):
         def UI(obj):
@@ -99,6 +100,7 @@ class MainWindow:
         self.btn_start = UI("btn_start")
         self.pb_writing_progress = UI("pb_writing_progress")
         self.stack_write_modes = UI("stack_write_modes")
+        self.cb_verify = UI("cb_verify")
 
         # Integrity
         self.cb_checkIntegrity = UI("cb_checkIntegrity")
@@ -153,6 +155,7 @@ class MainWindow:
         self.cmb_devices.set_sensitive(False)
         self.cb_checkIntegrity.set_sensitive(False)
         self.cmb_modes.set_sensitive(False)
+        self.cb_verify.set_sensitive(False)
 
         self.stack_buttons.set_visible_child_name("cancel")
         self.is_gui_locked = True
@@ -162,6 +165,7 @@ class MainWindow:
         self.cmb_devices.set_sensitive(True)
         self.cb_checkIntegrity.set_sensitive(True)
         self.cmb_modes.set_sensitive(True)
+        self.cb_verify.set_sensitive(self.write_mode == WriteMode.DD)
 
         self.stack_buttons.set_visible_child_name("start")
         self.is_gui_locked = False
@@ -216,6 +220,7 @@ class MainWindow:
             self.cb_checkIntegrity.set_sensitive(False)
             self.stack_write_modes.set_visible_child_name("img_mode")
             self.write_mode = WriteMode.DD
+            self.cb_verify.set_sensitive(True)
         else:
             self.cb_checkIntegrity.set_sensitive(True)
             self.stack_write_modes.set_visible_child_name("iso_mode")
@@ -226,6 +231,7 @@ class MainWindow:
         self.written_bytes = 0  # for ISOCopier.py percentage calculation
         self.written_tmp_bytes = 0
         self.total_bytes = 1  # for ISOCopier.py percentage calculation
+        self.verify_error = None
 
         self.lock_gui()
         is_windows = "false"
@@ -240,15 +246,17 @@ class MainWindow:
             script_path += "/ISOCopier.py"
             is_windows = "true"
 
-        self.spawn_process(
-            [
-                "pkexec",
-                script_path,
-                self.iso_file_path,
-                "/dev/" + self.usb_device[0],
-                is_windows,
-            ]
-        )
+        params = [
+            "pkexec",
+            script_path,
+            self.iso_file_path,
+            "/dev/" + self.usb_device[0],
+            is_windows,
+        ]
+        if self.write_mode == WriteMode.DD and self.cb_verify.get_active():
+            params.append("--verify")
+
+        self.spawn_process(params)
         self.pb_writing_progress.set_text(_("Creating partitions..."))
 
     def prepare_image_writing(self):
@@ -420,6 +428,7 @@ class MainWindow:
 
         model = combobox.get_model()
         self.write_mode = WriteMode(model[tree_iter][0])  # 0:DD, 1:Iso, 2:Win ISO
+        self.cb_verify.set_sensitive(self.write_mode == WriteMode.DD)
 
         # ISO Mode grub packages control
         if self.write_mode == WriteMode.ISO or self.write_mode == WriteMode.WINDOWS_ISO:
@@ -467,7 +476,32 @@ class MainWindow:
 
         line = source.readline().strip()
 
-        if self.write_mode == WriteMode.DD:
+        if self.write_mode == WriteMode.DD and line[0:9] == "VERIFIED:":  # VERIFIED:10:20
+            values = line.split(":")
+            verified = int(values[1])
+            total = int(values[2])
+            percent = 0
+            if total > 0:
+                percent = verified / total
+
+            self.pb_writing_progress.set_text(
+                "{} {}MB / {}MB (%{:.1f})".format(
+                    _("Verifying..."),
+                    round(verified / 1000 / 1000),
+                    round(total / 1000 / 1000),
+                    int(percent * 1000) / 10,
+                )
+            )
+            self.pb_writing_progress.set_fraction(percent)
+        elif self.write_mode == WriteMode.DD and line[0:9] == "MISMATCH:":  # MISMATCH:1234756
+            self.verify_error = _(
+                "The data on the USB disk differs from the file at byte {}."
+            ).format(int(line.split(":")[-1]))
+        elif self.write_mode == WriteMode.DD and line[0:18] == "CHECKSUM_MISMATCH:":
+            self.verify_error = _(
+                "The file does not match the checksum in its .sha256sum file."
+            )
+        elif self.write_mode == WriteMode.DD:
             written, total = line.split()
             written = int(written)
             total = int(total)
@@ -539,12 +573,15 @@ class MainWindow:
             self.pb_writing_progress.set_text(_("Error!"))
             self.pb_writing_progress.set_fraction(0)
 
-            self.show_message(
-                _("An error occured while writing the file to the disk."),
-                _(
-                    "Please make sure the USB device is connected properly and try again."
-                ),
-            )
+            if self.verify_error:
+                self.show_message(_("Verification failed."), self.verify_error)
+            else:
+                self.show_message(
+                    _("An error occured while writing the file to the disk."),
+                    _(
+                        "Please make sure the USB device is connected properly and try again."
+                    ),
+                )
         else:
             self.pb_writing_progress.set_text()
             self.pb_writing_progress.set_fraction(0)
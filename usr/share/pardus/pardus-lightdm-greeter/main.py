@@ -3,6 +3,7 @@ import os
 import sys
 import time
 import subprocess
+import importlib.machinery
 from util import *
 
 import traceback
@@ -73,33 +74,91 @@ def set_scale(new_scale=0):
 
 set_scale(float(get("scale", "0")))
 
-loaded_modules = []
+# Modules are run in this namespace, they share their globals with each other.
+# Their bytecode is cached under the lightdm home, the source tree is not writable.
+module_cache_dir = "{}/.cache/pardus-lightdm-greeter/pycache".format(
+    os.environ["HOME"])
+# Loaded first, in this order
 base_modules = ["lightdm.py", "gtkwindow.py", "monitor.py"]
-for module in base_modules + os.listdir("module"):
+# Not needed to type a password, loaded after the main window is presented
+deferred_modules = ["network.py", "notes.py",
+                    "keyboard.py", "qrlogin.py", "reset.py"]
+loaded_modules = []
+module_times = []
+
+
+def compile_module(path):
+    """Return the code object of a module, from the bytecode cache if it is up to date"""
+    loader = importlib.machinery.SourceFileLoader(
+        "greeter_" + os.path.basename(path)[:-3], path)
+    prefix = sys.pycache_prefix
+    sys.pycache_prefix = module_cache_dir
+    try:
+        return loader.get_code(loader.name)
+    finally:
+        sys.pycache_prefix = prefix
+
+
+def timed_init(module, init):
+    start = time.time()
+    try:
+        init()
+    except Exception as e:
+        print(module, traceback.format_exc(), file=sys.stderr)
+    module_times.append((module, "init", time.time() - start))
+    return False
+
+
+def load_module(module, async_init=False):
+    global module_init
     if module in loaded_modules:
-        continue
-    if not os.path.isfile("module/{}".format(module)) or not module.endswith(".py"):
-        continue
-    with open("module/{}".format(module), "r") as f:
-        debug("Loading:{}".format(module))
-        try:
-            exec(f.read())
-            if get("load-async", False):
-                if module in base_modules:
-                    module_init()
-                else:
-                    GLib.idle_add(module_init)
-            else:
-                module_init()
-            del (module_init)
-        except Exception as e:
-            print(module, traceback.format_exc(), file=sys.stderr)
-        loaded_modules.append(module)
+        return
+    loaded_modules.append(module)
+    path = "{}/module/{}".format(appdir, module)
+    if not os.path.isfile(path) or not module.endswith(".py"):
+        return
+    debug("Loading:{}".format(module))
+    start = time.time()
+    try:
+        exec(compile_module(path), globals())
+        init = module_init
+        del (module_init)
+    except Exception as e:
+        print(module, traceback.format_exc(), file=sys.stderr)
+        return
+    module_times.append((module, "load", time.time() - start))
+    if async_init:
+        GLib.idle_add(timed_init, module, init)
+    else:
+        timed_init(module, init)
+
+
+def report_module_times(title):
+    debug("{}: {:.3f}s".format(title, time.time() - ctime))
+    for module, step, duration in module_times:
+        debug("  {:<16} {:<4} {:.3f}s".format(module, step, duration))
+    module_times.clear()
+
+
+def load_deferred_modules():
+    # one module per main loop iteration, so the window stays responsive
+    if len(deferred_modules) > 0:
+        load_module(deferred_modules.pop(0))
+        return True
+    report_module_times("Deferred modules loaded")
+    return False
+
+
+for module in base_modules:
+    load_module(module)
+for module in os.listdir("module"):
+    if module not in deferred_modules:
+        load_module(module, get("load-async", False))
 loginwindow.greeter_loaded = True
-ltime = time.time()
 os.chdir(os.environ["HOME"])
-debug("Loading finished: {}".format(ltime-ctime))
+report_module_times("Loading finished")
 loginwindow.o("ui_window_main").show()
 loginwindow.o("ui_window_main").present()
+GLib.idle_add(load_deferred_modules)
 
 Gtk.main()
@@ -29,16 +29,27 @@ if blur_available and get("background-blur", False, "gtkwindow"):
                                               (mode == "RGBA"), 8, w, h, w * len(mode))
         return pix
 
+    blur_level = int(get("background-blur-level", "15", "gtkwindow"))
+
     def blur_draw(px):
         if px:
             im = pixbuf2image(px)
-            im = im.filter(ImageFilter.GaussianBlur(
-                int(get("background-blur-level", "15", "gtkwindow"))))
+            # A blurred image has no detail to lose, so blur a smaller copy
+            # with a smaller radius and scale it back up.
+            factor = max(1, blur_level // 4)
+            if factor > 1:
+                size = im.size
+                im = im.reduce(factor)
+                im = im.filter(ImageFilter.GaussianBlur(blur_level / factor))
+                im = im.resize(size, Image.BILINEAR)
+            else:
+                im = im.filter(ImageFilter.GaussianBlur(blur_level))
             px = image2pixbuf(im)
         return px
 
     def module_init():
         loginwindow.background_handler = blur_draw
+        loginwindow.background_handler_id = "blur-{}".format(blur_level)
         loginwindow.update_user_background()
 else:
     def module_init():
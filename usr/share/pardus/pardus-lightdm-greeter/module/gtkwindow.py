@@ -1,4 +1,16 @@
 import hashlib
+import struct
+import zlib
+
+# Rendered backgrounds are stored as zlib compressed pixels so they can be drawn without decoding
+BACKGROUND_CACHE_DIR = "{}/.cache/pardus-lightdm-greeter/backgrounds".format(
+    os.environ["HOME"])
+BACKGROUND_CACHE_HEADER = struct.Struct("<4sIII?")
+BACKGROUND_CACHE_MAGIC = b"PLGZ"
+BACKGROUND_CACHE_BYTES = 32 * 1024 * 1024
+RECENT_USERS_FILE = "{}/.cache/pardus-lightdm-greeter/recent-users".format(
+    os.environ["HOME"])
+RECENT_USERS = 8
 
 ############### class definition ###############
 
@@ -26,6 +38,12 @@ class LoginWindow:
         self.background_pixbuf = None
         self.ignore_password_cache = False
         self.background_handler = None
+        # Set with background_handler, part of the render cache key. Renders are not cached without it.
+        self.background_handler_id = None
+        self.background_key = None
+        # the last rendered background, as (key, pixbuf)
+        self.__background_cache = (None, None)
+        self.__background_lock = threading.Lock()
 
     def __connect_signals(self):
         def block_delete(*args):
@@ -176,6 +194,8 @@ class LoginWindow:
         if get("username-cache", True, "gtkwindow"):
             gsettings_set("last-username", lightdm.get_username())
 
+        self.add_recent_user(lightdm.get_username())
+
         busdir = "/var/lib/lightdm/"
         if os.path.exists("/{}/pardus-greeter".format(busdir)):
             os.unlink("/{}/pardus-greeter".format(busdir))
@@ -340,29 +360,156 @@ class LoginWindow:
 
         th.start()
 
-    def set_background(self, bg=None):
+    def get_background_path(self, bg=None):
         if bg is None or not os.path.isfile(bg):
             bg = appdir+"/data/bg-light.png"
             if get("dark-theme", True):
                 bg = appdir+"/data/bg-dark.png"
             if os.path.exists("/etc/alternatives/desktop-theme/login/background.svg"):
                 bg = "/etc/alternatives/desktop-theme/login/background.svg"
-        if os.path.isfile(bg):
-            try:
-                py = GdkPixbuf.Pixbuf.new_from_file(bg)
-                px = None
-                if self.width > 0:
-                    px = py.scale_simple(
-                        self.width, self.height, GdkPixbuf.InterpType.BILINEAR)
-                if px is not None and self.background_pixbuf != px:
-                    self.background_pixbuf = px
-            except Exception as e:
-                print(traceback.format_exc(), file=sys.stderr)
+        return bg
+
+    def get_background_key(self, bg):
+        try:
+            st = os.stat(bg)
+        except OSError:
+            return None
+        if self.background_handler is not None and self.background_handler_id is None:
+            return None
+        return (bg, st.st_mtime_ns, st.st_size, self.width, self.height, scale,
+                self.background_handler_id)
+
+    def load_background_cache(self, key):
+        with self.__background_lock:
+            if self.__background_cache[0] == key:
+                return self.__background_cache[1]
+        path = "{}/{}".format(BACKGROUND_CACHE_DIR,
+                              hashlib.sha1(repr(key).encode("utf-8")).hexdigest())
+        try:
+            with open(path, "rb") as f:
+                magic, w, h, rowstride, has_alpha = BACKGROUND_CACHE_HEADER.unpack(
+                    f.read(BACKGROUND_CACHE_HEADER.size))
+                if magic != BACKGROUND_CACHE_MAGIC:
+                    return None
+                data = zlib.decompress(f.read())
+            if len(data) < rowstride * h:
+                return None
+            px = GdkPixbuf.Pixbuf.new_from_bytes(GLib.Bytes.new(data), GdkPixbuf.Colorspace.RGB,
+                                                 has_alpha, 8, w, h, rowstride)
+            # keep recently used renders from being pruned
+            os.utime(path)
+        except (OSError, struct.error, zlib.error, GLib.Error):
+            return None
+        return px
+
+    def remember_background(self, key, px):
+        with self.__background_lock:
+            self.__background_cache = (key, px)
+
+    def save_background_cache(self, key, px):
+        name = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+        try:
+            os.makedirs(BACKGROUND_CACHE_DIR, exist_ok=True)
+            # renders are saved from several threads, each writer gets its own temporary file
+            tmp = "{}/.{}.{}.{}.tmp".format(BACKGROUND_CACHE_DIR, name, os.getpid(), threading.get_ident())
+            with open(tmp, "wb") as f:
+                f.write(BACKGROUND_CACHE_HEADER.pack(BACKGROUND_CACHE_MAGIC, px.get_width(), px.get_height(),
+                                                     px.get_rowstride(), px.get_has_alpha()))
+                # fast compression, blurred and photo backgrounds still shrink well
+                f.write(zlib.compress(px.get_pixels(), 1))
+            os.replace(tmp, "{}/{}".format(BACKGROUND_CACHE_DIR, name))
+            # prune the least recently used renders beyond the size limit
+            files = sorted(((entry.stat().st_mtime, entry.stat().st_size, entry.path)
+                            for entry in os.scandir(BACKGROUND_CACHE_DIR) if not entry.name.startswith(".")),
+                           reverse=True)
+            total = 0
+            for _mtime, size, path in files:
+                total += size
+                if total > BACKGROUND_CACHE_BYTES:
+                    try:
+                        os.unlink(path)
+                    except FileNotFoundError:
+                        # already pruned by another thread
+                        pass
+        except OSError:
+            print(traceback.format_exc(), file=sys.stderr)
+
+    def render_background(self, bg=None, remember=True):
+        """Return (key, pixbuf) of the background at screen size, from the cache if possible.
+        Only the remembered render is kept in memory."""
+        bg = self.get_background_path(bg)
+        if self.width <= 0 or not os.path.isfile(bg):
+            return None, None
+        key = self.get_background_key(bg)
+        if key is not None:
+            px = self.load_background_cache(key)
+            if px is not None:
+                if remember:
+                    self.remember_background(key, px)
+                return key, px
+        try:
+            # decode at screen size, jpeg and svg loaders do not build the full image
+            px = GdkPixbuf.Pixbuf.new_from_file_at_scale(
+                bg, self.width, self.height, False)
+        except Exception as e:
+            print(traceback.format_exc(), file=sys.stderr)
+            return None, None
         if self.background_handler is not None:
-            self.background_pixbuf = self.background_handler(
-                self.background_pixbuf)
+            px = self.background_handler(px)
+        if key is not None and px is not None:
+            self.save_background_cache(key, px)
+            if remember:
+                self.remember_background(key, px)
+        return key, px
+
+    def set_background(self, bg=None):
+        key, px = self.render_background(bg)
+        if px is None:
+            return
+        if key is not None and key == self.background_key:
+            # already on the screen
+            return
+        self.background_key = key
+        self.background_pixbuf = px
         GLib.idle_add(self.draw_background)
 
+    def add_recent_user(self, username):
+        users = [username] + [u for u in self.get_recent_users() if u != username]
+        try:
+            os.makedirs(os.path.dirname(RECENT_USERS_FILE), exist_ok=True)
+            with open(RECENT_USERS_FILE, "w") as f:
+                f.write("\n".join(users[:RECENT_USERS]))
+        except OSError:
+            print(traceback.format_exc(), file=sys.stderr)
+
+    def get_recent_users(self):
+        try:
+            with open(RECENT_USERS_FILE, "r") as f:
+                return [u for u in f.read().split("\n") if u]
+        except OSError:
+            return []
+
+    def prewarm_backgrounds(self):
+        """Render backgrounds of recently used users in the background, so switching to them is instant"""
+        if get("background", "user", "gtkwindow") != "user":
+            backgrounds = [get("background", "user", "gtkwindow")]
+        else:
+            backgrounds = [None]
+            userlist = LightDM.UserList.get_instance()
+            for username in self.get_recent_users():
+                u = userlist.get_user_by_name(username)
+                if u is not None and u.get_background() not in backgrounds:
+                    backgrounds.append(u.get_background())
+
+        def prewarm():
+            for bg in backgrounds:
+                # only fill the disk cache, do not replace the background on screen in memory
+                self.render_background(bg, remember=False)
+            debug("Background cache ready: {}".format(len(backgrounds)))
+
+        threading.Thread(target=prewarm, daemon=True).start()
+        return False
+
     def draw_background(self):
         if self.image_status:
             self.o("ui_image_2").set_from_pixbuf(self.background_pixbuf)
@@ -437,6 +584,7 @@ class LoginWindow:
         self.o("ui_window_main").fullscreen()
         self.o("ui_window_main").set_resizable(False)
         self.background_pixbuf = None
+        self.background_key = None
         if "user" == get("background", "user", "gtkwindow"):
             self.update_user_background()
         else:
@@ -494,3 +642,5 @@ def module_init():
     loginwindow.set_logo(get("logo", "", "gtkwindow"))
     # load css
     loginwindow.load_css()
+    # fill the background cache after the greeter is ready
+    GLib.timeout_add_seconds(3, loginwindow.prewarm_backgrounds)
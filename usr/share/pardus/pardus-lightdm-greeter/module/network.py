@@ -1,10 +1,22 @@
 import asyncio
+import socket
 from wifi import widget as wifi_widget
 
 
+# rtnetlink multicast groups: RTMGRP_LINK | RTMGRP_IPV4_IFADDR
+NETLINK_GROUPS = 0x1 | 0x10
+# Link and address changes come in bursts, they are read together after this delay
+NETWORK_EVENT_DELAY_MS = 200
+
+# (cable available, ((ip, dev), ...)), kept up to date by the netlink watcher
+network_state = None
+# last WAN IP read when the popover was opened, shown with the local IPs while connected
+wan_ip = None
+_netlink_socket = None
+_network_event_pending = 0
+
+
 def _network_button_event(widget=None):
-    global network_label_text
-    network_label_text = _("Loading...")
     loginwindow.o("ui_popover_network").popup()
     network_control_event()
 
@@ -29,50 +41,131 @@ def is_net_available():
     return len(ip_list) > 0
 
 
-def update_network_icon():
-    if not is_cable_available():
-        GLib.idle_add(loginwindow.o("ui_icon_network").set_from_icon_name, "network-error-symbolic", Gtk.IconSize.DND)
-    elif not is_net_available():
-        GLib.idle_add(loginwindow.o("ui_icon_network").set_from_icon_name, "network-offline-symbolic", Gtk.IconSize.DND)
+def read_network_state():
+    cable = is_cable_available()
+    ip_list = ()
+    if cable:
+        ip_list = tuple(get_local_ip())
+    return (cable, ip_list)
+
+
+def get_network_text(state):
+    cable, ip_list = state
+    if not cable:
+        return _("No network connection")
+    elif len(ip_list) == 0:
+        return _("Network is not available")
+    # Calculate line length
+    i = 0
+    for ip, dev in ip_list:
+        j = len(ip) + len(dev) + 3
+        if j > i:
+            i = j
+
+    lan_ip = ""
+    for ip, dev in ip_list:
+        j = len(ip) + len(dev) + 2
+        lan_ip += "- {} {}{}\n".format(dev, " "*(i-j), ip)
+    return _("Local IP:\n{}").format(lan_ip).strip()
+
+
+def set_network_label():
+    """Show the local IPs and the last known WAN IP, runs in the main loop"""
+    cable, ip_list = network_state
+    ctx = get_network_text(network_state)
+    if wan_ip is not None and cable and len(ip_list) > 0:
+        ctx += "\n" + _("WAN IP:\n- {}").format(wan_ip)
+    loginwindow.o("ui_label_network").set_text(ctx.strip())
+    return False
+
+
+def apply_network_state(state):
+    """Update the icon and the popover label if the state changed, runs in the main loop"""
+    global network_state
+    if state == network_state:
+        return False
+    network_state = state
+    cable, ip_list = state
+    if not cable:
+        icon = "network-error-symbolic"
+    elif len(ip_list) == 0:
+        icon = "network-offline-symbolic"
     else:
-        GLib.idle_add(loginwindow.o("ui_icon_network").set_from_icon_name, "network-transmit-receive-symbolic", Gtk.IconSize.DND)
+        icon = "network-transmit-receive-symbolic"
+    loginwindow.o("ui_icon_network").set_from_icon_name(icon, Gtk.IconSize.DND)
+    set_network_label()
+    return False
+
+
+def update_network_icon():
+    GLib.idle_add(apply_network_state, read_network_state())
 
 @asynchronous
 def update_network_icon_loop():
+    # Used only when netlink is not available
     while True:
         update_network_icon()
-        # Check every second. TODO: remove this and trace changes
         time.sleep(1)
 
 
+def _network_event_delayed():
+    global _network_event_pending
+    _network_event_pending = 0
+    apply_network_state(read_network_state())
+    return False
+
+
+def _netlink_event(source, condition):
+    global _network_event_pending
+    # the messages are not parsed, any of them means the state must be read again
+    try:
+        while True:
+            _netlink_socket.recv(65536)
+    except BlockingIOError:
+        pass
+    except OSError as e:
+        print("netlink: {}".format(e), file=sys.stderr)
+    if not _network_event_pending:
+        _network_event_pending = GLib.timeout_add(
+            NETWORK_EVENT_DELAY_MS, _network_event_delayed)
+    return True
+
+
+def watch_network():
+    """Follow link and address changes with rtnetlink instead of polling"""
+    global _netlink_socket
+    try:
+        _netlink_socket = socket.socket(
+            socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+        _netlink_socket.bind((0, NETLINK_GROUPS))
+        _netlink_socket.setblocking(False)
+    except OSError as e:
+        print("netlink is not available: {}".format(e), file=sys.stderr)
+        _netlink_socket = None
+        return False
+    GLib.io_add_watch(_netlink_socket.fileno(), GLib.PRIORITY_DEFAULT,
+                      GLib.IO_IN, _netlink_event)
+    return True
+
+
 @asynchronous
 def network_control_event():
-    network_label_text = ""
-    lan_ip = ""
-    update_network_icon()
-    ip_list = get_local_ip()
-    if not is_cable_available():
-        GLib.idle_add(loginwindow.o("ui_label_network").set_text,  _("No network connection"))
+    if _netlink_socket is None:
+        # nothing keeps the state fresh
+        update_network_icon()
+    if not get("show-wan-ip", False, "network"):
         return
-    elif len(ip_list) == 0:
-        GLib.idle_add(loginwindow.o("ui_label_network").set_text,  _("Network is not available"))
+    state = network_state or read_network_state()
+    if not state[0] or len(state[1]) == 0:
         return
-    # Calculate line length
-    i = 0
-    for ip, dev in ip_list:
-        j = len(ip) + len(dev) + 3
-        if j > i:
-            i = j
+    ip = get_ip()
 
-    for ip, dev in ip_list:
-        j = len(ip) + len(dev) + 2
-        lan_ip += "- {} {}{}\n".format(dev, " "*(i-j), ip)
-    ctx = _("Local IP:\n{}").format(lan_ip)
-    if get("show-wan-ip", False, "network"):
-        wan_ip = get_ip()
-        ctx += _("WAN IP:\n- {}").format(wan_ip)
-    network_label_text = ctx.strip()
-    GLib.idle_add(loginwindow.o("ui_label_network").set_text, network_label_text)
+    def show_wan_ip():
+        global wan_ip
+        wan_ip = ip
+        return set_network_label()
+
+    GLib.idle_add(show_wan_ip)
 
 
 wmenu = None
@@ -86,10 +179,9 @@ def module_init():
         return
     loginwindow.o("ui_button_network").connect(
         "clicked", _network_button_event)
-    if get("network-check-loop", False, "network"):
+    apply_network_state(read_network_state())
+    if not watch_network() and get("network-check-loop", False, "network"):
         update_network_icon_loop()
-    else:
-        update_network_icon()
     if not wifi_widget.wifi.available():
         loginwindow.o("ui_button_wifi").hide()
     else:
@@ -1,68 +1,122 @@
-users = {}
+import bisect
+import importlib.util
+import pwd
+
+# passwd index shared with eta-usb-login, loaded by path so its directory does not shadow greeter imports
+passwdindex = None
+try:
+    _spec = importlib.util.spec_from_file_location(
+        "passwdindex", "/usr/share/eta/eta-usb-login/passwdindex.py")
+    passwdindex = importlib.util.module_from_spec(_spec)
+    _spec.loader.exec_module(passwdindex)
+except Exception:
+    passwdindex = None
+
+
+def get_realname(username):
+    if passwdindex is not None:
+        return passwdindex.get_realname(username)
+    try:
+        realname = pwd.getpwnam(username).pw_gecos.split(",")[0]
+    except KeyError:
+        realname = ""
+    if realname == "":
+        realname = username
+    return realname
+
+
+# Turkish letters are folded so that "ı", "i", "I" and "İ" match each other and
+# "ogretmen" finds "Öğretmen".
+_USERLIST_FOLD_TABLE = str.maketrans({"İ": "i", "I": "i", "ı": "i", "Ş": "s", "ş": "s", "Ğ": "g", "ğ": "g",
+                                      "Ç": "c", "ç": "c", "Ö": "o", "ö": "o", "Ü": "u", "ü": "u"})
+
+
+def _fold_text(text):
+    return text.translate(_USERLIST_FOLD_TABLE).casefold()
+
+
+class userListModel:
+    """
+    Users of the popover in a filtered list store. A GtkTreeView draws only the visible rows,
+    so the list does not create widgets per user. Hidden users never enter the store.
+    Search is a prefix lookup in a sorted list of (token, username) over usernames and realnames.
+    """
+
+    def __init__(self):
+        # username, label
+        self.store = Gtk.ListStore(str, str)
+        self.filter = self.store.filter_new()
+        self.filter.set_visible_func(self.__visible_func)
+        self.usernames = set()
+        self.index = []
+        self.matches = None
+
+    def __visible_func(self, model, it, data=None):
+        return self.matches is None or model[it][0] in self.matches
+
+    def __tokens(self, username, realname):
+        tokens = {_fold_text(username)}
+        tokens.update(_fold_text(word) for word in realname.split())
+        return tokens
+
+    def add(self, username):
+        if username in self.usernames:
+            return
+        realname = get_realname(username)
+        label = username
+        if get("show-realname", True, "userlist"):
+            label = realname
+        self.usernames.add(username)
+        self.store.append([username, label])
+        for token in self.__tokens(username, realname):
+            bisect.insort(self.index, (token, username))
+
+    def remove(self, username):
+        if username not in self.usernames:
+            return
+        self.usernames.discard(username)
+        for row in self.store:
+            if row[0] == username:
+                self.store.remove(row.iter)
+                break
+        self.index = [item for item in self.index if item[1] != username]
 
+    def search(self, text):
+        query = _fold_text(text.strip())
+        if query == "":
+            self.matches = None
+        else:
+            self.matches = set()
+            i = bisect.bisect_left(self.index, (query,))
+            while i < len(self.index) and self.index[i][0].startswith(query):
+                self.matches.add(self.index[i][1])
+                i += 1
+        self.filter.refilter()
 
-class userButton(Gtk.Box):
-    def __init__(self, username):
-        super().__init__(orientation=Gtk.Orientation.HORIZONTAL)
-        ubut = Gtk.Button()
-        self.label = Gtk.Label()
-        box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL)
+    def __len__(self):
+        return len(self.usernames)
 
-        self.username = username
-        ubut.username = username
 
-        ubut.set_can_focus(False)
-        ubut.get_style_context().add_class("icon")
-        ubut.set_relief(Gtk.ReliefStyle.NONE)
-        ubut.connect("clicked", user_button_event)
+user_model = None
+USERLIST_COLUMN_HIDE = 1
 
-        if get("show-realname", True, "userlist"):
-            self.label.set_text(self.get_realname())
-        else:
-            self.label.set_text(username)
-
-        box.pack_start(self.label, False, False, 0)
-        ubut.add(box)
-        self.pack_start(ubut, True, True, 0)
-
-        self.show_all()
-        if get("user-hide-button", True, "userlist"):
-            delbut = Gtk.Button()
-            delbut.get_style_context().add_class("icon")
-            delbut.set_can_focus(False)
-            delbut.set_relief(Gtk.ReliefStyle.NONE)
-            delbut.connect("clicked", self.delete_button_event)
-            img = Gtk.Image()
-            img.set_from_icon_name("list-remove-symbolic", 0)
-            img.set_pixel_size(12*scale)
-            delbut.set_image(img)
-            self.pack_end(delbut, False, False, 0)
-
-    def get_realname(self):
-        p = open("/etc/passwd", "r")
-        realname = ""
-        for line in p.read().split("\n"):
-            if line.startswith(self.username+":"):
-                realname = line.split(":")[4]
-                break
-        if "," in realname:
-            realname = realname.split(",")[0]
-        if realname == "":
-            realname = self.username
-        p.close()
-        return realname
-
-    def delete_button_event(self, widget):
-        self.hide()
-        hidden = gsettings_get("hidden-users")
-        log(str(hidden))
-        if self.username not in hidden.split("\n"):
-            gsettings_set("hidden-users", hidden +
-                          "\n{}".format(self.username))
-
-
-def user_button_event(widget):
-    username = widget.username
+
+def get_hidden_users():
+    return get("hidden-users", "root", "userlist").split(" ") + \
+        gsettings_get("hidden-users").split("\n")
+
+
+def hide_user(username):
+    user_model.remove(username)
+    hidden = gsettings_get("hidden-users")
+    log(str(hidden))
+    if username not in hidden.split("\n"):
+        gsettings_set("hidden-users", hidden +
+                      "\n{}".format(username))
+    _update_search_entry()
+
+
+def select_user(username):
     loginwindow.o("ui_entry_search_user").set_text("")
     loginwindow.o("ui_popover_userlist").popdown()
     loginwindow.o("ui_stack_username").set_visible_child_name("show")
@@ -71,52 +125,108 @@ def user_button_event(widget):
     loginwindow.update_username_button(username)
 
 
+def _user_row_activated(treeview, path, column):
+    username = treeview.get_model()[path][0]
+    if treeview.get_column(USERLIST_COLUMN_HIDE) == column:
+        hide_user(username)
+    else:
+        select_user(username)
+
+
 def show_userlist(widget):
     load_userlist()
     loginwindow.o("ui_popover_userlist").popup()
 
 
 def _user_search_event(widget):
-    text = widget.get_text()
-    for user in users:
-        if text in user:
-            users[user].show_all()
-        else:
-            users[user].hide()
+    user_model.search(widget.get_text())
 
 
 def _clear_user_search(widget, icon_pos, event):
     widget.set_text("")
 
 
+def _update_search_entry():
+    if len(user_model) < 3:
+        loginwindow.o("ui_entry_search_user").hide()
+    else:
+        loginwindow.o("ui_entry_search_user").show()
+
+
+def _user_added_event(userlist, user):
+    # lightdm.get_user_list is cached, drop it so is_valid_user sees the change too
+    cached_result.pop("get_user_list", None)
+    if user.get_uid() < 1000 or user.get_name() in get_hidden_users():
+        return
+    user_model.add(user.get_name())
+    _update_search_entry()
+
+
+def _user_removed_event(userlist, user):
+    cached_result.pop("get_user_list", None)
+    user_model.remove(user.get_name())
+    _update_search_entry()
+
+
+def _create_user_treeview():
+    treeview = Gtk.TreeView(model=user_model.filter)
+    treeview.set_headers_visible(False)
+    treeview.set_enable_search(False)
+    treeview.set_can_focus(False)
+    treeview.set_activate_on_single_click(True)
+    treeview.get_selection().set_mode(Gtk.SelectionMode.NONE)
+    treeview.set_fixed_height_mode(True)
+
+    renderer = Gtk.CellRendererText()
+    renderer.set_property("ypad", 6*scale)
+    column = Gtk.TreeViewColumn("", renderer, text=1)
+    column.set_sizing(Gtk.TreeViewColumnSizing.FIXED)
+    column.set_expand(True)
+    treeview.append_column(column)
+
+    if get("user-hide-button", True, "userlist"):
+        renderer = Gtk.CellRendererPixbuf()
+        renderer.set_property("icon-name", "list-remove-symbolic")
+        renderer.set_property("xpad", 6*scale)
+        column = Gtk.TreeViewColumn("", renderer)
+        column.set_sizing(Gtk.TreeViewColumnSizing.FIXED)
+        column.set_fixed_width(24*scale)
+        treeview.append_column(column)
+
+    treeview.connect("row-activated", _user_row_activated)
+    return treeview
+
+
 _userlist_loaded = False
 
 
 def load_userlist():
     global _userlist_loaded
+    global user_model
     if _userlist_loaded:
         return
     _userlist_loaded = True
-    hidden_users = get("hidden-users", "root", "userlist").split(" ") + \
-        gsettings_get("hidden-users").split("\n")
+    user_model = userListModel()
+    hidden_users = get_hidden_users()
     for user in lightdm.get_user_list():
         user = user.get_name()
         if user in hidden_users:
             continue
-        users[user] = userButton(user)
-        loginwindow.o("ui_box_userlist").add(users[user])
+        user_model.add(user)
+    loginwindow.o("ui_box_userlist").pack_start(
+        _create_user_treeview(), True, True, 0)
     loginwindow.o("ui_box_userlist").show_all()
-    if len(users) < 3:
-        loginwindow.o("ui_entry_search_user").hide()
-    else:
-        loginwindow.o("ui_entry_search_user").connect(
-            "icon-press", _clear_user_search)
-        loginwindow.o("ui_entry_search_user").connect(
-            "changed", _user_search_event)
+    loginwindow.o("ui_entry_search_user").connect(
+        "icon-press", _clear_user_search)
+    loginwindow.o("ui_entry_search_user").connect(
+        "changed", _user_search_event)
+    _update_search_entry()
+    userlist = LightDM.UserList.get_instance()
+    userlist.connect("user-added", _user_added_event)
+    userlist.connect("user-removed", _user_removed_event)
 
 
 def module_init():
-    global users
     if not get("enabled", True, "userlist"):
         loginwindow.o("ui_button_userselect").hide()
         loginwindow.o("ui_button_username").get_style_context(
@@ -1,34 +1,72 @@
+import os
 import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
+from gi.repository import Gio, GLib
 
-def get_file_info(file, network=False):
-    values = None
-    command = ["df", file, "--block-size=1000", "-T"]
+UDISKS2 = "org.freedesktop.UDisks2"
+UDISKS2_PATH = "/org/freedesktop/UDisks2"
+
+# dev path -> {"uuid": "", "fstype": ""}, filled from one UDisks2 GetManagedObjects call
+# and dropped when UDisks2 reports added or removed interfaces. It is only kept once
+# watch_udisks() has subscribed to those signals from the main thread.
+_udisks_bus = None
+_udisks_blocks = None
+
+# Network mount stats are read in a worker pool, the last known values are kept for unreachable mounts
+_stats_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="diskstats")
+_stats_cache = {}
+# file -> {"callback": latest callback, "timeout": timeout source id, None once it has fired}
+_stats_pending = {}
+
+# fstab is parsed once and reloaded when its mtime changes
+_fstab_mtime = None
+_fstab_specs = set()
+
+
+def _unescape_mount_path(path):
+    # /proc/self/mountinfo escapes space, tab, newline and backslash as octal
+    return path.replace("\\040", " ").replace("\\011", "\t").replace("\\012", "\n").replace("\\134", "\\")
+
+
+def get_mount_of_path(file):
+    # Returns (device, fstype, mountpoint) of the mount containing the file, like df does
+    path = os.path.realpath(file)
+    found = None
+    try:
+        with open("/proc/self/mountinfo") as f:
+            for line in f:
+                fields = line.split()
+                separator = fields.index("-")
+                mountpoint = _unescape_mount_path(fields[4])
+                if path == mountpoint or path.startswith(mountpoint.rstrip("/") + "/"):
+                    # the last matching mount is the one on top
+                    if found is None or len(mountpoint) >= len(found[2]):
+                        found = (_unescape_mount_path(fields[separator + 2]), fields[separator + 1], mountpoint)
+    except Exception as e:
+        print("get_mount_of_path error: {}".format(e))
+    return found
 
-    if network:
-        try:
-            process = subprocess.check_output(command, timeout=1)
-        except subprocess.TimeoutExpired:
-            print("timeout error on {}".format(file))
-            return None
-        except subprocess.CalledProcessError:
-            print("CalledProcessError error on {}".format(file))
-            return None
-    else:
-        try:
-            process = subprocess.check_output(command)
-        except Exception as e:
-            print("get_file_info subprocess error: {}".format(file))
-            return None
 
-    lines = process.decode().splitlines()
+def _statvfs(file, result):
+    try:
+        result.append(os.statvfs(file))
+    except Exception as e:
+        print("statvfs error on {}: {}".format(file, e))
 
-    if len(lines) > 1:
-        data = lines[1].split()
-        if len(data) > 6:
-            values = data[0], data[1], data[2], data[3], data[4], data[6]
-        else:
-            values = None
+
+def _read_file_info(file, stat):
+    values = None
+
+    mount = get_mount_of_path(file)
+    if mount is not None:
+        # same 1000 byte blocks as "df --block-size=1000", rounded up like df
+        total_kb = -(-stat.f_blocks * stat.f_frsize // 1000)
+        usage_kb = -(-(stat.f_blocks - stat.f_bfree) * stat.f_frsize // 1000)
+        free_kb = -(-stat.f_bavail * stat.f_frsize // 1000)
+        values = mount[0], mount[1], total_kb, usage_kb, free_kb, mount[2]
 
     if values is not None:
         keys = ["device", "fstype", "total_kb", "usage_kb", "free_kb", "mountpoint"]
@@ -48,26 +86,198 @@ def get_file_info(file, network=False):
     return obj
 
 
+def get_file_info(file, network=False):
+    if network:
+        # a dead network share can block statvfs, so it is called in a thread with a timeout
+        result = []
+        thread = threading.Thread(target=_statvfs, args=(file, result,), daemon=True)
+        thread.start()
+        thread.join(1)
+        if thread.is_alive():
+            print("timeout error on {}".format(file))
+            return None
+        if not result:
+            return None
+        stat = result[0]
+    else:
+        try:
+            stat = os.statvfs(file)
+        except Exception as e:
+            print("get_file_info statvfs error: {}".format(file))
+            return None
+
+    return _read_file_info(file, stat)
+
+
+def get_file_info_async(file, callback, network=False, timeout=1):
+    """
+    Calls callback(file, info) in the GLib main loop. Local mounts are answered at once.
+    Network mounts are read in the worker pool. If a mount does not answer in timeout seconds
+    the last known info is passed with info["stale"] = True (or None if there is none yet),
+    and the callback is called again when the mount answers.
+    While a read of the mount is in flight only the latest callback is kept.
+    """
+    if not network:
+        info = get_file_info(file)
+        if info is not None:
+            info["stale"] = False
+        callback(file, info)
+        return
+
+    # only one read per mount at a time, a hanging mount does not take more workers on every refresh
+    pending = _stats_pending.get(file)
+    if pending is None:
+        _stats_pending[file] = {"callback": callback,
+                                "timeout": GLib.timeout_add(int(timeout * 1000), _on_stats_timeout, file)}
+        _stats_pool.submit(_stats_worker, file)
+        return
+
+    # the newest request replaces the older one, its row may already be destroyed
+    pending["callback"] = callback
+    if pending["timeout"] is None:
+        # the read has already timed out, show the last known value at once
+        callback(file, _get_stale_file_info(file))
+
+
+def _get_stale_file_info(file):
+    info = _stats_cache.get(file)
+    if info is None:
+        return None
+    info = dict(info)
+    info["stale"] = True
+    return info
+
+
+def _stats_worker(file):
+    result = []
+    _statvfs(file, result)
+    info = _read_file_info(file, result[0]) if result else None
+    GLib.idle_add(_on_stats_done, file, info)
+
+
+def _on_stats_done(file, info):
+    if info is not None:
+        info["stale"] = False
+        info["time"] = time.time()
+        _stats_cache[file] = info
+    else:
+        info = _get_stale_file_info(file)
+
+    pending = _stats_pending.pop(file, None)
+    if pending is not None:
+        if pending["timeout"] is not None:
+            GLib.source_remove(pending["timeout"])
+        pending["callback"](file, info)
+
+    return False
+
+
+def _on_stats_timeout(file):
+    pending = _stats_pending.get(file)
+    if pending is not None:
+        pending["timeout"] = None
+        print("timeout error on {}, showing last known value".format(file))
+        pending["callback"](file, _get_stale_file_info(file))
+
+    return False
+
+
+def _on_udisks_interfaces_changed(connection, sender, path, interface, signal, parameters):
+    global _udisks_blocks
+    _udisks_blocks = None
+
+
+def watch_udisks():
+    """
+    Subscribes to UDisks2 added and removed interfaces, so the block list can be cached.
+    Must be called from the main thread: the signals are delivered to the main context of
+    the thread that subscribes, and disk info is also read from worker threads.
+    """
+    global _udisks_bus
+
+    if _udisks_bus is not None:
+        return
+
+    try:
+        bus = Gio.bus_get_sync(Gio.BusType.SYSTEM, None)
+        for signal in ["InterfacesAdded", "InterfacesRemoved"]:
+            bus.signal_subscribe(UDISKS2, "org.freedesktop.DBus.ObjectManager", signal, UDISKS2_PATH,
+                                 None, Gio.DBusSignalFlags.NONE, _on_udisks_interfaces_changed)
+    except Exception as e:
+        print("UDisks2 signal subscribe error: {}".format(e))
+        return
+
+    _udisks_bus = bus
+
+
+def _get_udisks_blocks():
+    global _udisks_blocks
+
+    if _udisks_blocks is not None:
+        return _udisks_blocks
+
+    try:
+        bus = _udisks_bus or Gio.bus_get_sync(Gio.BusType.SYSTEM, None)
+        objects = bus.call_sync(UDISKS2, UDISKS2_PATH, "org.freedesktop.DBus.ObjectManager",
+                                "GetManagedObjects", None, GLib.VariantType("(a{oa{sa{sv}}})"),
+                                Gio.DBusCallFlags.NONE, -1, None).unpack()[0]
+    except Exception as e:
+        print("UDisks2 GetManagedObjects error: {}".format(e))
+        return {}
+
+    blocks = {}
+    for interfaces in objects.values():
+        block = interfaces.get("org.freedesktop.UDisks2.Block")
+        if block is None:
+            continue
+        info = {"uuid": block.get("IdUUID", ""), "fstype": block.get("IdType", "")}
+        for key in ["Device", "PreferredDevice"]:
+            # device paths are null terminated byte strings
+            device = bytes(block.get(key, [])).rstrip(b"\0").decode("utf-8", "replace")
+            if device:
+                blocks[device] = info
+
+    # without the signals there is nothing to tell when the list is out of date
+    if _udisks_bus is not None:
+        _udisks_blocks = blocks
+    return blocks
+
+
 def get_uuid_from_dev(dev_path):
-    process = subprocess.run(f"lsblk -o PATH,UUID --raw | grep {dev_path}", shell=True, capture_output=True)
+    return _get_udisks_blocks().get(dev_path, {}).get("uuid", "")
 
-    if process.returncode != 0:
-        return ""
 
-    uuid = process.stdout.decode("utf-8").strip().split(" ")[1]
-    return uuid
+def _get_fstab_specs():
+    global _fstab_mtime, _fstab_specs
 
+    try:
+        mtime = os.stat("/etc/fstab").st_mtime_ns
+    except OSError:
+        return set()
 
-def is_drive_automounted(dev_path):
-    uuid = get_uuid_from_dev(dev_path)
+    if mtime != _fstab_mtime:
+        specs = set()
+        with open("/etc/fstab") as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    specs.add(line.split()[0])
+        _fstab_mtime = mtime
+        _fstab_specs = specs
+
+    return _fstab_specs
 
-    process = subprocess.run(f'grep -E "{dev_path}|{uuid}" /etc/fstab | grep -v -E "#.*({dev_path}|{uuid})"',
-                             shell=True, capture_output=True)
 
-    if process.returncode != 0:
-        return False
+def is_drive_automounted(dev_path):
+    specs = _get_fstab_specs()
+    if dev_path in specs:
+        return True
+
+    uuid = get_uuid_from_dev(dev_path)
+    if uuid and ("UUID={}".format(uuid) in specs or "/dev/disk/by-uuid/{}".format(uuid) in specs):
+        return True
 
-    return True
+    return False
 
 
 def set_automounted(dev_path, value):
@@ -87,13 +297,10 @@ def set_automounted(dev_path, value):
 
 
 def get_filesystem_of_partition(partition_path):
-    process = subprocess.run(f'lsblk -o TYPE,PATH,FSTYPE -r | grep " {partition_path} "', shell=True,
-                             capture_output=True)
-
-    output = process.stdout.decode("utf-8").strip()
-    if output == "":
+    fstype = _get_udisks_blocks().get(partition_path, {}).get("fstype", "")
+    if fstype == "":
         return "-"
-    return output.split(" ")[2]
+    return fstype
 
 # import subprocess, threading
 #
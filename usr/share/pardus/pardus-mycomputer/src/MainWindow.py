@@ -50,6 +50,9 @@ class MainWindow:
         # Set application:
         self.application = application
 
+        # cache the UDisks2 block list, its invalidation signals are delivered to the main thread
+        DiskManager.watch_udisks()
+
         # Global Definings
         self.defineComponents()
         self.defineVariables()
@@ -979,8 +982,6 @@ class MainWindow:
         if gm != None and not isinstance(vl, str):
 
             mount_point = gm.get_root().get_path()
-            file_info = DiskManager.get_file_info(mount_point,
-                                                  network=True if row_volume._main_type == "network" else False)
 
             if row_volume._main_type == "network":
                 display_name = vl.get_name()
@@ -989,26 +990,11 @@ class MainWindow:
                 if display_name == "":
                     display_name = vl.get_name()
 
-            if file_info is not None:
-
-                free_kb = int(file_info['free_kb'])
-                total_kb = int(file_info['total_kb'])
-
-                # Show values on UI
-                row_volume._lbl_volume_name.set_markup(
-                    f'<b>{GLib.markup_escape_text(display_name, -1)}</b>'
-                    f'<span size="small">( {GLib.markup_escape_text(mount_point, -1)} )</span>')
-                row_volume._lbl_volume_size_info.set_markup(
-                    "<span size='small'><b>{:.2f} GB</b> {} {:.2f} GB</span>".format(
-                        free_kb / 1000 / 1000, _("is free of"), total_kb / 1000 / 1000))
-                row_volume._pb_volume_size.set_fraction(file_info["usage_percent"])
-
-                # if volume usage >= 0.9 then add destructive color
-                try:
-                    if file_info["usage_percent"] >= 0.9:
-                        row_volume._pb_volume_size.get_style_context().add_class("pardus-mycomputer-progress-90")
-                except Exception as e:
-                    print("progress css exception: {}".format(e))
+            # network mounts are read in the background, so an unreachable share can not block the window
+            DiskManager.get_file_info_async(
+                mount_point,
+                lambda file, file_info: self.setVolumeSizes(row_volume, display_name, mount_point, file_info),
+                network=True if row_volume._main_type == "network" else False)
 
             if row_volume._stack_mount.get_child_by_name("unmount"):
                 row_volume._stack_mount.get_child_by_name("unmount").show()
@@ -1024,6 +1010,32 @@ class MainWindow:
             # name = vl if isinstance(vl, str) else vl.get_name()
             # print(f"can't mount the volume: {name}")
 
+    def setVolumeSizes(self, row_volume, display_name, mount_point, file_info):
+        if file_info is not None:
+
+            free_kb = int(file_info['free_kb'])
+            total_kb = int(file_info['total_kb'])
+
+            # Show values on UI
+            row_volume._lbl_volume_name.set_markup(
+                f'<b>{GLib.markup_escape_text(display_name, -1)}</b>'
+                f'<span size="small">( {GLib.markup_escape_text(mount_point, -1)} )</span>')
+            row_volume._lbl_volume_size_info.set_markup(
+                "<span size='small'><b>{:.2f} GB</b> {} {:.2f} GB</span>".format(
+                    free_kb / 1000 / 1000, _("is free of"), total_kb / 1000 / 1000))
+            row_volume._pb_volume_size.set_fraction(file_info["usage_percent"])
+
+            # last known values of a share that is not answering are shown dimmed
+            row_volume._lbl_volume_size_info.set_sensitive(not file_info.get("stale", False))
+            row_volume._pb_volume_size.set_sensitive(not file_info.get("stale", False))
+
+            # if volume usage >= 0.9 then add destructive color
+            try:
+                if file_info["usage_percent"] >= 0.9:
+                    row_volume._pb_volume_size.get_style_context().add_class("pardus-mycomputer-progress-90")
+            except Exception as e:
+                print("progress css exception: {}".format(e))
+
     def tryMountVolume(self, row_volume):
         vl = row_volume._volume
         if not vl.can_mount() and vl.get_mount() == None:
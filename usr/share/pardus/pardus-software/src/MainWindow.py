@@ -42,6 +42,7 @@ from AppDetail import AppDetail
 from AppRequest import AppRequest
 from GnomeComment import GnomeComment
 from PardusComment import PardusComment
+from SearchIndex import SearchIndex
 from UserSettings import UserSettings
 from Utils import Utils
 from Logger import Logger
@@ -50,6 +51,7 @@ from Logger import Logger
 class MainWindow(object):
     def __init__(self, application):
         self.Application = application
+        self.start_time = time.time()
 
         self.Logger = Logger(__name__)
 
@@ -65,6 +67,8 @@ class MainWindow(object):
         self.applist = []
         self.catlist = []
 
+        self.SearchIndex = SearchIndex()
+
         self.locale = self.getLocale()
         self.Logger.info("{}".format(self.locale))
 
@@ -118,6 +122,9 @@ class MainWindow(object):
 
         self.isPardusSearching = False
         self.isRepoSearching = False
+        self.reposearch_id = 0
+        self.reposearch_text = None
+        self.searchstore = Gtk.ListStore(bool, str, str, str)
 
         self.RepoCategoryListBox = self.GtkBuilder.get_object("RepoCategoryListBox")
 
@@ -798,6 +805,7 @@ class MainWindow(object):
         if self.UserSettings.config_udt:
             Gtk.Settings.get_default().props.gtk_application_prefer_dark_theme = True
 
+        self.first_paint_id = self.MainWindow.connect("draw", self.on_MainWindow_first_draw)
         self.MainWindow.show_all()
 
         self.hide_some_widgets()
@@ -807,6 +815,11 @@ class MainWindow(object):
         p1.start()
         self.Logger.info("start done")
 
+    def on_MainWindow_first_draw(self, widget, cr):
+        self.MainWindow.disconnect(self.first_paint_id)
+        self.Logger.info("time to first paint: {:.3f}s".format(time.time() - self.start_time))
+        return False
+
     def getMac(self):
         mac = ""
         try:
@@ -966,11 +979,7 @@ class MainWindow(object):
                             app = "{}".format(self.Application.args["details"].split(".desktop")[0])
                         self.repo_searchentry.set_text(app)
                         self.on_repo_button_clicked(None)
-                        self.on_repo_searchbutton_clicked(self.repo_searchbutton)
-                        for row in self.searchstore:
-                            if app == row[1]:
-                                self.RepoAppsTreeView.set_cursor(row.path)
-                                # self.on_RepoAppsTreeView_row_activated(self.RepoAppsTreeView, row.path, 0)
+                        self.repo_search(app, select=app)
             except Exception as e:
                 self.Logger.exception("{}".format(e))
 
@@ -1057,9 +1066,12 @@ class MainWindow(object):
             GLib.idle_add(self.updates_button.set_sensitive, False)
 
         self.Logger.info("page setted to normal")
+        self.Logger.info("time to store ready: {:.3f}s (package snapshot: {})".format(
+            time.time() - self.start_time, self.Package.snapshot_loaded))
 
     def package(self):
         GLib.idle_add(self.splashlabel.set_markup, "<b>{}</b>".format(_("Updating Cache")))
+        start = time.time()
         self.Package = Package()
         if self.Package.updatecache():
             self.isbroken = False
@@ -1068,7 +1080,8 @@ class MainWindow(object):
             self.isbroken = True
             self.Logger.warning("Error while updating Cache")
 
-        self.Logger.info("package completed")
+        self.Logger.info("package completed in {:.3f}s (snapshot: {})".format(
+            time.time() - start, self.Package.snapshot_loaded))
 
     def utils(self):
         self.Utils = Utils()
@@ -1331,6 +1344,7 @@ class MainWindow(object):
                 self.status_serverapps = True
                 self.applist = sorted(response["app-list"], key=lambda x: locale.strxfrm(x["prettyname"][self.locale]))
                 self.fullapplist = self.applist
+                self.Logger.info("search index built in {:.3f}s".format(self.SearchIndex.build(self.fullapplist)))
             elif type == "cats":
                 self.Logger.info("server cats successful")
                 self.status_servercats = True
@@ -2519,11 +2533,7 @@ class MainWindow(object):
             if not found_pardusapp:
                 self.repo_searchentry.set_text(self.appname)
                 self.on_repo_button_clicked(self.repo_button)
-                self.on_repo_searchbutton_clicked(self.repo_searchbutton)
-                for row in self.searchstore:
-                    if self.appname == row[1]:
-                        self.RepoAppsTreeView.set_cursor(row.path)
-                        # self.on_RepoAppsTreeView_row_activated(self.RepoAppsTreeView, row.path, 0)
+                self.repo_search(self.appname, select=self.appname)
                 return False
 
             GLib.idle_add(self.homestack.set_visible_child_name, "pardusappsdetail")
@@ -3959,17 +3969,7 @@ class MainWindow(object):
                 else:
                     return not self.Package.isinstalled(app_name)
 
-        search_entry_text = self.pardus_searchentry.get_text()
-        categorynumber = int(model[iteration][2])
-        category = list(model[iteration][4].split(","))
-        subcategory = list(model[iteration][5].split(","))
-        # category = model[iteration][4]
         appname = model[iteration][1]
-        # showinstalled = self.pardusicb.get_active()
-        pn_en = ""
-        pn_tr = ""
-        desc_en = ""
-        desc_tr = ""
 
         showall = True
         showinstalled = None
@@ -3985,34 +3985,25 @@ class MainWindow(object):
             showinstalled = False
 
         if self.isPardusSearching:
-            for i in self.applist:
-                if i["name"] == appname:
-                    pn_en = i["prettyname"]["en"]
-                    pn_tr = i["prettyname"]["tr"]
-                    desc_en = i["description"]["en"]
-                    desc_tr = i["description"]["tr"]
-            if search_entry_text.lower() in appname.lower() or search_entry_text.lower() in pn_en.lower() \
-                    or search_entry_text.lower() in pn_tr.lower() or search_entry_text.lower() in desc_en.lower() \
-                    or search_entry_text.lower() in desc_tr.lower():
+            # search results are computed once per query text by the index, not once per row
+            if appname in self.SearchIndex.search(self.pardus_searchentry.get_text()):
                 return control_show_filter(showall, showinstalled, appname)
         else:
             if self.PardusCurrentCategorySubCats and self.PardusCurrentCategoryExternal:
-                for i in self.applist:
-                    if i["name"] == appname:
-                        if i["external"]:
-                            if i["external"]["reponame"] == self.externalreponame:
-                                return control_show_filter(showall, showinstalled, appname)
+                if self.SearchIndex.in_external(appname, self.externalreponame):
+                    return control_show_filter(showall, showinstalled, appname)
             else:
                 if self.PardusCurrentCategoryString == "all" or self.PardusCurrentCategoryString == "tümü":
                     return control_show_filter(showall, showinstalled, appname)
                 else:
-                    if self.PardusCurrentCategoryString in category:
-                        if self.SubCatCombo.get_active_text() is not None:
-                            if self.SubCatCombo.get_active_text().lower() == "all" or self.SubCatCombo.get_active_text().lower() == "tümü":
+                    if self.SearchIndex.in_category(appname, self.PardusCurrentCategoryString):
+                        subcategory = self.SubCatCombo.get_active_text()
+                        if subcategory is not None:
+                            if subcategory.lower() == "all" or subcategory.lower() == "tümü":
                                 return control_show_filter(showall, showinstalled, appname)
                             else:
                                 if self.PardusCurrentCategorySubCategories:
-                                    if self.SubCatCombo.get_active_text().lower() in subcategory:
+                                    if self.SearchIndex.in_subcategory(appname, subcategory):
                                         return control_show_filter(showall, showinstalled, appname)
                         else:
                             return control_show_filter(showall, showinstalled, appname)
@@ -4989,35 +4980,57 @@ class MainWindow(object):
         self.set_app_count_label()
 
     def on_repo_searchbutton_clicked(self, button):
-        self.isRepoSearching = True
-        reposearch_list_tmp = []
-        self.reposearch_list = []
-        text = self.repo_searchentry.get_text()
-
-        self.searchstore = Gtk.ListStore(bool, str, str, str)
-
-        for i in self.Package.apps:
-            if text in i["name"]:
-                reposearch_list_tmp.append({"name": i["name"], "category": i["category"]})
-
-        for t in reposearch_list_tmp:
-            if t["name"].startswith(text):
-                self.reposearch_list.append({"name": t["name"], "category": t["category"]})
+        self.repo_search(self.repo_searchentry.get_text())
 
-        for tt in reposearch_list_tmp:
-            self.reposearch_list.append({"name": tt["name"], "category": tt["category"]})
+    def on_repo_searchentry_search_changed(self, entry_search):
+        text = entry_search.get_text()
+        if text != "" and text != self.reposearch_text:
+            self.repo_search(text)
 
-        self.reposearch_list = list({v["name"]: v for v in self.reposearch_list}.values())
-
-        for package in self.reposearch_list:
-            installstatus = self.Package.isinstalled(package["name"])
-            self.searchstore.append(
-                [installstatus, package["name"], package["category"], self.Package.summary(package["name"])])
+    def repo_search(self, text, select=None):
+        self.isRepoSearching = True
+        # a newer search makes the results of the running one stale
+        self.reposearch_id += 1
+        self.reposearch_text = text
 
+        self.searchstore = Gtk.ListStore(bool, str, str, str)
         self.RepoAppsTreeView.set_model(self.searchstore)
         self.RepoAppsTreeView.set_search_column(1)
         self.RepoAppsTreeView.show_all()
 
+        # the name tables are taken here, a cache reload replaces them on the main thread
+        apps = (self.Package.app_names, self.Package.app_sections)
+        reposearchthread = threading.Thread(target=self.repo_search_worker_thread,
+                                            args=(self.reposearch_id, text, select, apps,), daemon=True)
+        reposearchthread.start()
+
+    def repo_search_worker_thread(self, search_id, text, select, apps):
+        batch = []
+        for name, section in self.Package.search_apps(text, apps):
+            if search_id != self.reposearch_id:
+                return
+            # installed states and summaries are read from the apt cache, which must not be reloaded meanwhile
+            with self.Package.cache_lock:
+                row = [self.Package.isinstalled(name), name, section, self.Package.summary(name)]
+            batch.append(row)
+            if len(batch) == 250:
+                GLib.idle_add(self.on_repo_search_worker_batch, search_id, batch, None)
+                batch = []
+        GLib.idle_add(self.on_repo_search_worker_batch, search_id, batch, select)
+
+    def on_repo_search_worker_batch(self, search_id, batch, select):
+        if search_id != self.reposearch_id:
+            return False
+        for row in batch:
+            self.searchstore.append(row)
+        if select is not None:
+            for row in self.searchstore:
+                if select == row[1]:
+                    self.RepoAppsTreeView.set_cursor(row.path)
+                    # self.on_RepoAppsTreeView_row_activated(self.RepoAppsTreeView, row.path, 0)
+                    break
+        return False
+
     def repoapps_selection_changed(self, path):
         self.repoappclicked = True
         self.fromrepoapps = True
@@ -5398,11 +5411,7 @@ class MainWindow(object):
         app = "python3-matplotlib"
         self.repo_searchentry.set_text(app)
         self.on_repo_button_clicked(None)
-        self.on_repo_searchbutton_clicked(self.repo_searchbutton)
-        for row in self.searchstore:
-            if app == row[1]:
-                self.RepoAppsTreeView.set_cursor(row.path)
-                # self.on_RepoAppsTreeView_row_activated(self.RepoAppsTreeView, row.path, 0)
+        self.repo_search(app, select=app)
 
     def on_menu_about_clicked(self, button):
         self.PopoverMenu.popdown()
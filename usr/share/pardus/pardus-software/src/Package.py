@@ -6,11 +6,16 @@ Created on Fri Sep 18 14:53:00 2020
 @author: fatih
 """
 
+import bisect
+import glob
 import locale
+import marshal
 import os
 import re
 import subprocess
+import threading
 import time
+from pathlib import Path
 
 import apt
 import apt_pkg
@@ -19,32 +24,171 @@ from gi.repository import Gio, GLib
 from Logger import Logger
 
 
+class PackageState(object):
+    __slots__ = ("installed", "candidate", "summary")
+
+    def __init__(self, installed, candidate):
+        self.installed = installed
+        self.candidate = candidate
+        # summaries need a package record lookup, so they are filled on first use
+        self.summary = None
+
+
 class Package(object):
     def __init__(self):
         self.apps = []
+        self.app_names = []
+        self.app_sections = []
         self.secs = []
         self.sections = []
         self.update_cache_error_msg = ""
+        self.states = {}
+        self.states_stamp = None
+        self.scanned = None
+        self.scanned_cache = None
+        self.scanned_stamp = None
+        self.snapshot_version = 1
+        self.snapshot_loaded = False
+        self.cachedir = "{}/pardus-software/".format(GLib.get_user_cache_dir())
+        if not Path(self.cachedir).exists():
+            self.cachedir = "{}/pardus/pardus-software/".format(GLib.get_user_cache_dir())
+        self.snapshotfile = "packages.snapshot"
+        # held while the apt cache is replaced or the package states are rebuilt,
+        # threads reading the cache outside of the main loop hold it too
+        self.cache_lock = threading.RLock()
         self.Logger = Logger(__name__)
 
     def updatecache(self):
+        with self.cache_lock:
+            try:
+                self.cache = apt.Cache()
+                self.cache.open()
+            except:
+                return False
+            if self.cache.broken_count > 0:
+                return False
+            self.update_states()
+            return True
+
+    def get_states_stamp(self):
+        # installed states, candidates and sections only change when dpkg status or the package lists change
+        stamp = []
+        for state_file in ["/var/lib/dpkg/status"] + sorted(glob.glob("/var/lib/apt/lists/*_Packages")):
+            try:
+                stat = os.stat(state_file)
+                stamp.append((state_file, stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                stamp.append((state_file, None, None))
+        return tuple(stamp)
+
+    def update_states(self):
+        # keep the previous tables if nothing is changed, and try the on-disk snapshot before walking the cache
+        stamp = self.get_states_stamp()
+        if self.states and stamp == self.states_stamp:
+            return
+        start = time.time()
+        if self.load_snapshot(stamp):
+            self.Logger.info("package snapshot loaded in {:.3f}s ({} packages)".format(
+                time.time() - start, len(self.states)))
+            return
+        states = {}
+        apps = []
         try:
-            self.cache = apt.Cache()
-            self.cache.open()
-        except:
+            for pkg in self.cache:
+                candidate = pkg.candidate
+                try:
+                    section = candidate.section.lower()
+                except:
+                    try:
+                        section = pkg.versions[0].section.lower()
+                    except:
+                        section = ""
+                states[pkg.name] = PackageState(pkg.is_installed, candidate.version if candidate else "")
+                apps.append({"name": pkg.name, "category": section})
+        except Exception as e:
+            self.Logger.warning("Package update_states Error")
+            self.Logger.exception("{}".format(e))
+            states = {}
+            stamp = None
+        self.set_apps(apps)
+        self.states = states
+        self.states_stamp = stamp
+        self.Logger.info("package states updated in {:.3f}s ({} packages)".format(time.time() - start, len(states)))
+        if stamp is not None:
+            self.save_snapshot()
+
+    def load_snapshot(self, stamp):
+        self.snapshot_loaded = False
+        try:
+            with open(self.cachedir + self.snapshotfile, "rb") as snapshot:
+                version, snapshot_stamp, names, sections, installed, candidates = marshal.load(snapshot)
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            self.Logger.warning("Package load_snapshot Error")
+            self.Logger.exception("{}".format(e))
             return False
-        if self.cache.broken_count > 0:
+        if version != self.snapshot_version or snapshot_stamp != stamp:
+            self.Logger.info("package snapshot is outdated")
             return False
+        self.states = {name: PackageState(installed[index], candidates[index]) for index, name in enumerate(names)}
+        self.states_stamp = stamp
+        self.apps = [{"name": name, "category": sections[index]} for index, name in enumerate(names)]
+        # names are saved sorted, so the search index is ready as is
+        self.app_names = names
+        self.app_sections = sections
+        self.snapshot_loaded = True
         return True
 
+    def save_snapshot(self):
+        names = self.app_names
+        snapshot = (self.snapshot_version, self.states_stamp, names, self.app_sections,
+                    [self.states[name].installed for name in names], [self.states[name].candidate for name in names])
+        try:
+            Path(self.cachedir).mkdir(parents=True, exist_ok=True)
+            tmpfile = "{}{}.{}".format(self.cachedir, self.snapshotfile, os.getpid())
+            with open(tmpfile, "wb") as f:
+                marshal.dump(snapshot, f)
+            os.replace(tmpfile, self.cachedir + self.snapshotfile)
+        except Exception as e:
+            self.Logger.warning("Package save_snapshot Error")
+            self.Logger.exception("{}".format(e))
+
+    def set_apps(self, apps):
+        self.apps = apps
+        # sorted name index for repo search, prefix matches are found with bisect
+        apps = sorted(apps, key=lambda x: x["name"])
+        self.app_names = [app["name"] for app in apps]
+        self.app_sections = [app["category"] for app in apps]
+
     def getApps(self):
-        for mypkg in self.cache:
-            name = mypkg.name
-            try:
-                section = mypkg.candidate.section.lower()
-            except:
-                section = mypkg.versions[0].section.lower()
-            self.apps.append({"name": name, "category": section})
+        # the apps table is filled together with the package states, from the snapshot when it is current
+        with self.cache_lock:
+            self.update_states()
+
+    def search_apps(self, text, apps=None):
+        """
+        Yields (name, section) of repo packages containing the text, ranked as
+        exact and prefix matches first, then the other substring matches by match position.
+        apps is an (app_names, app_sections) pair taken before, the current tables are used without it.
+        """
+        names, sections = apps if apps is not None else (self.app_names, self.app_sections)
+        index = bisect.bisect_left(names, text)
+        while index < len(names) and names[index].startswith(text):
+            yield names[index], sections[index]
+            index += 1
+
+        if not text:
+            return
+
+        matches = []
+        for index, name in enumerate(names):
+            position = name.find(text)
+            if position > 0:
+                matches.append((position, index))
+        matches.sort()
+        for position, index in matches:
+            yield names[index], sections[index]
 
     def control_dpkg_interrupt(self):
         return self.cache.dpkg_journal_dirty
@@ -57,6 +201,9 @@ class Package(object):
         return True
 
     def isinstalled(self, packagename):
+        state = self.states.get(packagename)
+        if state is not None:
+            return state.installed
         try:
             package = self.cache[packagename]
         except:
@@ -122,6 +269,14 @@ class Package(object):
 
     def summary(self, packagename):
         # Return the short description (one line summary)
+        state = self.states.get(packagename)
+        if state is not None:
+            if state.summary is None:
+                state.summary = self.cache_summary(packagename)
+            return state.summary
+        return self.cache_summary(packagename)
+
+    def cache_summary(self, packagename):
         package = self.cache.get(packagename)
         if package is None: return ""
         try:
@@ -131,6 +286,9 @@ class Package(object):
         return sum.summary if hasattr(sum, "summary") else "Summary is not found"
 
     def candidate_version(self, packagename):
+        state = self.states.get(packagename)
+        if state is not None and state.candidate:
+            return state.candidate
         package = self.cache[packagename]
         try:
             version = package.candidate.version
@@ -473,48 +631,43 @@ class Package(object):
                 component = None
         return component
 
-    def residual(self):
-        residual = []
+    def scan_cache(self):
+        # residual, autoremovable and upgradable sets are filled in one pass over the cache
+        # and reused until the cache is reopened or dpkg status changes
+        stamp = self.get_states_stamp()
+        if self.scanned is not None and self.scanned_cache is self.cache and self.scanned_stamp == stamp:
+            return self.scanned
+        scanned = {"residual": [], "autoremovable": [], "upgradable": []}
         try:
             for pkg in self.cache:
-                if self.cache[pkg.name].has_config_files and not self.cache[pkg.name].is_installed:
-                    residual.append(pkg.name)
+                if pkg.is_installed:
+                    if pkg.is_upgradable:
+                        scanned["upgradable"].append(pkg.name)
+                elif pkg.has_config_files:
+                    scanned["residual"].append(pkg.name)
+                if pkg.is_auto_removable:
+                    scanned["autoremovable"].append(pkg.name)
+            scanned["upgradable"] = sorted(scanned["upgradable"])
         except Exception as e:
-            self.Logger.warning("Package residual Error")
+            self.Logger.warning("Package scan_cache Error")
             self.Logger.exception("{}".format(e))
-        return residual
+            return scanned
+        self.scanned = scanned
+        self.scanned_cache = self.cache
+        self.scanned_stamp = stamp
+        return scanned
+
+    def residual(self):
+        return list(self.scan_cache()["residual"])
 
     def autoremovable(self):
-        autoremovable = []
-        try:
-            for pkg in self.cache:
-                if self.cache[pkg.name].is_auto_removable:
-                    autoremovable.append(pkg.name)
-        except Exception as e:
-            self.Logger.warning("Package autoremovable Error")
-        return autoremovable
+        return list(self.scan_cache()["autoremovable"])
 
     def upgradable(self):
-        upgradable = []
-        try:
-            for pkg in self.cache:
-                if self.cache[pkg.name].is_upgradable:
-                    upgradable.append(pkg.name)
-            upgradable = sorted(upgradable)
-        except Exception as e:
-            self.Logger.warning("Package upgradable Error")
-        return upgradable
+        return list(self.scan_cache()["upgradable"])
 
     def upgradable_full(self):
-        upgradable = []
-        try:
-            for pkg in self.cache:
-                if self.cache[pkg.name].is_upgradable:
-                    upgradable.append({"name": pkg.name, "summary": self.summary(pkg.name)})
-            upgradable = sorted(upgradable, key=lambda x: x["name"])
-        except Exception as e:
-            self.Logger.warning("Package upgradable Error")
-        return upgradable
+        return [{"name": name, "summary": self.summary(name)} for name in self.scan_cache()["upgradable"]]
 
     def versionCompare(self, version1, version2):
         if version2 == "None" or version2 == "" or version2 is None:
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 10:12:41 2026
+
+@author: fatih
+"""
+
+import sys
+import threading
+import time
+
+# Turkish letters are folded to their ascii counterparts so that "ı", "i", "I" and "İ" all match each other
+# and users can search for "ogrenci" as well as "öğrenci".
+_FOLD_TABLE = str.maketrans({"İ": "i", "I": "i", "ı": "i", "Ş": "s", "ş": "s", "Ğ": "g", "ğ": "g",
+                             "Ç": "c", "ç": "c", "Ö": "o", "ö": "o", "Ü": "u", "ü": "u"})
+
+# fields are joined with this separator so that a query can not match across two fields
+_SEP = "\x00"
+
+_GRAM = 3
+
+
+def normalize(text):
+    if not text:
+        return ""
+    return "{}".format(text).translate(_FOLD_TABLE).casefold()
+
+
+class SearchIndex(object):
+    def __init__(self):
+        self.apps = {}
+        self.haystacks = {}
+        self.grams = None
+        self.categories = {}
+        self.subcategories = {}
+        self.externals = {}
+        self.all = frozenset()
+
+        self.last_query = None
+        self.last_result = self.all
+
+    def build(self, applist, wait=False):
+        """
+        Builds the search tables from the server app list. Called once when the app list is received,
+        after that every lookup is a dict or set operation.
+        The trigram table is filled in a background thread, until it is ready searches scan the
+        normalized texts directly which is still a single pass for the whole refilter.
+        """
+        start = time.time()
+
+        apps = {}
+        haystacks = {}
+        categories = {}
+        subcategories = {}
+        externals = {}
+
+        for app in applist:
+            name = app["name"]
+            apps[name] = app
+
+            fields = [name]
+            for key in ("prettyname", "description"):
+                if isinstance(app.get(key), dict):
+                    fields.extend(value for value in app[key].values() if value)
+            haystack = _SEP.join(normalize(field) for field in fields)
+            haystacks[name] = haystack
+
+            for cat in app.get("category") or []:
+                for value in cat.values():
+                    categories.setdefault(value, set()).add(name)
+
+            for subcat in app.get("subcategory") or []:
+                for value in subcat.values():
+                    subcategories.setdefault(value.lower(), set()).add(name)
+
+            if app.get("external"):
+                externals.setdefault(app["external"]["reponame"], set()).add(name)
+
+        self.apps = apps
+        self.haystacks = haystacks
+        self.grams = None
+        self.categories = {cat: frozenset(names) for cat, names in categories.items()}
+        self.subcategories = {subcat: frozenset(names) for subcat, names in subcategories.items()}
+        self.externals = {repo: frozenset(names) for repo, names in externals.items()}
+        self.all = frozenset(apps)
+
+        self.last_query = None
+        self.last_result = self.all
+
+        gramsthread = threading.Thread(target=self.build_grams, args=(haystacks,), daemon=True)
+        gramsthread.start()
+        if wait:
+            gramsthread.join()
+
+        return time.time() - start
+
+    def build_grams(self, haystacks):
+        grams = {}
+        for name, haystack in haystacks.items():
+            for gram in {haystack[i:i + _GRAM] for i in range(len(haystack) - _GRAM + 1)}:
+                if _SEP not in gram:
+                    grams.setdefault(gram, set()).add(name)
+        # a newer build may have replaced the tables while this one was running
+        if haystacks is self.haystacks:
+            self.grams = {gram: frozenset(names) for gram, names in grams.items()}
+
+    def get(self, name):
+        return self.apps.get(name)
+
+    def search(self, text):
+        """
+        Returns the names of apps whose name, prettyname or description contains the text in any locale.
+        The result of the last query is kept, so the filter function can call this for every row.
+        """
+        if text == self.last_query:
+            return self.last_result
+
+        query = normalize(text)
+        grams = self.grams
+        if not query:
+            result = self.all
+        elif len(query) < _GRAM or grams is None:
+            result = frozenset(name for name, haystack in self.haystacks.items() if query in haystack)
+        else:
+            candidates = None
+            for gram in sorted({query[i:i + _GRAM] for i in range(len(query) - _GRAM + 1)},
+                               key=lambda g: len(grams.get(g, ()))):
+                names = grams.get(gram)
+                if not names:
+                    candidates = frozenset()
+                    break
+                candidates = names if candidates is None else candidates & names
+                if not candidates:
+                    break
+            result = frozenset(name for name in candidates if query in self.haystacks[name])
+
+        self.last_query = text
+        self.last_result = result
+        return result
+
+    def in_category(self, name, category):
+        return name in self.categories.get(category, ())
+
+    def in_subcategory(self, name, subcategory):
+        return name in self.subcategories.get(subcategory.lower(), ())
+
+    def in_external(self, name, reponame):
+        return name in self.externals.get(reponame, ())
+
+
+def benchmark(count=5000):
+    import random
+    import string
+
+    random.seed(0)
+
+    def word():
+        return "".join(random.choice(string.ascii_lowercase + "çğıöşü") for _ in range(random.randint(3, 10)))
+
+    def sentence(words):
+        return " ".join(word() for _ in range(words))
+
+    applist = []
+    for i in range(count):
+        applist.append({"name": "{}-{}".format(word(), i),
+                        "prettyname": {"en": sentence(2).title(), "tr": sentence(2).title()},
+                        "description": {"en": sentence(60), "tr": sentence(60)},
+                        "category": [{"en": "education", "tr": "eğitim"}],
+                        "subcategory": [{"en": "science", "tr": "bilim"}],
+                        "external": None})
+
+    index = SearchIndex()
+    print("build {} apps: {:.3f}s".format(count, index.build(applist)))
+
+    names = [app["name"] for app in applist]
+    for query in ("lib", "office"):
+        start = time.time()
+        index.last_query = None
+        shown = sum(1 for name in names if name in index.search(query))
+        print("refilter {!r} without trigrams: {} shown in {:.4f}s".format(query, shown, time.time() - start))
+
+    start = time.time()
+    index.build(applist, wait=True)
+    print("build {} apps with trigrams: {:.3f}s".format(count, time.time() - start))
+
+    for query in ("a", "li", "lib", "office", "eğit", applist[count // 2]["prettyname"]["tr"][:8]):
+        start = time.time()
+        # a refilter calls the filter function once for every row in the store
+        index.last_query = None
+        shown = sum(1 for name in names if name in index.search(query))
+        print("refilter {!r}: {} shown in {:.4f}s".format(query, shown, time.time() - start))
+
+
+if __name__ == "__main__":
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
@@ -24,6 +24,9 @@ class Package(object):
         self.secs = []
         self.sections = []
         self.update_cache_error_msg = ""
+        self.scanned = None
+        self.scanned_cache = None
+        self.scanned_stamp = None
 
     def updatecache(self):
         try:
@@ -553,48 +556,51 @@ class Package(object):
                 component = None
         return component
 
-    def residual(self):
-        residual = []
+    def get_status_stamp(self):
+        try:
+            return os.stat("/var/lib/dpkg/status").st_mtime_ns
+        except OSError:
+            return None
+
+    def scan_cache(self):
+        # residual, autoremovable and upgradable sets are filled in one pass over the cache
+        # and reused until the cache is reopened or dpkg status changes
+        stamp = self.get_status_stamp()
+        if self.scanned is not None and self.scanned_cache is self.cache and self.scanned_stamp == stamp:
+            return self.scanned
+        scanned = {"residual": [], "autoremovable": [], "upgradable": []}
         try:
+            # required_changes_* mark this cache and is_auto_removable follows the marks,
+            # scan the unmarked state so the saved sets don't depend on the last preview
+            self.cache.clear()
             for pkg in self.cache:
-                if self.cache[pkg.name].has_config_files and not self.cache[pkg.name].is_installed:
-                    residual.append(pkg.name)
+                if pkg.is_installed:
+                    if pkg.is_upgradable:
+                        scanned["upgradable"].append(pkg.name)
+                elif pkg.has_config_files:
+                    scanned["residual"].append(pkg.name)
+                if pkg.is_auto_removable:
+                    scanned["autoremovable"].append(pkg.name)
+            scanned["upgradable"] = sorted(scanned["upgradable"])
         except Exception as e:
-            print("Package residual Error: {}".format(e))
+            print("Package scan_cache Error: {}".format(e))
+            return scanned
+        self.scanned = scanned
+        self.scanned_cache = self.cache
+        self.scanned_stamp = stamp
+        return scanned
 
-        return residual
+    def residual(self):
+        return list(self.scan_cache()["residual"])
 
     def autoremovable(self):
-        autoremovable = []
-        try:
-            for pkg in self.cache:
-                if self.cache[pkg.name].is_auto_removable:
-                    autoremovable.append(pkg.name)
-        except Exception as e:
-            print("Package autoremovable Error: {}".format(e))
-        return autoremovable
+        return list(self.scan_cache()["autoremovable"])
 
     def upgradable(self):
-        upgradable = []
-        try:
-            for pkg in self.cache:
-                if self.cache[pkg.name].is_upgradable:
-                    upgradable.append(pkg.name)
-            upgradable = sorted(upgradable)
-        except Exception as e:
-            print("Package upgradable Error: {}".format(e))
-        return upgradable
+        return list(self.scan_cache()["upgradable"])
 
     def upgradable_full(self):
-        upgradable = []
-        try:
-            for pkg in self.cache:
-                if self.cache[pkg.name].is_upgradable:
-                    upgradable.append({"name": pkg.name, "summary": self.summary(pkg.name)})
-            upgradable = sorted(upgradable, key=lambda x: x["name"])
-        except Exception as e:
-            print("Package upgradable Error: {}".format(e))
-        return upgradable
+        return [{"name": name, "summary": self.summary(name)} for name in self.scan_cache()["upgradable"]]
 
     def get_sources(self):
         repos = {}